@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from db import DB_PATH
+
+
+# Snapshot of listening activity for !insights, rebuilt in the background so the
+# command never queries the live tables
+SNAPSHOT_PATH = os.getenv('ANALYTICS_SNAPSHOT', 'analytics_snapshot.npz')
+EXPORT_BATCH = 50000
+
+SOURCE_HISTORY = 0
+SOURCE_SHARE = 1
+
+_snapshot = {'mtime': None, 'data': None}
+
+
+class Dictionary:
+    """Maps repeated strings to small integer codes for a dictionary-encoded column"""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, value):
+        value = value or ""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+    def values(self):
+        return np.array(list(self.codes), dtype=str)
+
+
+def export_snapshot(path=SNAPSHOT_PATH):
+    """Write history and shares as dictionary-encoded numpy columns; returns the row count
+
+    Reads through a read-only connection in batches and swaps the file in atomically,
+    so a running !insights keeps reading the previous snapshot.
+    """
+    servers, artists, genres = Dictionary(), Dictionary(), Dictionary()
+    columns = {'server': [], 'user': [], 'artist': [], 'genre': [], 'timestamp': [], 'source': []}
+
+    conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, timeout=30)
+    sources = [
+        (SOURCE_HISTORY, "SELECT server_id, user_id, artist, genre, timestamp FROM user_history "
+                         "WHERE server_id != ''"),
+        # Share timestamps are naive local ISO strings
+        (SOURCE_SHARE, "SELECT server_id, user_id, artist, '', CAST(strftime('%s', timestamp, 'utc') AS INTEGER) "
+                       "FROM shared_music"),
+    ]
+    for source, query in sources:
+        c = conn.execute(query)
+        while True:
+            rows = c.fetchmany(EXPORT_BATCH)
+            if not rows:
+                break
+            for server_id, user_id, artist, genre, timestamp in rows:
+                columns['server'].append(servers.encode(server_id))
+                columns['user'].append(int(user_id))
+                columns['artist'].append(artists.encode(artist))
+                columns['genre'].append(genres.encode(genre))
+                columns['timestamp'].append(timestamp or 0)
+                columns['source'].append(source)
+    conn.close()
+
+    # Every shard process exports, so each writes its own temp file before swapping it in
+    fd, temp_path = tempfile.mkstemp(suffix=".npz", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            np.savez(file,
+                     server=np.array(columns['server'], dtype=np.int32),
+                     user=np.array(columns['user'], dtype=np.int64),
+                     artist=np.array(columns['artist'], dtype=np.int32),
+                     genre=np.array(columns['genre'], dtype=np.int32),
+                     timestamp=np.array(columns['timestamp'], dtype=np.int64),
+                     source=np.array(columns['source'], dtype=np.int8),
+                     servers=servers.values(), artists=artists.values(), genres=genres.values(),
+                     exported_at=np.array(int(time.time())))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return len(columns['server'])
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """The latest exported snapshot as a dict of arrays, or None before the first export"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    if _snapshot['mtime'] != mtime:
+        with np.load(path, allow_pickle=False) as data:
+            _snapshot['data'] = {name: data[name] for name in data.files}
+        _snapshot['mtime'] = mtime
+    return _snapshot['data']
+
+
+def top_counts(codes, names, limit):
+    """(name, count) of the most frequent codes, most frequent first"""
+    counts = np.bincount(codes, minlength=len(names))
+    limit = min(limit, np.count_nonzero(counts))
+    top = np.argpartition(counts, -limit)[-limit:] if limit else np.array([], dtype=int)
+    top = top[np.argsort(counts[top])[::-1]]
+    return [(str(names[code]), int(counts[code])) for code in top]
+
+
+def server_insights(snapshot, server_id, limit=5):
+    """Top artists, genre mix, plays per UTC hour and artist diversity for one server, or None"""
+    matches = np.flatnonzero(snapshot['servers'] == str(server_id))
+    if not len(matches):
+        return None
+    rows = snapshot['server'] == matches[0]
+    if not rows.any():
+        return None
+
+    artist_codes = snapshot['artist'][rows]
+    genre_codes = snapshot['genre'][rows & (snapshot['source'] == SOURCE_HISTORY)]
+    genre_codes = genre_codes[snapshot['genres'][genre_codes] != ""]
+
+    # Simpson's diversity: the chance two random plays are by different artists
+    shares = np.bincount(artist_codes) / len(artist_codes)
+    diversity = 1.0 - float(np.sum(shares ** 2))
+
+    genre_total = len(genre_codes)
+    return {
+        'plays': int(rows.sum()),
+        'listeners': int(len(np.unique(snapshot['user'][rows]))),
+        'top_artists': top_counts(artist_codes, snapshot['artists'], limit),
+        'genre_mix': [(genre, count / genre_total) for genre, count in
+                      top_counts(genre_codes, snapshot['genres'], limit)] if genre_total else [],
+        'hours': np.bincount(snapshot['timestamp'][rows] // 3600 % 24, minlength=24),
+        'diversity': diversity,
+        'exported_at': int(snapshot['exported_at']),
+    }
@@ -0,0 +1,131 @@
+import io
+import os
+import tempfile
+from multiprocessing.shared_memory import SharedMemory
+
+import aiohttp
+
+from metrics import http_tracing
+
+
+MAX_AUDIO_BYTES = 25 * 1024 * 1024
+MAX_MIX_BYTES = 512 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class AudioTooLarge(Exception):
+    pass
+
+
+class AudioBuffer:
+    """Audio bytes held once in shared memory, readable by the recognizer and the analysis workers"""
+
+    def __init__(self, capacity):
+        self.shm = SharedMemory(create=True, size=max(capacity, 1))
+        self.capacity = capacity
+        self.size = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def view(self):
+        return self.shm.buf[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def write(self, chunk):
+        end = self.size + len(chunk)
+        if end > self.capacity:
+            raise AudioTooLarge(f"Audio is larger than {self.capacity} bytes")
+        self.shm.buf[self.size:end] = chunk
+        self.size = end
+
+    def close(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            # A view is still referenced somewhere, the mapping goes away with it
+            pass
+        self.shm.unlink()
+
+
+class MemoryViewReader(io.RawIOBase):
+    """Seekable read-only file object over a memoryview, so decoders don't copy the buffer"""
+
+    def __init__(self, view):
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.view[self.position:self.position + len(b)]
+        b[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.position = max(0, min(offset, len(self.view)))
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.view.release()
+        super().close()
+
+
+async def read_attachment(attachment, max_bytes=MAX_AUDIO_BYTES):
+    """Stream a Discord attachment straight into a shared memory buffer"""
+    if attachment.size > max_bytes:
+        raise AudioTooLarge(f"Audio files are limited to {max_bytes // (1024 * 1024)} MB")
+
+    buffer = AudioBuffer(attachment.size)
+    try:
+        async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
+            async with session.get(attachment.url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                    buffer.write(chunk)
+    except Exception:
+        buffer.close()
+        raise
+
+    return buffer
+
+
+async def download_attachment(attachment, max_bytes):
+    """Stream a large attachment to a temporary file so it never sits in memory"""
+    if attachment.size > max_bytes:
+        raise AudioTooLarge(f"Audio files are limited to {max_bytes // (1024 * 1024)} MB")
+
+    suffix = os.path.splitext(attachment.filename)[1]
+    file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    try:
+        with file:
+            written = 0
+            async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
+                async with session.get(attachment.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                        written += len(chunk)
+                        if written > max_bytes:
+                            raise AudioTooLarge(f"Audio files are limited to {max_bytes // (1024 * 1024)} MB")
+                        file.write(chunk)
+    except Exception:
+        os.unlink(file.name)
+        raise
+
+    return file.name
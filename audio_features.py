@@ -0,0 +1,125 @@
+import asyncio
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+
+import librosa
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+from audio_buffer import AudioBuffer, MemoryViewReader
+
+
+ANALYSIS_SAMPLE_RATE = 22050
+ANALYSIS_MAX_SECONDS = 30
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', '2'))
+
+# Krumhansl-Kessler key profiles, used to tell major (brighter) from minor (darker) clips
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+# Reference clips per mood bucket: (tempo bpm, spectral centroid hz, rms energy, major-minor score)
+MOOD_PROTOTYPES = [
+    ((128, 2800, 0.20, 0.30), "😄 Happy & Energetic"),
+    ((118, 2500, 0.17, 0.25), "😄 Happy & Energetic"),
+    ((120, 2200, 0.14, 0.15), "🕺 Upbeat & Danceable"),
+    ((124, 2000, 0.15, 0.05), "🕺 Upbeat & Danceable"),
+    ((72, 1200, 0.05, -0.25), "😢 Sad & Mellow"),
+    ((84, 1500, 0.06, -0.15), "😢 Sad & Mellow"),
+    ((150, 3200, 0.25, -0.05), "⚡ High Energy"),
+    ((170, 3500, 0.28, 0.05), "⚡ High Energy"),
+    ((100, 1900, 0.10, 0.25), "😊 Positive"),
+    ((92, 1700, 0.09, 0.20), "😊 Positive"),
+    ((100, 1800, 0.09, 0.00), "😐 Neutral"),
+    ((110, 2000, 0.11, -0.05), "😐 Neutral"),
+]
+
+_executor = None
+
+
+def extract_features(audio_data):
+    """Compute tempo, spectral centroid, RMS energy and chroma from raw audio bytes"""
+    # Decode straight from the caller's buffer, only the first 30s are ever materialized
+    try:
+        with io.BufferedReader(MemoryViewReader(memoryview(audio_data))) as reader:
+            y, sr = librosa.load(reader, sr=ANALYSIS_SAMPLE_RATE, mono=True, duration=ANALYSIS_MAX_SECONDS)
+    except Exception as e:
+        print(f"Error decoding audio for analysis: {e}")
+        return None
+
+    if y.size == 0:
+        return None
+
+    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+    centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
+    rms = librosa.feature.rms(y=y)
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr).mean(axis=1)
+
+    # Correlate the chroma against every rotation of the key profiles
+    major = max(np.corrcoef(chroma, np.roll(MAJOR_PROFILE, i))[0, 1] for i in range(12))
+    minor = max(np.corrcoef(chroma, np.roll(MINOR_PROFILE, i))[0, 1] for i in range(12))
+
+    return {
+        'tempo': float(np.atleast_1d(tempo)[0]),
+        'spectral_centroid': float(centroid.mean()),
+        'rms': float(rms.mean()),
+        'chroma': chroma.round(4).tolist(),
+        'mode_score': float(np.nan_to_num(major - minor)),
+    }
+
+
+@lru_cache(maxsize=1)
+def get_mood_model():
+    """Build the mood classifier from the reference prototypes"""
+    X = np.array([features for features, _ in MOOD_PROTOTYPES], dtype=float)
+    y = [mood for _, mood in MOOD_PROTOTYPES]
+    model = make_pipeline(StandardScaler(), KNeighborsClassifier(n_neighbors=3, weights='distance'))
+    model.fit(X, y)
+    return model
+
+
+def classify_mood(features):
+    """Map locally extracted audio features to one of the mood buckets"""
+    vector = [[features['tempo'], features['spectral_centroid'], features['rms'], features['mode_score']]]
+    return get_mood_model().predict(vector)[0]
+
+
+def extract_shared_features(name, size):
+    """Worker entry point: analyze an AudioBuffer by attaching to its shared memory"""
+    shm = SharedMemory(name=name)
+    try:
+        with shm.buf[:size] as view:
+            return extract_features(view)
+    finally:
+        shm.close()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Forking the running bot could copy a lock held by one of its threads into the worker;
+        # workers come from a fork server that has only loaded the analysis code instead
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['audio_features'])
+        _executor = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS, mp_context=context)
+    return _executor
+
+
+async def analyze_clip(audio):
+    """Extract audio features in the process pool so the event loop isn't blocked
+
+    An AudioBuffer is handed over by shared memory name instead of pickling its bytes.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        if isinstance(audio, AudioBuffer):
+            return await loop.run_in_executor(get_executor(), extract_shared_features, audio.name, audio.size)
+        return await loop.run_in_executor(get_executor(), extract_features, audio)
+    except Exception as e:
+        print(f"Error analyzing audio: {e}")
+        return None
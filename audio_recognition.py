@@ -3,13 +3,50 @@ import base64
 import hashlib
 import hmac
 import time
+import uuid
 
 from settings import MusicRecognitionBot
+from metrics import timed
 
 bot_settings = MusicRecognitionBot()
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class MultipartBody:
+    """multipart/form-data body that streams the sample from its buffer instead of copying it"""
+
+    def __init__(self, fields, file_field, filename, content):
+        self.boundary = uuid.uuid4().hex
+        self.content = memoryview(content)
+        self.head = b''.join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+            for name, value in fields.items()
+        ) + (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+             f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n').encode()
+        self.tail = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return len(self.head) + len(self.content) + len(self.tail)
+
+    def __iter__(self):
+        yield self.head
+        for start in range(0, len(self.content), UPLOAD_CHUNK_SIZE):
+            yield self.content[start:start + UPLOAD_CHUNK_SIZE]
+        yield self.tail
+
+
 # ACRCloud integration for music recognition
+@timed('acrcloud')
 def recognize_audio(audio_data):
-    """Recognize audio using ACRCloud API"""
+    """Recognize audio using ACRCloud API
+
+    audio_data can be bytes or any buffer (memoryview, AudioBuffer.view), it is never copied.
+    """
     timestamp = str(int(time.time()))
     string_to_sign = f"POST\n/v1/identify\n{bot_settings.acrcloud_access_key}\naudio\n1\n{timestamp}"
     signature = base64.b64encode(
@@ -20,7 +57,6 @@ def recognize_audio(audio_data):
         ).digest()
     ).decode('utf-8')
 
-    files = {'sample': audio_data}
     data = {
         'access_key': bot_settings.acrcloud_access_key,
         'sample_bytes': len(audio_data),
@@ -29,7 +65,8 @@ def recognize_audio(audio_data):
         'data_type': 'audio',
         'signature_version': '1'
     }
+    body = MultipartBody(data, 'sample', 'sample', audio_data)
 
-    response = requests.post(f'http://{bot_settings.acrcloud_host}/v1/identify', files=files, data=data)
+    response = requests.post(f'http://{bot_settings.acrcloud_host}/v1/identify', data=body,
+                             headers={'Content-Type': body.content_type})
     return response.json()
-
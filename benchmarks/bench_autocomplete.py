@@ -0,0 +1,74 @@
+"""Latency benchmark for the slash command autocomplete index
+
+Builds a PrefixIndex of synthetic "title - artist" entries and times lookups for
+prefixes of every length, including the empty and one-letter prefixes Discord sends
+as soon as a user focuses an option. Autocomplete must answer within 3 seconds.
+
+    python -m benchmarks.bench_autocomplete --entries 1000000 --lookups 2000
+"""
+import argparse
+import os
+import random
+import resource
+import string
+import sys
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+
+def make_words(rng, count):
+    return [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1000000)
+    parser.add_argument('--vocabulary', type=int, default=50000)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    from suggestions import PrefixIndex
+
+    rng = random.Random(args.seed)
+    words = make_words(rng, args.vocabulary)
+    labels = [" ".join(rng.choices(words, k=rng.randint(1, 3))) + " - " + " ".join(rng.choices(words, k=rng.randint(1, 2)))
+              for _ in range(args.entries)]
+
+    index = PrefixIndex()
+    start = time.perf_counter()
+    for label in labels:
+        index.add(label, weight=rng.randint(1, 100), keep_sorted=False)
+    index.sort()
+    build = time.perf_counter() - start
+    print(f"built {len(index):,} entries / {len(index.keys):,} keys in {build:.1f}s, "
+          f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    print(f"{'prefix':<8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for length in range(0, 7):
+        timings = []
+        for _ in range(args.lookups):
+            prefix = rng.choice(labels)[:length]
+            begin = time.perf_counter()
+            index.search(prefix)
+            timings.append((time.perf_counter() - begin) * 1000)
+        print(f"{length:<8} {percentile(timings, 50):>8.2f} {percentile(timings, 99):>8.2f} {max(timings):>8.2f}")
+
+    timings = []
+    for _ in range(args.lookups):
+        begin = time.perf_counter()
+        index.add(" ".join(rng.choices(words, k=2)) + " - " + rng.choice(words))
+        timings.append((time.perf_counter() - begin) * 1000)
+    print(f"{'insert':<8} {percentile(timings, 50):>8.2f} {percentile(timings, 99):>8.2f} {max(timings):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
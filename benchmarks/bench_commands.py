@@ -0,0 +1,159 @@
+"""Offline benchmark for the bot's command coroutines
+
+Drives identify, search, recommend and stats with a fake Discord context against
+local mock providers, then reports throughput, latency percentiles and event-loop lag.
+Nothing leaves the machine, and the bot database is created in a temporary directory.
+
+    python -m benchmarks.bench_commands --iterations 50 --concurrency 5 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import math
+import os
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = ['identify', 'search', 'recommend', 'stats']
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task that sleeps for a fixed interval"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.task = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def start(self):
+        self.samples = []
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        return self.samples
+
+
+async def run_command(make_call, iterations, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await make_call(i)
+            except Exception as e:
+                errors += 1
+                print(f"  iteration {i} failed: {e!r}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(iterations)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run(args):
+    from benchmarks.fake_discord import FakeAttachment, FakeContext
+    from benchmarks.mock_providers import MockProviders, route_to
+
+    mock = await MockProviders(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                               seed=args.seed).start()
+    route_to(mock)
+
+    import main as bot_main
+    import audio_features
+    import audio_recognition
+    from providers.apple import close_apple_session
+    from providers.yandex import close_yandex_session, probe_yandex
+
+    # The bot probes Yandex in setup_hook, which the harness doesn't run
+    if not await probe_yandex():
+        print("Yandex probe failed, its searches are skipped")
+
+    # requests doesn't go through aiohttp, point ACRCloud at the mock directly
+    audio_recognition.bot_settings.acrcloud_host = f"127.0.0.1:{mock.port}/acrcloud"
+
+    def context(i, **kwargs):
+        return FakeContext(user_id=1 + i % args.users, guild_id=1, api_latency=args.discord_latency, **kwargs)
+
+    def identify(i):
+        attachment = FakeAttachment(f"{mock.base_url}/attachments/clip{i}.wav", f"clip{i}.wav",
+                                    len(mock.attachment))
+        return bot_main.identify_music(context(i, attachments=[attachment]))
+
+    calls = {
+        'identify': identify,
+        'search': lambda i: bot_main.search_music(context(i), query=f'song:"Song {i}" artist:"Artist {i % 50}"'),
+        'recommend': lambda i: bot_main.get_recommendations(context(i)),
+        'stats': lambda i: bot_main.music_stats(context(i)),
+    }
+
+    monitor = LoopLagMonitor()
+    print(f"{'command':<10} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'lag p50':>8} {'lag p99':>8} {'lag max':>8}")
+    for name in args.commands:
+        monitor.start()
+        latencies, errors, wall = await run_command(calls[name], args.iterations, args.concurrency)
+        lag = await monitor.stop()
+        print(f"{name:<10} {len(latencies) / wall:>8.1f} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 95) * 1000:>8.1f} "
+              f"{percentile(latencies, 99) * 1000:>8.1f} {errors:>6} "
+              f"{percentile(lag, 50) * 1000:>8.1f} {percentile(lag, 99) * 1000:>8.1f} "
+              f"{max(lag, default=0) * 1000:>8.1f}")
+
+    print(f"\nmock provider requests: {mock.requests}")
+    if audio_features._executor:
+        audio_features._executor.shutdown()
+    await close_apple_session()
+    await close_yandex_session()
+    await mock.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', nargs='+', choices=COMMANDS, default=COMMANDS)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help="mock provider latency in seconds")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of provider calls that fail")
+    parser.add_argument('--discord-latency', type=float, default=0.0, help="latency of fake Discord API calls")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Credentials only need to exist, every request goes to the mock
+    for name in ['DISCORD_TOKEN', 'ACRCLOUD_ACCESS_KEY', 'ACRCLOUD_ACCESS_SECRET', 'SPOTIFY_CLIENT_ID',
+                 'SPOTIFY_CLIENT_SECRET', 'YOUTUBE_API_KEY', 'YANDEX_MUSIC_TOKEN']:
+        os.environ.setdefault(name, 'bench')
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix='music-bot-bench-'))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""Memory benchmark for the gateway intents modes
+
+Replays a synthetic gateway event stream for many guilds through discord.py's own
+event parsers and compares the "all" and "minimal" GATEWAY_INTENTS modes. As on the
+real gateway, events are only delivered when the bot subscribed to their intent.
+
+    python -m benchmarks.bench_gateway_memory --guilds 1000 --members 200 --events 50000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOINED_AT = '2024-01-01T00:00:00+00:00'
+
+# Gateway event -> intent flag needed to receive it
+EVENT_INTENTS = {
+    'GUILD_CREATE': 'guilds',
+    'GUILD_MEMBER_ADD': 'members',
+    'PRESENCE_UPDATE': 'presences',
+    'TYPING_START': 'guild_typing',
+    'MESSAGE_CREATE': 'guild_messages',
+}
+
+
+def make_user(user_id):
+    return {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0',
+            'global_name': None, 'avatar': None}
+
+
+def make_member(user_id):
+    return {'user': make_user(user_id), 'roles': [], 'joined_at': JOINED_AT, 'deaf': False, 'mute': False,
+            'flags': 0}
+
+
+def make_presence(user_id, status='online'):
+    return {'user': {'id': str(user_id)}, 'status': status, 'activities': [],
+            'client_status': {'desktop': status}}
+
+
+def make_guild(guild_id, members, intents):
+    user_ids = range(guild_id * 100000, guild_id * 100000 + members)
+    return {
+        'id': str(guild_id), 'name': f"guild{guild_id}", 'unavailable': False,
+        'owner_id': str(user_ids[0]), 'member_count': members, 'large': members > 250,
+        'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0,
+                   'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [{'id': str(guild_id * 10 + i), 'type': 0, 'name': f"channel{i}", 'position': i,
+                      'permission_overwrites': []} for i in range(5)],
+        'members': [make_member(user_id) for user_id in user_ids] if intents.members else [],
+        'presences': [make_presence(user_id) for user_id in user_ids] if intents.presences else [],
+        'emojis': [], 'stickers': [], 'features': [], 'voice_states': [], 'threads': [],
+        'stage_instances': [], 'guild_scheduled_events': [], 'afk_timeout': 300,
+        'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0,
+        'mfa_level': 0, 'premium_tier': 0, 'nsfw_level': 0, 'preferred_locale': 'en-US',
+        'system_channel_flags': 0,
+    }
+
+
+def make_event(rng, guilds, members, message_id):
+    guild_id = rng.randrange(1, guilds + 1)
+    user_id = guild_id * 100000 + rng.randrange(members)
+    channel_id = str(guild_id * 10 + rng.randrange(5))
+    kind = rng.choices(['PRESENCE_UPDATE', 'TYPING_START', 'MESSAGE_CREATE', 'GUILD_MEMBER_ADD'],
+                       weights=[60, 20, 15, 5])[0]
+
+    if kind == 'PRESENCE_UPDATE':
+        data = dict(make_presence(user_id, rng.choice(['online', 'idle', 'dnd'])), guild_id=str(guild_id))
+    elif kind == 'TYPING_START':
+        data = {'channel_id': channel_id, 'guild_id': str(guild_id), 'user_id': str(user_id),
+                'timestamp': int(time.time()), 'member': make_member(user_id)}
+    elif kind == 'MESSAGE_CREATE':
+        data = {'id': str(message_id), 'channel_id': channel_id, 'guild_id': str(guild_id),
+                'author': make_user(user_id), 'member': {'roles': [], 'joined_at': JOINED_AT,
+                                                         'deaf': False, 'mute': False, 'flags': 0},
+                'content': "just chatting", 'timestamp': JOINED_AT, 'edited_timestamp': None,
+                'tts': False, 'mention_everyone': False, 'mentions': [], 'mention_roles': [],
+                'attachments': [], 'embeds': [], 'pinned': False, 'type': 0}
+    else:
+        user_id = guild_id * 100000 + members + message_id
+        data = dict(make_member(user_id), guild_id=str(guild_id))
+    return kind, data
+
+
+async def replay(mode, args):
+    os.environ['GATEWAY_INTENTS'] = mode
+    from settings import MusicRecognitionBot
+
+    gc.collect()
+    tracemalloc.start()
+    bot = MusicRecognitionBot()
+    # Entering the client binds it to the running loop, as login would; leaving closes it
+    async with bot:
+        state = bot._connection
+        intents = bot.intents
+        rng = random.Random(args.seed)
+        delivered = 0
+
+        start = time.perf_counter()
+        for guild_id in range(1, args.guilds + 1):
+            state.parsers['GUILD_CREATE'](make_guild(guild_id, args.members, intents))
+
+        for message_id in range(1, args.events + 1):
+            kind, data = make_event(rng, args.guilds, args.members, message_id)
+            if not getattr(intents, EVENT_INTENTS[kind]):
+                continue
+            state.parsers[kind](data)
+            delivered += 1
+            if message_id % 1000 == 0:
+                # Let dispatched handlers (on_message etc.) run like they would on a live loop
+                await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        cached_members = sum(len(guild._members) for guild in bot.guilds)
+        print(f"{mode:<8} {len(bot.guilds):>7} {delivered:>10} {cached_members:>9} "
+              f"{len(bot.cached_messages):>9} {current / 1024 / 1024:>9.1f} {peak / 1024 / 1024:>9.1f} "
+              f"{elapsed:>8.2f}")
+
+
+async def run(args):
+    print(f"{'mode':<8} {'guilds':>7} {'events':>10} {'members':>9} {'messages':>9} "
+          f"{'heap MB':>9} {'peak MB':>9} {'seconds':>8}")
+    for mode in ['all', 'minimal']:
+        await replay(mode, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--members', type=int, default=200, help="members per guild")
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix='music-bot-bench-'))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
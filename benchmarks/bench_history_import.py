@@ -0,0 +1,83 @@
+"""Benchmark for !history import
+
+Writes synthetic history files (a Last.fm style headerless CSV and a JSON array) to a
+temporary directory and imports each into a fresh bot database, reporting rows per
+second and the process's peak RSS, which stays flat as the file grows.
+
+    python -m benchmarks.bench_history_import --rows 100000
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_plays(rng, rows):
+    artists = [f"artist {i}" for i in range(2000)]
+    start = 1500000000
+    for i in range(rows):
+        yield rng.choice(artists), f"album {i % 5000}", f"song {rng.randint(0, 50000)}", start + i * 600
+
+
+def write_lastfm_csv(path, plays):
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        for artist, album, title, played_at in plays:
+            writer.writerow([artist, album, title,
+                             datetime.fromtimestamp(played_at, timezone.utc).strftime("%d %b %Y %H:%M")])
+
+
+def write_json(path, plays):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write("[")
+        for i, (artist, album, title, played_at) in enumerate(plays):
+            file.write(("," if i else "") + json.dumps({'artist': {'#text': artist}, 'album': {'#text': album},
+                                                        'name': title, 'date': {'uts': str(played_at)}}))
+        file.write("]")
+
+
+async def run(args):
+    from db import init_db
+    from history_io import import_history
+
+    init_db()
+    rng = random.Random(args.seed)
+    files = [('csv', 'scrobbles.csv', write_lastfm_csv), ('json', 'scrobbles.json', write_json)]
+
+    print(f"{'format':<8} {'rows':>9} {'size MB':>8} {'seconds':>8} {'rows/s':>9} {'max RSS MB':>11}")
+    for user_id, (name, filename, write) in enumerate(files, 1):
+        write(filename, make_plays(rng, args.rows))
+        size = os.path.getsize(filename) / (1024 * 1024)
+
+        start = time.perf_counter()
+        imported, skipped = await import_history(filename, user_id)
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        assert imported == args.rows and not skipped, (imported, skipped)
+        print(f"{name:<8} {imported:>9,} {size:>8.1f} {elapsed:>8.2f} {imported / elapsed:>9,.0f} {peak:>11.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix='music-bot-bench-'))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
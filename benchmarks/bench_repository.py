@@ -0,0 +1,101 @@
+"""Throughput benchmark for the repository layer
+
+Seeds a temporary bot database with synthetic history, shares and playlists, then
+calls every repository method back to back and reports operations per second. The
+"legacy" rows time the same queries the way the handlers used to run them, opening
+a connection and re-preparing the statement on every call.
+
+    python -m benchmarks.bench_repository --users 1000 --rows 100000 --operations 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def measure(name, operations, call):
+    start = time.perf_counter()
+    for i in range(operations):
+        await call(i)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {operations / elapsed:>10,.0f} ops/s {elapsed / operations * 1e6:>10,.0f} us/op")
+
+
+def legacy_recent(connect, user_id):
+    conn = connect()
+    c = conn.cursor()
+    c.execute("SELECT song_title, artist, genre FROM user_history WHERE user_id = ? "
+              "ORDER BY timestamp DESC LIMIT 20", (user_id,))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+
+def legacy_add(connect, user_id, title, artist):
+    conn = connect()
+    conn.execute("INSERT INTO user_history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                 (user_id, title, artist, int(time.time()), "", "", "", "", ""))
+    conn.commit()
+    conn.close()
+
+
+async def run(args):
+    from db import init_db, connect
+    from repository import Listen, history, playlists, shares
+
+    init_db()
+    rng = random.Random(args.seed)
+    artists = [f"artist {i}" for i in range(args.users // 2 or 1)]
+    users = [str(100000 + i) for i in range(args.users)]
+
+    now = int(time.time())
+    seed_start = time.perf_counter()
+    await history.add_many([Listen(rng.choice(users), f"song {i}", rng.choice(artists),
+                                   genre=rng.choice(["rock", "pop", "jazz", ""]),
+                                   timestamp=now - rng.randint(0, 86400 * 300))
+                            for i in range(args.rows)])
+    print(f"seeded {args.rows:,} history rows with add_many in {time.perf_counter() - seed_start:.1f}s")
+    for i in range(50):
+        await playlists.create(f"1_{i}", f"playlist {i}", users[0], "1")
+        await shares.add(f"1_{i}", users[0], f"song {i}", rng.choice(artists), "1", "1")
+
+    print(f"{'method':<28} {'ops/s':>14} {'per op':>13}")
+    n = args.operations
+    await measure("history.add", n, lambda i: history.add(
+        Listen(rng.choice(users), f"new song {i}", rng.choice(artists))))
+    await measure("history.add_many (x100)", max(1, n // 100), lambda i: history.add_many(
+        [Listen(rng.choice(users), f"bulk song {i} {j}", rng.choice(artists)) for j in range(100)]))
+    await measure("history.recent", n, lambda i: history.recent(rng.choice(users)))
+    await measure("history.stats", n, lambda i: history.stats(rng.choice(users)))
+    await measure("history.track_keys", n, lambda i: history.track_keys(rng.choice(users)))
+    await measure("playlists.for_server", n, lambda i: playlists.for_server("1"))
+    await measure("playlists.add_song", n, lambda i: playlists.add_song(
+        f"1_{i % 50}", users[i % len(users)], {'title': f"song {i}", 'artist': rng.choice(artists)}))
+    await measure("shares.like", n, lambda i: shares.like(f"1_{i % 50}", i))
+
+    await measure("legacy recent", n, lambda i: asyncio.to_thread(legacy_recent, connect, rng.choice(users)))
+    await measure("legacy add", n, lambda i: asyncio.to_thread(
+        legacy_add, connect, rng.choice(users), f"legacy song {i}", rng.choice(artists)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--operations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(tempfile.mkdtemp(prefix='music-bot-bench-'))
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
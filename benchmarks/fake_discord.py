@@ -0,0 +1,84 @@
+"""Just enough of discord.py's Context to drive the command coroutines offline"""
+import asyncio
+import itertools
+
+
+_ids = itertools.count(1000)
+
+
+class FakeMessage:
+    def __init__(self, channel, content=None, embed=None, attachments=()):
+        self.id = next(_ids)
+        self.channel = channel
+        self.content = content
+        self.embed = embed
+        self.embeds = [embed] if embed else []
+        self.attachments = list(attachments)
+        self.reactions = []
+        self.edits = 0
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        await asyncio.sleep(self.channel.api_latency)
+        self.edits += 1
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+            self.embeds = [embed]
+        return self
+
+    async def add_reaction(self, emoji):
+        await asyncio.sleep(self.channel.api_latency)
+        self.reactions.append(emoji)
+
+
+class FakeChannel:
+    def __init__(self, api_latency=0.0):
+        self.id = next(_ids)
+        self.name = "bench"
+        self.api_latency = api_latency
+        self.sent = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        await asyncio.sleep(self.api_latency)
+        message = FakeMessage(self, content, embed)
+        self.sent.append(message)
+        return message
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+        self.mention = f"<@{user_id}>"
+        self.avatar = None
+        self.voice = None
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeAttachment:
+    def __init__(self, url, filename, size):
+        self.url = url
+        self.filename = filename
+        self.size = size
+
+
+class FakeContext:
+    def __init__(self, user_id=1, guild_id=1, attachments=(), api_latency=0.0):
+        self.author = FakeUser(user_id)
+        self.guild = FakeGuild(guild_id)
+        self.channel = FakeChannel(api_latency)
+        self.message = FakeMessage(self.channel, attachments=attachments)
+        self.voice_client = None
+
+    async def send(self, content=None, embed=None, **kwargs):
+        return await self.channel.send(content, embed=embed, **kwargs)
+
+    async def defer(self, **kwargs):
+        pass
@@ -0,0 +1,207 @@
+"""Local aiohttp stand-ins for ACRCloud, Spotify, YouTube, iTunes and Yandex"""
+import asyncio
+import io
+import math
+import random
+import struct
+import wave
+import zlib
+
+import aiohttp
+from aiohttp import web
+from yarl import URL
+
+
+def make_track(i):
+    return {
+        'id': f"track{i:04d}",
+        'name': f"Song {i}",
+        'artists': [{'id': f"artist{i % 50}", 'name': f"Artist {i % 50}"}],
+        'album': {'name': f"Album {i % 20}", 'release_date': f"{2000 + i % 25}-01-01"},
+        'duration_ms': 180000 + i * 1000,
+        'popularity': i % 100,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/track{i:04d}"},
+        'external_ids': {'isrc': f"USXXX{i:07d}"},
+        'preview_url': None,
+    }
+
+
+def make_wav(seconds=5, sample_rate=22050, tone=440.0):
+    """A short sine tone, standing in for a user's uploaded clip"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b''.join(
+            struct.pack('<h', int(math.sin(2 * math.pi * tone * n / sample_rate) * 8000))
+            for n in range(seconds * sample_rate)
+        ))
+    return buffer.getvalue()
+
+
+class MockProviders:
+    """One local server that answers every provider, routed by the original host as a path prefix"""
+
+    def __init__(self, latency=0.05, jitter=0.02, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.tracks = [make_track(i) for i in range(200)]
+        self.attachment = make_wav()
+        self.requests = 0
+        self.runner = None
+        self.port = None
+
+    @web.middleware
+    async def inject(self, request, handler):
+        self.requests += 1
+        if not request.path.startswith('/attachments/'):
+            await asyncio.sleep(max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+            if self.random.random() < self.error_rate:
+                return web.json_response({'error': 'injected'}, status=500)
+        return await handler(request)
+
+    def build_app(self):
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_post('/acrcloud/v1/identify', self.acrcloud_identify)
+        app.router.add_post('/accounts.spotify.com/api/token', self.token)
+        app.router.add_get('/api.spotify.com/v1/search', self.spotify_search)
+        app.router.add_get('/api.spotify.com/v1/artists/{artist_id}/top-tracks', self.spotify_top_tracks)
+        app.router.add_get('/api.spotify.com/v1/artists/{artist_id}/related-artists', self.spotify_related)
+        app.router.add_get('/api.spotify.com/v1/recommendations', self.spotify_recommendations)
+        app.router.add_get('/www.googleapis.com/youtube/v3/search', self.youtube_search)
+        app.router.add_get('/www.googleapis.com/youtube/v3/videos', self.youtube_videos)
+        app.router.add_get('/itunes.apple.com/search', self.itunes_search)
+        app.router.add_get('/itunes.apple.com/lookup', self.itunes_lookup)
+        app.router.add_get('/api.music.yandex.net/account/status', self.yandex_account_status)
+        app.router.add_get('/api.music.yandex.net/search', self.yandex_search)
+        app.router.add_get('/attachments/{name}', self.attachment_file)
+        return app
+
+    async def start(self):
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def pick_track(self, request):
+        query = request.query.get('q', request.query.get('term', request.query.get('text', '')))
+        return self.tracks[zlib.crc32(query.encode()) % len(self.tracks)]
+
+    async def acrcloud_identify(self, request):
+        await request.read()
+        track = self.random.choice(self.tracks)
+        return web.json_response({
+            'status': {'code': 0, 'msg': 'Success'},
+            'metadata': {'music': [{
+                'title': track['name'],
+                'artists': [{'name': track['artists'][0]['name']}],
+                'album': {'name': track['album']['name']},
+                'release_date': track['album']['release_date'],
+                'genres': [{'name': 'Pop'}],
+                'external_ids': track['external_ids'],
+                'external_metadata': {'spotify': {'track': {'id': track['id']}}},
+            }]},
+        })
+
+    async def token(self, request):
+        return web.json_response({'access_token': 'bench-token', 'expires_in': 3600})
+
+    async def spotify_search(self, request):
+        if request.query.get('type') == 'artist':
+            track = self.pick_track(request)
+            return web.json_response({'artists': {'items': [track['artists'][0]]}})
+        limit = int(request.query.get('limit', 10))
+        start = zlib.crc32(request.query.get('q', '').encode()) % (len(self.tracks) - limit)
+        return web.json_response({'tracks': {'items': self.tracks[start:start + limit]}})
+
+    async def spotify_top_tracks(self, request):
+        return web.json_response({'tracks': self.tracks[:10]})
+
+    async def spotify_related(self, request):
+        return web.json_response({'artists': [track['artists'][0] for track in self.tracks[10:20]]})
+
+    async def spotify_recommendations(self, request):
+        limit = int(request.query.get('limit', 20))
+        return web.json_response({'tracks': self.random.sample(self.tracks, min(limit, len(self.tracks)))})
+
+    async def youtube_search(self, request):
+        limit = int(request.query.get('maxResults', 10))
+        return web.json_response({'items': [
+            {'id': {'videoId': f"video{i}"},
+             'snippet': {'title': f"{track['artists'][0]['name']} - {track['name']} (Official Video)",
+                         'channelTitle': track['artists'][0]['name'],
+                         'thumbnails': {'default': {'url': 'https://i.ytimg.com/default.jpg'}}}}
+            for i, track in enumerate(self.tracks[:limit])
+        ]})
+
+    async def youtube_videos(self, request):
+        return web.json_response({'items': [
+            {'id': video_id, 'contentDetails': {'duration': 'PT3M30S'}}
+            for video_id in request.query.get('id', '').split(',') if video_id
+        ]})
+
+    def itunes_result(self, track):
+        return {
+            'wrapperType': 'track', 'kind': 'song',
+            'trackId': int(track['id'][5:]), 'trackName': track['name'],
+            'artistName': track['artists'][0]['name'], 'collectionName': track['album']['name'],
+            'primaryGenreName': 'Pop', 'trackTimeMillis': track['duration_ms'],
+            'releaseDate': track['album']['release_date'] + 'T00:00:00Z',
+            'trackViewUrl': f"https://music.apple.com/us/song/{track['id']}",
+        }
+
+    async def itunes_search(self, request):
+        results = [self.itunes_result(self.pick_track(request))]
+        return web.json_response({'resultCount': len(results), 'results': results})
+
+    async def itunes_lookup(self, request):
+        if 'isrc' in request.query:
+            # Mock ISRCs end in the track number
+            number = request.query['isrc'][5:]
+            ids = [number] if number.isdigit() and int(number) < len(self.tracks) else []
+        else:
+            ids = request.query.get('id', '').split(',')
+        results = [self.itunes_result(self.tracks[int(i) % len(self.tracks)]) for i in ids if i.isdigit()]
+        return web.json_response({'resultCount': len(results), 'results': results})
+
+    async def yandex_account_status(self, request):
+        if request.headers.get('Authorization') != "OAuth bench":
+            return web.json_response({'error': 'invalid token'}, status=401)
+        return web.json_response({'result': {'account': {'uid': 1, 'login': 'bench'}}})
+
+    async def yandex_search(self, request):
+        track = self.pick_track(request)
+        return web.json_response({'result': {'tracks': {'results': [{
+            'id': track['id'], 'title': track['name'], 'durationMs': track['duration_ms'],
+            'artists': [{'name': track['artists'][0]['name']}],
+            'albums': [{'id': 1, 'title': track['album']['name'], 'year': 2020}],
+        }]}}})
+
+    async def attachment_file(self, request):
+        return web.Response(body=self.attachment, content_type='audio/wav')
+
+
+def route_to(mock):
+    """Send every aiohttp request to the mock server, keeping the original host as a path prefix"""
+    original_request = aiohttp.ClientSession._request
+
+    async def _request(self, method, str_or_url, *args, **kwargs):
+        url = URL(str_or_url)
+        if url.host != '127.0.0.1':
+            url = URL(f"{mock.base_url}/{url.host}{url.path}").with_query(url.query)
+        return await original_request(self, method, url, *args, **kwargs)
+
+    aiohttp.ClientSession._request = _request
+    return original_request
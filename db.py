@@ -1,15 +1,46 @@
+import os
 import sqlite3
+import time
 from datetime import datetime
 
+from metrics import timed
+from search_index import create_search_index
+
+# Shard processes on one machine share this file, point DATABASE_PATH at it
+DB_PATH = os.getenv('DATABASE_PATH', 'music_bot.db')
+# Raw history older than this is rolled up into monthly counts
+HISTORY_RETENTION_DAYS = int(os.getenv('HISTORY_RETENTION_DAYS', '365'))
+
+
+def connect():
+    """Open the bot database, waiting on locks held by other shard processes"""
+    return sqlite3.connect(DB_PATH, timeout=30)
+
+
 # Database setup
+@timed('init_db', metric='db_query_duration_seconds')
 def init_db():
-    conn = sqlite3.connect('music_bot.db')
+    conn = connect()
     c = conn.cursor()
 
-    # User music history
+    # WAL lets shard processes read while another one writes
+    c.execute("PRAGMA journal_mode=WAL")
+
+    # User music history, timestamps in epoch seconds
     c.execute('''CREATE TABLE IF NOT EXISTS user_history
-                 (user_id TEXT, song_title TEXT, artist TEXT, timestamp TEXT, 
-                  spotify_url TEXT, youtube_url TEXT, genre TEXT, mood TEXT)''')
+                 (user_id TEXT, song_title TEXT, artist TEXT, timestamp INTEGER,
+                  spotify_url TEXT, youtube_url TEXT, genre TEXT, mood TEXT, server_id TEXT DEFAULT '')''')
+    migrate_history_timestamps(c)
+    # Server the song was identified in, for the !insights snapshot
+    if 'server_id' not in [name for _, name, *_ in c.execute("PRAGMA table_info(user_history)")]:
+        c.execute("ALTER TABLE user_history ADD COLUMN server_id TEXT DEFAULT ''")
+    # Covers the per-user recent-history, stats and recommendation queries
+    c.execute("CREATE INDEX IF NOT EXISTS idx_history_user_time "
+              "ON user_history (user_id, timestamp DESC, artist, genre, song_title)")
+    # Monthly per-user/per-artist play counts for history older than the retention window
+    c.execute('''CREATE TABLE IF NOT EXISTS history_rollups
+                 (user_id TEXT, month TEXT, artist TEXT, genre TEXT, plays INTEGER,
+                  PRIMARY KEY (user_id, month, artist, genre)) WITHOUT ROWID''')
 
     # User music preferences and recommendations
     c.execute('''CREATE TABLE IF NOT EXISTS user_preferences
@@ -21,21 +52,106 @@ def init_db():
                  (share_id TEXT, user_id TEXT, song_title TEXT, artist TEXT,
                   timestamp TEXT, likes INTEGER, server_id TEXT, channel_id TEXT)''')
 
+    # Who liked each share, so every user counts once
+    c.execute('''CREATE TABLE IF NOT EXISTS share_likes
+                 (share_id TEXT, user_id TEXT, PRIMARY KEY (share_id, user_id)) WITHOUT ROWID''')
+
+    # Songs liked from the buttons under a result, kept apart from identification history
+    c.execute('''CREATE TABLE IF NOT EXISTS track_likes
+                 (user_id TEXT, track_key TEXT, title TEXT, artist TEXT, spotify_url TEXT, liked_at INTEGER,
+                  PRIMARY KEY (user_id, track_key)) WITHOUT ROWID''')
+
     # Collaborative playlists
     c.execute('''CREATE TABLE IF NOT EXISTS playlists
                  (playlist_id TEXT, name TEXT, creator_id TEXT, server_id TEXT,
                   contributors TEXT, songs TEXT, created_at TEXT)''')
 
+    # Cross-platform IDs of each known song, keyed by ISRC
+    c.execute('''CREATE TABLE IF NOT EXISTS tracks
+                 (isrc TEXT PRIMARY KEY, title TEXT, artist TEXT, track_key TEXT)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tracks_key ON tracks (track_key)")
+    c.execute('''CREATE TABLE IF NOT EXISTS track_links
+                 (isrc TEXT, platform TEXT, platform_id TEXT, url TEXT,
+                  PRIMARY KEY (isrc, platform)) WITHOUT ROWID''')
+
+    # Full-text index over every song seen in the tables above
+    create_search_index(c)
+
+    # Command results not yet accepted by Discord, delivered again after a restart or reconnect
+    c.execute('''CREATE TABLE IF NOT EXISTS pending_deliveries
+                 (id INTEGER PRIMARY KEY, channel_id INTEGER, message_id INTEGER, payload TEXT, created_at TEXT)''')
+
+    conn.commit()
+    conn.close()
+
+
+def migrate_history_timestamps(c):
+    """Rebuild a user_history table from before epoch timestamps, converting its ISO strings"""
+    columns = {name: column_type for _, name, column_type, *_ in c.execute("PRAGMA table_info(user_history)")}
+    if columns.get('timestamp') != 'TEXT':
+        return
+    c.execute('''CREATE TABLE user_history_epoch
+                 (user_id TEXT, song_title TEXT, artist TEXT, timestamp INTEGER,
+                  spotify_url TEXT, youtube_url TEXT, genre TEXT, mood TEXT)''')
+    # The old strings are naive local times
+    c.execute("INSERT INTO user_history_epoch SELECT user_id, song_title, artist, "
+              "CAST(strftime('%s', timestamp, 'utc') AS INTEGER), spotify_url, youtube_url, genre, mood "
+              "FROM user_history")
+    c.execute("DROP TABLE user_history")
+    c.execute("ALTER TABLE user_history_epoch RENAME TO user_history")
+
+
+@timed('roll_up_history', metric='db_query_duration_seconds')
+def roll_up_history(retention_days=HISTORY_RETENTION_DAYS, now=None):
+    """Fold raw history from whole months older than the retention window into history_rollups
+
+    Returns the number of raw rows removed.
+    """
+    oldest_kept = datetime.fromtimestamp((now or time.time()) - retention_days * 86400)
+    cutoff = int(datetime(oldest_kept.year, oldest_kept.month, 1).timestamp())
+
+    conn = connect()
+    c = conn.cursor()
+    c.execute("INSERT INTO history_rollups "
+              "SELECT user_id, strftime('%Y-%m', timestamp, 'unixepoch', 'localtime'), artist, "
+              "COALESCE(genre, ''), COUNT(*) FROM user_history WHERE timestamp < ? "
+              "GROUP BY 1, 2, 3, 4 ON CONFLICT DO UPDATE SET plays = plays + excluded.plays", (cutoff,))
+    c.execute("DELETE FROM user_history WHERE timestamp < ?", (cutoff,))
+    removed = c.rowcount
     conn.commit()
     conn.close()
+    return removed
 
 
-def save_to_history(user_id, title, artist, spotify_url):
-    """Save identified song to user history"""
-    conn = sqlite3.connect('music_bot.db')
+@timed('add_pending_delivery', metric='db_query_duration_seconds')
+def add_pending_delivery(channel_id, message_id, payload):
+    """Record a message edit before sending it; returns the delivery id"""
+    conn = connect()
     c = conn.cursor()
-    c.execute("INSERT INTO user_history VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-              (str(user_id), title, artist, datetime.now().isoformat(),
-               spotify_url, "", "", ""))
+    # Only the newest content of a message is worth delivering
+    c.execute("DELETE FROM pending_deliveries WHERE message_id = ?", (message_id,))
+    c.execute("INSERT INTO pending_deliveries (channel_id, message_id, payload, created_at) VALUES (?, ?, ?, ?)",
+              (channel_id, message_id, payload, datetime.now().isoformat()))
+    delivery_id = c.lastrowid
     conn.commit()
     conn.close()
+    return delivery_id
+
+
+@timed('remove_pending_delivery', metric='db_query_duration_seconds')
+def remove_pending_delivery(delivery_id):
+    conn = connect()
+    conn.execute("DELETE FROM pending_deliveries WHERE id = ?", (delivery_id,))
+    conn.commit()
+    conn.close()
+
+
+@timed('get_pending_deliveries', metric='db_query_duration_seconds')
+def get_pending_deliveries():
+    """Undelivered message edits, oldest first"""
+    conn = connect()
+    c = conn.cursor()
+    c.execute("SELECT id, channel_id, message_id, payload FROM pending_deliveries ORDER BY id")
+    rows = c.fetchall()
+    conn.close()
+    return rows
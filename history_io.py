@@ -0,0 +1,282 @@
+import asyncio
+import calendar
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime
+
+import aiohttp
+
+from metrics import http_tracing
+from normalize import track_key
+from providers.lastfm import get_lastfm_track_info, lastfm_session
+from repository import HistoryEntry, Listen, history
+from state import get_state
+
+
+IMPORT_MAX_BYTES = 50 * 1024 * 1024
+# Rows per transaction; large enough that commit overhead disappears, small enough to bound memory
+IMPORT_BATCH = 5000
+READ_CHUNK_SIZE = 64 * 1024
+# A single play never comes close; a larger undecodable window means the file is broken
+MAX_JSON_VALUE = 1024 * 1024
+ENRICH_BATCH = 200
+# Last.fm allows around five requests a second per key
+LASTFM_CONCURRENCY = 4
+LASTFM_CACHE_TTL = 7 * 24 * 60 * 60
+
+TITLE_FIELDS = ('title', 'song_title', 'track', 'name', 'song')
+ARTIST_FIELDS = ('artist', 'artist_name')
+TIME_FIELDS = ('timestamp', 'date', 'uts', 'played_at', 'time')
+EXPORT_FIELDS = ['title', 'artist', 'genre', 'mood', 'spotify_url', 'timestamp']
+# Layout of the CSV exports most Last.fm backup tools produce, without a header row
+LASTFM_CSV_FIELDS = ['artist', 'album', 'title', 'date']
+# Last.fm CSV dates look like "31 Jan 2020 12:34" (UTC)
+LASTFM_MONTHS = {month: number for number, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], 1)}
+
+
+class HistoryImportError(ValueError):
+    pass
+
+
+async def download_upload(attachment, max_bytes=IMPORT_MAX_BYTES):
+    """Stream an uploaded file to a temporary file; returns its path"""
+    if attachment.size > max_bytes:
+        raise HistoryImportError(f"History files are limited to {max_bytes // (1024 * 1024)} MB")
+
+    file = tempfile.NamedTemporaryFile(suffix=os.path.splitext(attachment.filename)[1], delete=False)
+    try:
+        with file:
+            async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
+                async with session.get(attachment.url) as response:
+                    response.raise_for_status()
+                    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                        file.write(chunk)
+    except Exception:
+        os.unlink(file.name)
+        raise
+    return file.name
+
+
+def text_value(value):
+    # Last.fm JSON nests names as {"#text": ...} or {"name": ...}, and dates as {"uts": ..., "#text": ...}
+    if isinstance(value, dict):
+        value = value.get('uts') or value.get('#text') or value.get('name')
+    return str(value).strip() if value is not None else ""
+
+
+def first_field(row, names):
+    for name in names:
+        value = text_value(row.get(name))
+        if value:
+            return value
+    return ""
+
+
+def parse_played_at(value):
+    """Epoch seconds from epoch seconds or milliseconds, ISO 8601 or a Last.fm date, else None"""
+    value = text_value(value)
+    if not value:
+        return None
+    if value.isdigit():
+        seconds = int(value)
+        return seconds // 1000 if seconds > 10 ** 11 else seconds
+    try:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        return parse_lastfm_date(value)
+
+
+def parse_lastfm_date(value):
+    # Split by hand, strptime is most of the parse time on large scrobble dumps.
+    # Dates in Last.fm's JSON carry a comma before the time: "06 Feb 2020, 15:44"
+    try:
+        day, month, year, clock = value.replace(',', ' ').split()
+        hour, minute = clock.split(':')
+        return calendar.timegm((int(year), LASTFM_MONTHS[month[:3].title()], int(day), int(hour), int(minute), 0))
+    except (ValueError, KeyError):
+        return None
+
+
+def listen_from_row(row, user_id, server_id):
+    title = first_field(row, TITLE_FIELDS)
+    artist = first_field(row, ARTIST_FIELDS)
+    if not title or not artist:
+        return None
+    return Listen(user_id, title, artist, spotify_url=text_value(row.get('spotify_url')),
+                  genre=text_value(row.get('genre')).lower(), mood=text_value(row.get('mood')),
+                  server_id=server_id, timestamp=parse_played_at(first_field(row, TIME_FIELDS)) or 0)
+
+
+def csv_rows(file):
+    reader = csv.reader(file)
+    first = next(reader, None)
+    if first is None:
+        return
+    header = [cell.strip().lower() for cell in first]
+    if not set(header) & set(TITLE_FIELDS + ARTIST_FIELDS):
+        # Headerless Last.fm export, the first line is already a scrobble
+        header = LASTFM_CSV_FIELDS
+        yield dict(zip(header, first))
+    for cells in reader:
+        yield dict(zip(header, cells))
+
+
+def json_rows(file):
+    """Objects of a JSON array or of JSON Lines, decoded one at a time from a buffered window
+
+    Brackets are skipped like separators, so arrays of pages of scrobbles flatten too.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    while True:
+        # Skip separators between values
+        while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                return
+            buffer, position = file.read(READ_CHUNK_SIZE), 0
+            eof = not buffer
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_CHUNK_SIZE)
+            if not chunk or len(buffer) - position > MAX_JSON_VALUE:
+                raise HistoryImportError("The JSON file is malformed")
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        position = end
+        if isinstance(value, dict):
+            yield value
+
+
+def import_batches(path, user_id, server_id):
+    """Yield (listens, skipped) batches of at most IMPORT_BATCH rows parsed from a CSV or JSON file"""
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        start = file.read(1)
+        while start and start.isspace():
+            start = file.read(1)
+        file.seek(0)
+        rows = json_rows(file) if start in ('[', '{') else csv_rows(file)
+
+        batch, skipped = [], 0
+        for row in rows:
+            listen = listen_from_row(row, user_id, server_id)
+            if listen is None:
+                skipped += 1
+                continue
+            batch.append(listen)
+            if len(batch) >= IMPORT_BATCH:
+                yield batch, skipped
+                batch, skipped = [], 0
+        if batch or skipped:
+            yield batch, skipped
+
+
+async def import_history(path, user_id, server_id="", progress=None):
+    """Insert every play in a CSV or JSON history file; returns (imported, skipped)
+
+    The file is parsed on a worker thread one batch at a time, so memory stays bounded
+    by IMPORT_BATCH whatever the file size, and each batch is one transaction.
+    """
+    batches = import_batches(path, str(user_id), str(server_id or ""))
+    imported = skipped = 0
+    try:
+        while True:
+            batch = await asyncio.to_thread(next, batches, None)
+            if batch is None:
+                break
+            listens, batch_skipped = batch
+            if listens:
+                await history.add_many(listens, index=False)
+            imported += len(listens)
+            skipped += batch_skipped
+            if progress:
+                progress(imported)
+    except UnicodeDecodeError:
+        raise HistoryImportError("History files must be UTF-8 text")
+    finally:
+        batches.close()
+    return imported, skipped
+
+
+async def lookup_track(session, semaphore, entry):
+    """Last.fm details for a song, shared between users through the state cache"""
+    state = get_state()
+    key = f"lastfm:{track_key(entry.title, entry.artist)}"
+    info = await state.get(key)
+    if info is None:
+        async with semaphore:
+            info = await get_lastfm_track_info(entry.title, entry.artist, session)
+        if info is not None:
+            await state.set(key, info, ttl=LASTFM_CACHE_TTL)
+    return info
+
+
+async def enrich_history(user_id, after=("", ""), on_track=None):
+    """Fill in genres and corrected artist names of one batch of a user's imported songs
+
+    Returns the cursor of the next batch, or None when every song is done. Callers queue
+    each batch as its own bulk job, so a large import never holds a worker for long.
+    Without LASTFM_API_KEY the songs are only indexed for search.
+    """
+    entries = await history.unenriched(user_id, after, ENRICH_BATCH)
+    if not entries:
+        return None
+    semaphore = asyncio.Semaphore(LASTFM_CONCURRENCY)
+    async with lastfm_session() as session:
+        infos = await asyncio.gather(*(lookup_track(session, semaphore, entry) for entry in entries))
+    updates = [(entry.artist, HistoryEntry(entry.title, (info or {}).get('artist') or entry.artist,
+                                           (info or {}).get('genre', "")))
+               for entry, info in zip(entries, infos)]
+    await history.enrich(user_id, updates)
+    if on_track:
+        for _, entry in updates:
+            on_track(entry)
+    return entries[-1].title, entries[-1].artist
+
+
+def write_csv(path):
+    def write(rows):
+        count = 0
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(EXPORT_FIELDS)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        return count
+    return write
+
+
+def write_json(path):
+    def write(rows):
+        count = 0
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("[")
+            for row in rows:
+                play = json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False)
+                file.write(("," if count else "") + "\n" + play)
+                count += 1
+            file.write("\n]\n")
+        return count
+    return write
+
+
+async def export_history(user_id, fmt='csv'):
+    """Write a user's raw history to a temporary CSV or JSON file; returns (path, row count)"""
+    file = tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False)
+    file.close()
+    writer = write_json(file.name) if fmt == 'json' else write_csv(file.name)
+    try:
+        count = await history.export(user_id, writer)
+    except Exception:
+        os.unlink(file.name)
+        raise
+    return file.name, count
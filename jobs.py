@@ -0,0 +1,142 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+
+import aiohttp
+import discord
+
+from db import add_pending_delivery, remove_pending_delivery, get_pending_deliveries
+from metrics import registry
+from message_updates import writes, PRIORITY_FINAL
+from views import restore_view
+
+
+# Lower runs first: interactive lookups ahead of audio recognition ahead of bulk jobs
+PRIORITY_INTERACTIVE = 0
+PRIORITY_DEFAULT = 1
+PRIORITY_BULK = 2
+
+DELIVERY_ATTEMPTS = 5
+DELIVERY_BACKOFF = 1.0
+
+registry.describe('job_queue_wait_seconds', "Time command jobs wait for a background worker")
+registry.describe('deliveries_total', "Final command results sent to Discord, by outcome")
+
+
+class JobScheduler:
+    """Runs the slow part of commands on background workers, most urgent first
+
+    Commands acknowledge the user right away and hand the rest of the work here, so
+    nothing waits on the 3 second interaction deadline.
+    """
+
+    def __init__(self, workers=8):
+        self.workers = workers
+        self.queue = None
+        self.tasks = []
+        self.order = itertools.count()
+
+    def start(self):
+        self.queue = asyncio.PriorityQueue()
+        self.tasks = [asyncio.create_task(self.work(), name=f"job-worker-{i}") for i in range(self.workers)]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def submit(self, job, priority=PRIORITY_DEFAULT, name="job"):
+        """Queue a coroutine; without running workers (offline benchmarks) it runs inline"""
+        if self.queue is None:
+            await job
+            return
+        self.queue.put_nowait((priority, next(self.order), time.perf_counter(), name, job))
+
+    async def work(self):
+        task = asyncio.current_task()
+        worker_name = task.get_name()
+        while True:
+            priority, _, queued_at, name, job = await self.queue.get()
+            registry.observe('job_queue_wait_seconds', time.perf_counter() - queued_at, job=name)
+            # The loop monitor names stalls after the running task
+            task.set_name(f"job:{name}")
+            try:
+                await job
+            except Exception as e:
+                print(f"Background job {name} failed: {e}")
+            finally:
+                task.set_name(worker_name)
+                self.queue.task_done()
+
+
+def serialize(fields):
+    payload = {'content': fields.get('content')}
+    if fields.get('embed') is not None:
+        payload['embed'] = fields['embed'].to_dict()
+    if fields.get('view') is not None:
+        payload['view'] = [fields['view'].name, *fields['view'].args]
+    return json.dumps(payload)
+
+
+def deserialize(payload):
+    payload = json.loads(payload)
+    fields = {'content': payload.get('content')}
+    if payload.get('embed'):
+        fields['embed'] = discord.Embed.from_dict(payload['embed'])
+    if payload.get('view'):
+        fields['view'] = restore_view(payload['view'])
+    return fields
+
+
+async def send_delivery(message, fields):
+    """Edit `message`, retrying transient failures; True once there's nothing left to retry
+
+    A placeholder that was deleted, or belongs to an expired interaction, is replaced
+    by a new message in the same channel.
+    """
+    edit = True
+    for attempt in range(DELIVERY_ATTEMPTS):
+        try:
+            if edit:
+                await writes.edit(message, priority=PRIORITY_FINAL, **fields)
+            else:
+                await message.channel.send(**fields)
+            registry.inc('deliveries_total', result='edited' if edit else 'resent')
+            return True
+        except (discord.NotFound, discord.Forbidden) as e:
+            if not edit:
+                print(f"Dropping result for message {message.id}: {e}")
+                registry.inc('deliveries_total', result='dropped')
+                return True
+            edit = False
+        except (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Delivery to message {message.id} failed (attempt {attempt + 1}): {e}")
+            await asyncio.sleep(DELIVERY_BACKOFF * 2 ** attempt)
+    registry.inc('deliveries_total', result='failed')
+    return False
+
+
+async def deliver(message, **fields):
+    """Put a command's final result into its placeholder message
+
+    The result is written to the outbox first and only removed once Discord accepts it,
+    so a crash, restart or gateway reconnect can't lose it.
+    """
+    delivery_id = await asyncio.to_thread(add_pending_delivery, message.channel.id, message.id, serialize(fields))
+    if await send_delivery(message, fields):
+        await asyncio.to_thread(remove_pending_delivery, delivery_id)
+
+
+async def redeliver_pending(bot):
+    """Retry outbox entries for channels this shard can see; runs on ready and resume"""
+    for delivery_id, channel_id, message_id, payload in await asyncio.to_thread(get_pending_deliveries):
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            # Another shard process owns it
+            continue
+        if await send_delivery(channel.get_partial_message(message_id), deserialize(payload)):
+            await asyncio.to_thread(remove_pending_delivery, delivery_id)
+
+
+jobs = JobScheduler(int(os.getenv('JOB_WORKERS', '8')))
@@ -0,0 +1,103 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+
+from metrics import registry
+
+
+HEARTBEAT_INTERVAL = 0.1
+STALL_THRESHOLD = 0.25
+LAG_SAMPLES = 2000
+
+registry.describe('event_loop_lag_seconds', "How late the event loop wakes a sleeping heartbeat task")
+registry.describe('event_loop_stalls_total', "Event loop stalls longer than the threshold, by command")
+
+
+class LoopMonitor:
+    """Measures event loop lag and reports the stack of whatever blocks the loop
+
+    A heartbeat task records when the loop last ran it; a watchdog thread notices
+    when that heartbeat is overdue and captures the loop thread's current frame.
+    """
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL, threshold=STALL_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = collections.deque(maxlen=LAG_SAMPLES)
+        self.stalls = 0
+        self.active_commands = {}
+        self.last_beat = time.monotonic()
+        self.loop = None
+        self.loop_thread_id = None
+        self.task = None
+        self.watchdog = None
+        self.running = False
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.running = True
+        self.last_beat = time.monotonic()
+        self.task = self.loop.create_task(self.heartbeat())
+        self.watchdog = threading.Thread(target=self.watch, name="loop-watchdog", daemon=True)
+        self.watchdog.start()
+
+    def stop(self):
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+    async def heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last_beat = time.monotonic()
+            lag = max(0.0, self.last_beat - start - self.interval)
+            self.lags.append(lag)
+            registry.observe('event_loop_lag_seconds', lag)
+
+    def watch(self):
+        reported_beat = None
+        while self.running:
+            time.sleep(self.interval)
+            beat = self.last_beat
+            stalled_for = time.monotonic() - beat
+            # Report each stall once, while the loop is still stuck in it
+            if stalled_for > self.threshold + self.interval and beat != reported_beat:
+                reported_beat = beat
+                self.report_stall(stalled_for)
+
+    def current_command(self):
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            return "unknown"
+        return self.active_commands.get(task, task.get_name())
+
+    def report_stall(self, stalled_for):
+        self.stalls += 1
+        command = self.current_command()
+        registry.inc('event_loop_stalls_total', command=command)
+
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame else "    <no frame>\n"
+        print(f"⚠️ Event loop blocked for {stalled_for * 1000:.0f}ms in {command}:\n{stack}")
+
+    def command_started(self, ctx):
+        self.active_commands[asyncio.current_task()] = f"!{ctx.command.qualified_name}"
+
+    def command_finished(self, ctx):
+        self.active_commands.pop(asyncio.current_task(), None)
+
+    def lag_percentiles(self):
+        """p50/p95/p99/max of recent loop lag, in milliseconds"""
+        if not self.lags:
+            return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        ordered = sorted(self.lags)
+
+        def pick(pct):
+            return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] * 1000
+
+        return {'p50': pick(50), 'p95': pick(95), 'p99': pick(99), 'max': ordered[-1] * 1000}
@@ -3,10 +3,13 @@ ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
+import asyncio
 import discord
+from discord import app_commands
+from discord.ext import tasks
 import os
-import json
-import sqlite3
+import collections
+import copy
 from datetime import datetime
 import time
 from dotenv import load_dotenv
@@ -14,15 +17,33 @@ from recomendations import generate_smart_recommendations
 
 from settings import MusicRecognitionBot
 from audio_recognition import recognize_audio
+from audio_features import analyze_clip
+from audio_buffer import read_attachment, download_attachment, AudioTooLarge, MAX_MIX_BYTES
+from metrics import span, record_cache, registry
+from state import get_state, is_rate_limited
+from tracklist import (identify_files, identify_mix, build_tracklist_pages, format_file_tracklist,
+                       format_mix_tracklist, TracklistView)
 from utils import get_provider_color, get_provider_emoji, format_duration, get_mood_from_features
-from providers.spotify import search_spotify, get_song_analysis
+from providers.spotify import search_spotify
 from providers.yandex import search_yandex_music
 from providers.youtube import search_youtube_music
 from providers.apple import search_apple_music
-from parser import parse_search_query
-from searches import search_all_platforms
-
-from db import save_to_history
+from parser import parse_search_query, QueryError
+from searches import stream_all_platforms, target_platforms
+
+from db import roll_up_history
+from repository import Listen, history, playlists, shares, track_index
+from normalize import track_key
+from mood_pool import mood_pool, refresh_mood_pool, MOODS
+from voice_listener import voice_listeners
+from message_updates import DebouncedEdit
+from views import TrackActions, ShareActions, build_recommendations_embed
+from jobs import jobs, deliver, redeliver_pending, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from history_io import HistoryImportError, download_upload, enrich_history, export_history, import_history
+from suggestions import suggestions
+from analytics import export_snapshot, load_snapshot, server_insights
+from track_ids import (PLATFORM_NAMES, isrc_of, known_track, links_from_acrcloud, links_from_provider,
+                       remember_track)
 
 
 load_dotenv()
@@ -35,118 +56,399 @@ bot = MusicRecognitionBot()
 @bot.event
 async def on_ready():
     await bot.tree.sync()
+    if not refresh_mood_pool_task.is_running():
+        refresh_mood_pool_task.start()
+    if not roll_up_history_task.is_running():
+        roll_up_history_task.start()
+    if not export_analytics_task.is_running():
+        export_analytics_task.start()
+    if not suggestions.loaded:
+        await asyncio.to_thread(suggestions.load)
+    # Results that couldn't be sent before a restart or disconnect
+    await redeliver_pending(bot)
+
+
+@bot.event
+async def on_resumed():
+    await redeliver_pending(bot)
+
+
+@tasks.loop(hours=24)
+async def roll_up_history_task():
+    """Fold history past the retention window into monthly per-artist counts"""
+    try:
+        removed = await asyncio.to_thread(roll_up_history)
+        if removed:
+            print(f"Rolled up {removed} history rows")
+    except Exception as e:
+        print(f"Error rolling up history: {e}")
+
+
+@tasks.loop(hours=1)
+async def export_analytics_task():
+    """Refresh the columnar snapshot behind !insights"""
+    try:
+        await asyncio.to_thread(export_snapshot)
+    except Exception as e:
+        print(f"Error exporting analytics: {e}")
+
+
+@tasks.loop(minutes=30)
+async def refresh_mood_pool_task():
+    """Keep the !mood candidate pool fresh in the background"""
+    try:
+        await refresh_mood_pool()
+    except Exception as e:
+        print(f"Error refreshing mood pool: {e}")
+
+
+IDENTIFY_RATE_LIMIT = 10
 
 
 @bot.command(name='identify')
 async def identify_music(ctx):
     """Identify music from audio file or voice channel"""
-    if ctx.message.attachments:
+    # Limit is shared by every shard process through the state backend
+    if await is_rate_limited(f"identify:{ctx.author.id}", IDENTIFY_RATE_LIMIT, 60):
+        await ctx.send("⏳ You're identifying songs too fast, try again in a minute!")
+        return
+
+    if len(ctx.message.attachments) > 1:
+        await identify_batch(ctx, ctx.message.attachments)
+
+    elif ctx.message.attachments:
         # Process audio file attachment
         attachment = ctx.message.attachments[0]
         if not attachment.filename.endswith(('.mp3', '.wav', '.m4a', '.flac')):
             await ctx.send("❌ Please upload an audio file (mp3, wav, m4a, flac)")
             return
 
-        audio_data = await attachment.read()
-
-        # Show processing message
+        # Acknowledge right away, the download and recognition run on a background worker
         processing_msg = await ctx.send("🎵 Analyzing audio... This may take a moment!")
+        await jobs.submit(identify_attachment(ctx, attachment, processing_msg), name='identify')
 
-        try:
-            # Recognize the music
-            result = recognize_audio(audio_data)
+    else:
+        await ctx.send("🎤 Please upload an audio file or use `!listen` to identify from voice channel")
 
-            if result['status']['code'] == 0:
-                music = result['metadata']['music'][0]
-                title = music['title']
-                artist = music['artists'][0]['name']
-                album = music.get('album', {}).get('name', 'Unknown Album')
-                release_date = music.get('release_date', 'Unknown')
-                print("Title: ", title, artist)
 
-                # Search across multiple providers
-                music_info, provider_used = await search_multiple_providers(f"{title} {artist}")
-
-                # Create rich embed
-                embed = discord.Embed(
-                    title="🎵 Song Identified!",
-                    description=f"**{title}** by **{artist}**",
-                    color=get_provider_color(provider_used)
-                )
-                embed.add_field(name="Album", value=album, inline=True)
-                embed.add_field(name="Release Date", value=release_date, inline=True)
-                embed.add_field(name="Found on", value=get_provider_emoji(provider_used) + provider_used, inline=True)
+async def identify_attachment(ctx, attachment, processing_msg):
+    """Background half of !identify: download, recognize, look up and deliver the result"""
+    # Stream the attachment into one shared buffer used by every later step
+    try:
+        with span('download', command='identify'):
+            audio = await read_attachment(attachment)
+    except AudioTooLarge as e:
+        await deliver(processing_msg, content=f"❌ {str(e)}")
+        return
 
-                if music_info:
-                    # Add provider-specific information
-                    if provider_used == "Spotify":
-                        embed.add_field(name="Popularity", value=f"{music_info.get('popularity', 0)}/100", inline=True)
-                        embed.add_field(name="Listen",
-                                        value=f"[🎧 Spotify](https://open.spotify.com/track/{music_info['id']})",
-                                        inline=False)
-
-                        # Add audio features for Spotify
-                        features, analysis = await get_song_analysis(music_info['id'])
-                        if features:
-                            mood = get_mood_from_features(features)
-                            embed.add_field(name="Mood", value=mood, inline=True)
-
-                    elif provider_used == "YouTube Music":
-                        embed.add_field(name="Duration", value=format_duration(music_info.get('duration', 0)),
-                                        inline=True)
-                        if 'videoId' in music_info['id']:
-                            embed.add_field(name="Listen",
-                                            value=f"[📺 YouTube](https://youtube.com/watch?v={music_info['id']['videoId']})",
-                                            inline=False)
-
-                    elif provider_used == "Yandex Music":
-                        embed.add_field(name="Duration", value=format_duration(music_info.get('durationMs', 0)),
-                                        inline=True)
-                        if 'id' in music_info:
-                            embed.add_field(name="Listen",
-                                            value=f"[🎵 Yandex Music](https://music.yandex.ru/album/{music_info.get('albums', [{}])[0].get('id', '')}/track/{music_info['id']})",
-                                            inline=False)
-
-                    elif provider_used == "Apple Music":
-                        embed.add_field(name="Genre", value=music_info.get('primaryGenreName', 'Unknown'), inline=True)
-                        if 'trackViewUrl' in music_info:
-                            embed.add_field(name="Listen",
-                                            value=f"[🍎 Apple Music]({music_info['trackViewUrl']})",
-                                            inline=False)
-
-                    elif provider_used == "SoundCloud":
-                        embed.add_field(name="Plays", value=f"{music_info.get('playback_count', 0):,}", inline=True)
-                        if 'permalink_url' in music_info:
-                            embed.add_field(name="Listen",
-                                            value=f"[☁️ SoundCloud]({music_info['permalink_url']})",
-                                            inline=False)
-
-                else:
-                    embed.add_field(name="Status", value="❌ Not found on any music platform", inline=False)
-
-                # Save to user history with provider info
-                save_to_history(ctx.author.id, title, artist,
-                                music_info.get(' c', {}).get('spotify',
-                                                                        '') if provider_used == "Spotify" else "")
-
-                # Add reaction buttons
-                await processing_msg.edit(content="", embed=embed)
-                await processing_msg.add_reaction("❤️")  # Like
-                await processing_msg.add_reaction("💾")  # Save to playlist
-                await processing_msg.add_reaction("🔄")  # Get recommendations
+    # Extract mood features locally while the clip is being recognized
+    analysis_task = asyncio.create_task(analyze_clip(audio))
 
+    try:
+        # Recognize the music off the event loop; the ACRCloud request is blocking
+        result = await asyncio.to_thread(recognize_audio, audio.view)
+
+        if result['status']['code'] == 0:
+            music = result['metadata']['music'][0]
+            title = music['title']
+            artist = music['artists'][0]['name']
+            album = music.get('album', {}).get('name', 'Unknown Album')
+            release_date = music.get('release_date', 'Unknown')
+            genres = music.get('genres') or []
+            genre = genres[0]['name'] if genres else ""
+            print("Title: ", title, artist)
+
+            # A song already in the ISRC index gets every platform link without provider calls
+            isrc = isrc_of(music)
+            await remember_track(isrc, title, artist, links_from_acrcloud(music))
+            known = await known_track(isrc=isrc) if isrc else await known_track(title=title, artist=artist)
+
+            if known:
+                music_info = None
+                provider_used = PLATFORM_NAMES.get(known['platforms'][0], "Not Found")
+            else:
+                # Search across multiple providers
+                with span('provider_search', command='identify'):
+                    music_info, provider_used = await search_multiple_providers(f"{title} {artist}")
+                if music_info:
+                    await remember_track(isrc or isrc_of(music_info), title, artist,
+                                         links_from_provider(provider_used, music_info))
+
+            # Genre from Apple Music when ACRCloud had none
+            if not known and music_info and provider_used == "Apple Music":
+                genre = genre or music_info.get('primaryGenreName', '')
+
+            # The same song renders the same embed, only the mood differs per clip
+            embed = cached_identify_embed(identify_embed_key(isrc or track_key(title, artist), known, provider_used),
+                                          lambda: build_identify_embed(title, artist, album, release_date,
+                                                                       known, music_info, provider_used))
+
+            # Add mood from the locally extracted audio features
+            mood = ""
+            with span('analysis', command='identify'):
+                features = await analysis_task
+            if features:
+                mood = get_mood_from_features(features)
+                embed.add_field(name="Mood", value=mood, inline=True)
+
+            # Save to user history with provider info
+            if known:
+                spotify_url = known.get('spotify_url', "")
+            elif provider_used == "Spotify":
+                spotify_url = music_info.get('external_urls', {}).get('spotify', '')
             else:
-                await processing_msg.edit(content="❌ Sorry, I couldn't identify this song. Try a clearer audio sample!")
+                spotify_url = ""
+            await history.add(Listen(ctx.author.id, title, artist, spotify_url, genre=genre, mood=mood,
+                                     server_id=ctx.guild.id if ctx.guild else ""))
+            suggestions.add_track(ctx.author.id, title, artist, genre)
+            track_id = await track_index.track_id(title, artist)
 
-        except Exception as e:
-            await processing_msg.edit(content=f"❌ Error processing audio: {str(e)}")
+            # Result and buttons go out in a single edit
+            with span('embed_edit', command='identify'):
+                await deliver(processing_msg, content="", embed=embed,
+                              view=TrackActions(track_id) if track_id else None)
+
+        else:
+            analysis_task.cancel()
+            await deliver(processing_msg, content="❌ Sorry, I couldn't identify this song. Try a clearer audio sample!")
+
+    except Exception as e:
+        analysis_task.cancel()
+        await deliver(processing_msg, content=f"❌ Error processing audio: {str(e)}")
+
+    finally:
+        audio.close()
 
+
+# Rendered identify embeds per track, without the per-clip mood field
+IDENTIFY_EMBED_CACHE_SIZE = 1024
+identify_embeds = collections.OrderedDict()
+
+
+def identify_embed_key(song, known, provider_used):
+    """Cache key of an identify embed; a known song's key covers its links, so new platforms show up"""
+    if known:
+        return song, tuple((platform, known[f'{platform}_url']) for platform in known['platforms'])
+    return song, provider_used
+
+
+def cached_identify_embed(key, build):
+    """A fresh copy of the cached embed for `key`, rendered with `build` on a miss"""
+    data = identify_embeds.get(key)
+    record_cache('identify_embed', data is not None)
+    if data is None:
+        data = build().to_dict()
+        identify_embeds[key] = data
+        if len(identify_embeds) > IDENTIFY_EMBED_CACHE_SIZE:
+            identify_embeds.popitem(last=False)
     else:
-        await ctx.send("🎤 Please upload an audio file or use `!listen` to identify from voice channel")
+        identify_embeds.move_to_end(key)
+    return discord.Embed.from_dict(copy.deepcopy(data))
+
+
+def build_identify_embed(title, artist, album, release_date, known, music_info, provider_used):
+    """Result embed for an identified song with its platform links"""
+    embed = discord.Embed(
+        title="🎵 Song Identified!",
+        description=f"**{title}** by **{artist}**",
+        color=get_provider_color(provider_used)
+    )
+    embed.add_field(name="Album", value=album, inline=True)
+    embed.add_field(name="Release Date", value=release_date, inline=True)
+    if known:
+        found_on = ", ".join(get_provider_emoji(PLATFORM_NAMES[platform]) + PLATFORM_NAMES[platform]
+                             for platform in known['platforms'])
+    else:
+        found_on = get_provider_emoji(provider_used) + provider_used
+    embed.add_field(name="Found on", value=found_on, inline=True)
+
+    if known:
+        # Some platforms are only known by id, those get no link
+        links = [f"[{PLATFORM_NAMES[platform]}]({known[f'{platform}_url']})"
+                 for platform in known['platforms'] if known[f'{platform}_url']]
+        if links:
+            embed.add_field(name="Listen", value=" | ".join(links), inline=False)
+
+    elif music_info:
+        # Add provider-specific information
+        if provider_used == "Spotify":
+            embed.add_field(name="Popularity", value=f"{music_info.get('popularity', 0)}/100", inline=True)
+            embed.add_field(name="Listen",
+                            value=f"[🎧 Spotify](https://open.spotify.com/track/{music_info['id']})",
+                            inline=False)
+
+        elif provider_used == "YouTube Music":
+            embed.add_field(name="Duration", value=format_duration(music_info.get('duration', 0)),
+                            inline=True)
+            if 'videoId' in music_info['id']:
+                embed.add_field(name="Listen",
+                                value=f"[📺 YouTube](https://youtube.com/watch?v={music_info['id']['videoId']})",
+                                inline=False)
+
+        elif provider_used == "Yandex Music":
+            embed.add_field(name="Duration", value=format_duration(music_info.get('durationMs', 0)),
+                            inline=True)
+            if 'id' in music_info:
+                embed.add_field(name="Listen",
+                                value=f"[🎵 Yandex Music](https://music.yandex.ru/album/{music_info.get('albums', [{}])[0].get('id', '')}/track/{music_info['id']})",
+                                inline=False)
+
+        elif provider_used == "Apple Music":
+            embed.add_field(name="Genre", value=music_info.get('primaryGenreName', 'Unknown'), inline=True)
+            if 'trackViewUrl' in music_info:
+                embed.add_field(name="Listen",
+                                value=f"[🍎 Apple Music]({music_info['trackViewUrl']})",
+                                inline=False)
+
+        elif provider_used == "SoundCloud":
+            embed.add_field(name="Plays", value=f"{music_info.get('playback_count', 0):,}", inline=True)
+            if 'permalink_url' in music_info:
+                embed.add_field(name="Listen",
+                                value=f"[☁️ SoundCloud]({music_info['permalink_url']})",
+                                inline=False)
+
+    else:
+        embed.add_field(name="Status", value="❌ Not found on any music platform", inline=False)
+
+    return embed
+
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.m4a', '.flac')
+
+
+async def identify_batch(ctx, attachments):
+    """Identify several audio attachments at once and reply with one tracklist"""
+    audio_attachments = [a for a in attachments if a.filename.endswith(AUDIO_EXTENSIONS)]
+    if not audio_attachments:
+        await ctx.send("❌ Please upload audio files (mp3, wav, m4a, flac)")
+        return
+
+    processing_msg = await ctx.send(f"🎵 Identifying {len(audio_attachments)} files...")
+    await jobs.submit(identify_files_job(ctx, audio_attachments, processing_msg), name='identify_batch')
+
+
+async def identify_files_job(ctx, attachments, processing_msg):
+    """Background half of a multi-file !identify: download, recognize and deliver one tracklist"""
+    buffers = []
+    try:
+        for attachment in attachments:
+            buffers.append((attachment.filename, await read_attachment(attachment)))
+
+        results = await identify_files(buffers)
+        pages = build_tracklist_pages(format_file_tracklist(results), "🎵 Identified Files")
+        await deliver(processing_msg, content="", embed=pages[0],
+                      view=TracklistView(pages, ctx.author.id) if len(pages) > 1 else None)
+
+    except AudioTooLarge as e:
+        await deliver(processing_msg, content=f"❌ {str(e)}")
+    except Exception as e:
+        await deliver(processing_msg, content=f"❌ Error processing audio: {str(e)}")
+    finally:
+        for _, audio in buffers:
+            audio.close()
+
+
+@bot.command(name='tracklist')
+async def tracklist_command(ctx):
+    """Build a tracklist for a long DJ mix"""
+    if not ctx.message.attachments or not ctx.message.attachments[0].filename.endswith(('.wav', '.flac', '.mp3')):
+        await ctx.send("🎧 Please attach a mix (mp3, wav, flac) to build a tracklist")
+        return
+
+    attachment = ctx.message.attachments[0]
+    processing_msg = await ctx.send("🎛️ Building tracklist... Long mixes can take a few minutes!")
+    await jobs.submit(tracklist_job(ctx, attachment, processing_msg), name='tracklist')
+
+
+async def tracklist_job(ctx, attachment, processing_msg):
+    """Background half of !tracklist: download the mix, identify it sample by sample and deliver"""
+    path = None
+    try:
+        path = await download_attachment(attachment, MAX_MIX_BYTES)
+        tracklist = await identify_mix(path)
+        pages = build_tracklist_pages(format_mix_tracklist(tracklist), f"🎛️ Tracklist for {attachment.filename}")
+        await deliver(processing_msg, content="", embed=pages[0],
+                      view=TracklistView(pages, ctx.author.id) if len(pages) > 1 else None)
+
+    except AudioTooLarge as e:
+        await deliver(processing_msg, content=f"❌ {str(e)}")
+    except Exception as e:
+        await deliver(processing_msg, content=f"❌ Error processing mix: {str(e)}")
+    finally:
+        if path:
+            os.remove(path)
+
+
+@bot.command(name='listen')
+async def listen_music(ctx, action=None):
+    """Continuously identify music playing in your voice channel"""
+    if action == "stop":
+        if ctx.voice_client:
+            voice_listeners.stop(ctx.voice_client.channel.id)
+            await ctx.voice_client.disconnect()
+        await ctx.send("🔇 Stopped listening.")
+        return
+
+    if not ctx.author.voice or not ctx.author.voice.channel:
+        await ctx.send("🎤 Join a voice channel first, then use `!listen`")
+        return
+
+    try:
+        # Voice receive requires: pip install discord-ext-voice-recv
+        from discord.ext import voice_recv
+    except ImportError:
+        await ctx.send("❌ Voice listening is not available on this bot.")
+        return
+
+    channel = ctx.author.voice.channel
+    last_song = {}
+
+    async def announce(result):
+        if result['status']['code'] != 0:
+            return
+        music = result['metadata']['music'][0]
+        song = (music['title'], music['artists'][0]['name'])
+        if last_song.get('song') == song:
+            return
+        last_song['song'] = song
+
+        embed = discord.Embed(
+            title="🎧 Now Playing",
+            description=f"**{song[0]}** by **{song[1]}**",
+            color=0x1DB954
+        )
+        embed.set_footer(text=f"Heard in {channel.name}")
+        await ctx.send(embed=embed)
+
+    listener = voice_listeners.start(channel.id, announce)
+    if not listener:
+        await ctx.send("❌ I'm listening to too many channels right now, try again later.")
+        return
+
+    try:
+        voice_client = ctx.voice_client or await channel.connect(cls=voice_recv.VoiceRecvClient)
+    except Exception as e:
+        voice_listeners.stop(channel.id)
+        await ctx.send(f"❌ Couldn't join the voice channel: {str(e)}")
+        return
+
+    # Each speaker's audio arrives separately; the listener keeps them apart
+    voice_client.listen(voice_recv.BasicSink(
+        lambda user, data: listener.feed(data.pcm, user.id if user else None)))
+    await ctx.send(f"👂 Listening in **{channel.name}**. Use `!listen stop` to stop.")
+
+
+PROVIDER_CACHE_TTL = 24 * 60 * 60
 
 
 async def search_multiple_providers(query):
     """Search across multiple music providers in order of preference"""
+    state = get_state()
+    cached = await state.get(f"provider_search:{query.lower()}")
+    record_cache('provider_search', cached is not None)
+    if cached:
+        return cached[0], cached[1]
+
     providers = [
         ("Yandex Music", search_yandex_music),
         ("Spotify", search_spotify),
@@ -159,6 +461,7 @@ async def search_multiple_providers(query):
             result = await search_func(query)
             if result:
                 print(f"✅ Found on {provider_name}: {query}")
+                await state.set(f"provider_search:{query.lower()}", [result, provider_name], ttl=PROVIDER_CACHE_TTL)
                 return result, provider_name
         except Exception as e:
             print(f"❌ Failed to search {provider_name}: {e}")
@@ -171,44 +474,33 @@ async def search_multiple_providers(query):
 
 
 # Advanced recommendation system
-@bot.command(name='recommend')
+@bot.hybrid_command(name='recommend')
+@app_commands.describe(mood_or_genre="A mood like chill or party, or one of your genres")
 async def get_recommendations(ctx, *, mood_or_genre=None):
     """Get personalized music recommendations"""
     user_id = str(ctx.author.id)
+    # Recommendations call Spotify and can outlast the 3 second slash command deadline
+    await ctx.defer()
 
     # Get user's music history
-    conn = sqlite3.connect('music_bot.db')
-    c = conn.cursor()
-    c.execute("SELECT song_title, artist, genre FROM user_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT 20",
-              (user_id,))
-    history = c.fetchall()
-    conn.close()
-
-    if not history:
+    recent = await history.recent(user_id)
+
+    if not recent:
         await ctx.send("🎵 I need to learn your music taste first! Use `!identify` on some songs.")
         return
 
     # Generate recommendations based on history and mood
-    recommendations = await generate_smart_recommendations(history, mood_or_genre)
+    recommendations = await generate_smart_recommendations(recent, mood_or_genre)
 
-    embed = discord.Embed(
-        title="🎯 Personalized Recommendations",
-        description=f"Based on your music taste" + (f" and '{mood_or_genre}' mood" if mood_or_genre else ""),
-        color=0xFF6B6B
-    )
+    await ctx.send(embed=build_recommendations_embed(recommendations, mood_or_genre))
 
-    for i, rec in enumerate(recommendations[:5], 1):
-        embed.add_field(
-            name=f"{i}. {rec['title']} - {rec['artist']}",
-            value=f"Match: {rec['match_score']}% | [Listen]({rec['spotify_url']})",
-            inline=False
-        )
 
-    await ctx.send(embed=embed)
+# Collaborative playlist feature
+PLAYLIST_ACTIONS = ['create', 'list']
 
 
-# Collaborative playlist feature
-@bot.command(name='playlist')
+@bot.hybrid_command(name='playlist')
+@app_commands.describe(action="create or list", args="Playlist name")
 async def playlist_commands(ctx, action=None, *, args=None):
     """Manage collaborative playlists"""
     if action == "create":
@@ -217,14 +509,8 @@ async def playlist_commands(ctx, action=None, *, args=None):
             return
 
         playlist_id = f"{ctx.guild.id}_{int(time.time())}"
-        conn = sqlite3.connect('music_bot.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO playlists VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (playlist_id, args, str(ctx.author.id), str(ctx.guild.id),
-                   json.dumps([str(ctx.author.id)]), json.dumps([]),
-                   datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        await playlists.create(playlist_id, args, ctx.author.id, ctx.guild.id)
+        suggestions.add_playlist(ctx.guild.id, args)
 
         embed = discord.Embed(
             title="🎵 Playlist Created!",
@@ -238,22 +524,18 @@ async def playlist_commands(ctx, action=None, *, args=None):
         await ctx.send(embed=embed)
 
     elif action == "list":
-        conn = sqlite3.connect('music_bot.db')
-        c = conn.cursor()
-        c.execute("SELECT playlist_id, name, creator_id FROM playlists WHERE server_id = ?", (str(ctx.guild.id),))
-        playlists = c.fetchall()
-        conn.close()
+        server_playlists = await playlists.for_server(ctx.guild.id)
 
-        if not playlists:
+        if not server_playlists:
             await ctx.send("🎵 No playlists found. Create one with `!playlist create <name>`")
             return
 
         embed = discord.Embed(title="🎵 Server Playlists", color=0x9370DB)
-        for playlist_id, name, creator_id in playlists:
-            user = bot.get_user(int(creator_id))
+        for playlist in server_playlists:
+            # Members aren't cached, a raw mention renders the name without a lookup
             embed.add_field(
-                name=name,
-                value=f"ID: `{playlist_id}`\nCreator: {user.mention if user else 'Unknown'}",
+                name=playlist.name,
+                value=f"ID: `{playlist.playlist_id}`\nCreator: <@{playlist.creator_id}>",
                 inline=True
             )
 
@@ -261,7 +543,8 @@ async def playlist_commands(ctx, action=None, *, args=None):
 
 
 # Music sharing and social features
-@bot.command(name='share')
+@bot.hybrid_command(name='share')
+@app_commands.describe(song_info="Song name - Artist")
 async def share_music(ctx, *, song_info=None):
     """Share music with the community"""
     if not song_info:
@@ -273,13 +556,8 @@ async def share_music(ctx, *, song_info=None):
     try:
         title, artist = song_info.split(' - ', 1)
 
-        conn = sqlite3.connect('music_bot.db')
-        c = conn.cursor()
-        c.execute("INSERT INTO shared_music VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                  (share_id, str(ctx.author.id), title.strip(), artist.strip(),
-                   datetime.now().isoformat(), 0, str(ctx.guild.id), str(ctx.channel.id)))
-        conn.commit()
-        conn.close()
+        await shares.add(share_id, ctx.author.id, title.strip(), artist.strip(), ctx.guild.id, ctx.channel.id)
+        suggestions.add_popular(title.strip(), artist.strip())
 
         embed = discord.Embed(
             title="🎵 Music Shared!",
@@ -287,10 +565,9 @@ async def share_music(ctx, *, song_info=None):
             color=0xFF69B4
         )
         embed.add_field(name="Shared by", value=ctx.author.mention, inline=True)
-        embed.set_footer(text="React with ❤️ to like this share!")
+        embed.set_footer(text="Press ❤️ to like this share!")
 
-        message = await ctx.send(embed=embed)
-        await message.add_reaction("❤️")
+        await ctx.send(embed=embed, view=ShareActions(share_id))
 
     except ValueError:
         await ctx.send("❌ Please use format: `!share <song_name> - <artist>`")
@@ -303,38 +580,22 @@ async def music_stats(ctx, user: discord.Member = None):
     target_user = user or ctx.author
     user_id = str(target_user.id)
 
-    conn = sqlite3.connect('music_bot.db')
-    c = conn.cursor()
-
-    # Get listening stats
-    c.execute("SELECT COUNT(*) FROM user_history WHERE user_id = ?", (user_id,))
-    total_songs = c.fetchone()[0]
-
-    c.execute(
-        "SELECT artist, COUNT(*) as count FROM user_history WHERE user_id = ? GROUP BY artist ORDER BY count DESC LIMIT 5",
-        (user_id,))
-    top_artists = c.fetchall()
-
-    c.execute(
-        "SELECT genre, COUNT(*) as count FROM user_history WHERE user_id = ? GROUP BY genre ORDER BY count DESC LIMIT 3",
-        (user_id,))
-    top_genres = c.fetchall()
-
-    conn.close()
+    # Raw rows plus the monthly rollups of older history
+    stats = await history.stats(user_id)
 
     embed = discord.Embed(
         title=f"🎵 Music Stats for {target_user.display_name}",
         color=0x1E90FF
     )
-    embed.add_field(name="Total Songs Identified", value=total_songs, inline=True)
+    embed.add_field(name="Total Songs Identified", value=stats.total_songs, inline=True)
 
-    if top_artists:
+    if stats.top_artists:
         artists_text = "\n".join(
-            [f"{i + 1}. {artist} ({count} songs)" for i, (artist, count) in enumerate(top_artists)])
+            [f"{i + 1}. {artist} ({count} songs)" for i, (artist, count) in enumerate(stats.top_artists)])
         embed.add_field(name="Top Artists", value=artists_text, inline=False)
 
-    if top_genres:
-        genres_text = "\n".join([f"{genre}: {count}" for genre, count in top_genres])
+    if stats.top_genres:
+        genres_text = "\n".join([f"{genre}: {count}" for genre, count in stats.top_genres])
         embed.add_field(name="Favorite Genres", value=genres_text, inline=True)
 
     embed.set_thumbnail(url=target_user.avatar.url if target_user.avatar else None)
@@ -342,6 +603,134 @@ async def music_stats(ctx, user: discord.Member = None):
     await ctx.send(embed=embed)
 
 
+# Bulk history import and export
+HISTORY_FORMATS = ['csv', 'json']
+
+
+@bot.command(name='history')
+async def history_command(ctx, action=None, fmt='csv'):
+    """Import a CSV/JSON history or Last.fm dump, or export your history"""
+    if action == 'import':
+        if not ctx.message.attachments:
+            await ctx.send("📥 Attach a CSV or JSON file: `!history import` (Last.fm scrobble exports work too)")
+            return
+        processing_msg = await ctx.send("📥 Importing your history...")
+        await jobs.submit(run_history_import(ctx, ctx.message.attachments[0], processing_msg),
+                          priority=PRIORITY_BULK, name='history_import')
+
+    elif action == 'export':
+        if fmt not in HISTORY_FORMATS:
+            await ctx.send("Usage: `!history export [csv|json]`")
+            return
+        path, count = await export_history(ctx.author.id, fmt)
+        try:
+            if not count:
+                await ctx.send("🎵 Your history is empty. Use `!identify` or `!history import` first.")
+                return
+            await ctx.send(f"📤 {count} songs from your history",
+                           file=discord.File(path, filename=f"music_history.{fmt}"))
+        finally:
+            os.unlink(path)
+
+    else:
+        await ctx.send("Usage: `!history import` with a CSV/JSON file attached, or `!history export [csv|json]`")
+
+
+async def run_history_import(ctx, attachment, processing_msg):
+    """Background half of !history import: parse, insert in batches, then enrich lazily"""
+    editor = DebouncedEdit(processing_msg)
+    path = None
+    try:
+        path = await download_upload(attachment)
+        imported, skipped = await import_history(
+            path, ctx.author.id, ctx.guild.id if ctx.guild else "",
+            progress=lambda count: editor.update(content=f"📥 Imported {count:,} songs so far..."))
+    except HistoryImportError as e:
+        await editor.cancel()
+        await deliver(processing_msg, content=f"❌ {e}")
+        return
+    except Exception as e:
+        await editor.cancel()
+        await deliver(processing_msg, content="❌ Couldn't import that file. Please try again.")
+        print(f"History import error: {e}")
+        return
+    finally:
+        if path:
+            os.unlink(path)
+
+    await editor.cancel()
+    summary = f"✅ Imported {imported:,} songs into your history"
+    if skipped:
+        summary += f" ({skipped:,} rows without a title and artist were skipped)"
+    await deliver(processing_msg, content=summary + ". Genres are filled in over the next few minutes.")
+
+    # Genre lookups and search indexing are slow and nobody is waiting on them
+    await jobs.submit(run_history_enrichment(ctx.author.id), priority=PRIORITY_BULK, name='history_enrich')
+
+
+async def run_history_enrichment(user_id, after=("", "")):
+    """Enrich one batch of an import, then queue the next one behind whatever else is waiting"""
+    after = await enrich_history(user_id, after, on_track=lambda entry: suggestions.add_track(
+        user_id, entry.title, entry.artist, entry.genre))
+    if after is not None:
+        await jobs.submit(run_history_enrichment(user_id, after), priority=PRIORITY_BULK, name='history_enrich')
+
+
+# Server listening dashboard, computed from the exported snapshot rather than the live tables
+HOUR_BARS = "▁▂▃▄▅▆▇█"
+
+
+@bot.command(name='insights')
+async def server_insights_command(ctx):
+    """Show what this server listens to"""
+    if not ctx.guild:
+        await ctx.send("❌ Insights are only available in a server.")
+        return
+
+    snapshot = await asyncio.to_thread(load_snapshot)
+    insights = await asyncio.to_thread(server_insights, snapshot, ctx.guild.id) if snapshot else None
+    if not insights:
+        await ctx.send("📊 No listening data for this server yet. Check back after a few `!identify`s.")
+        return
+
+    embed = discord.Embed(
+        title=f"📊 {ctx.guild.name} Listening Insights",
+        description=f"{insights['plays']} songs from {insights['listeners']} listeners",
+        color=0x1E90FF
+    )
+    embed.add_field(name="Top Artists", value="\n".join(
+        f"{i}. {artist} ({count})" for i, (artist, count) in enumerate(insights['top_artists'], 1)), inline=False)
+    if insights['genre_mix']:
+        embed.add_field(name="Genre Mix", value="\n".join(
+            f"{genre}: {share:.0%}" for genre, share in insights['genre_mix']), inline=True)
+
+    hours = insights['hours']
+    bars = "".join(HOUR_BARS[int(count * (len(HOUR_BARS) - 1) / max(hours.max(), 1))] for count in hours)
+    embed.add_field(name="Activity by Hour (UTC)",
+                    value=f"`{bars}`\nPeak: {int(hours.argmax()):02d}:00", inline=True)
+    embed.add_field(name="Artist Diversity", value=f"{insights['diversity']:.0%}", inline=True)
+    embed.set_footer(text="Snapshot updated")
+    embed.timestamp = datetime.fromtimestamp(insights['exported_at'])
+
+    await ctx.send(embed=embed)
+
+
+@bot.command(name='botstats')
+async def bot_stats(ctx):
+    """Show bot health: event loop lag and blocking stalls"""
+    lag = bot.loop_monitor.lag_percentiles()
+
+    embed = discord.Embed(title="🩺 Bot Health", color=0x1E90FF)
+    embed.add_field(name="Loop Lag p50", value=f"{lag['p50']:.1f} ms", inline=True)
+    embed.add_field(name="Loop Lag p95", value=f"{lag['p95']:.1f} ms", inline=True)
+    embed.add_field(name="Loop Lag p99", value=f"{lag['p99']:.1f} ms", inline=True)
+    embed.add_field(name="Worst Lag", value=f"{lag['max']:.1f} ms", inline=True)
+    embed.add_field(name="Blocking Stalls", value=bot.loop_monitor.stalls, inline=True)
+    embed.add_field(name="Gateway Latency", value=f"{bot.latency * 1000:.0f} ms", inline=True)
+
+    await ctx.send(embed=embed)
+
+
 # Mood-based music discovery
 @bot.command(name='mood')
 async def mood_music(ctx, *, mood=None):
@@ -365,20 +754,129 @@ async def mood_music(ctx, *, mood=None):
         await ctx.send("❌ Unknown mood. Try: happy, sad, energetic, chill, romantic, focus, party, workout")
         return
 
-    # Here you would integrate with music APIs to get mood-based recommendations
     embed = discord.Embed(
         title=f"🎭 {mood.title()} Music",
         description=f"Perfect songs for when you're feeling {mood}",
         color=0xFFD700
     )
 
-    # This would be replaced with actual API calls
-    embed.add_field(name="Coming Soon!", value="Mood-based recommendations will be available soon!", inline=False)
+    # Answer from the precomputed pool, skipping songs the user already identified
+    tracks = mood_pool.pick(mood.lower(), await history.track_keys(ctx.author.id))
+    if not tracks:
+        embed.add_field(name="Warming up", value="Mood picks are still being collected, try again in a minute!",
+                        inline=False)
+
+    for i, track in enumerate(tracks, 1):
+        listen = f" | [Listen]({track['spotify_url']})" if track.get('spotify_url') else ""
+        embed.add_field(
+            name=f"{i}. {track['title']} - {track['artist']}",
+            value=f"Match: {track['match_score']}%{listen}",
+            inline=False
+        )
 
     await ctx.send(embed=embed)
 
 
-@bot.command(name='search')
+def build_search_embed(search_params, search_results, pending=()):
+    """Render merged search results; `pending` lists platforms that haven't answered yet"""
+    # Create results embed
+    results_embed = discord.Embed(
+        title="🎵 Search Results" if not pending else "🔍 Search Results (still searching...)",
+        description=f"Found {len(search_results)} matches",
+        color=0x1DB954 if not pending else 0x3498db
+    )
+
+    # Add search query info
+    query_info = []
+    if search_params.song:
+        query_info.append(f"**Song:** {search_params.song}")
+    if search_params.artist:
+        query_info.append(f"**Artist:** {search_params.artist}")
+    if search_params.album:
+        query_info.append(f"**Album:** {search_params.album}")
+    if search_params.year:
+        query_info.append(f"**Year:** {search_params.year}")
+    if search_params.min_duration is not None or search_params.max_duration is not None:
+        shortest = format_duration(search_params.min_duration * 1000) if search_params.min_duration else "0:00"
+        longest = format_duration(search_params.max_duration * 1000) if search_params.max_duration else "any"
+        query_info.append(f"**Duration:** {shortest}-{longest}")
+    if search_params.explicit is not None:
+        query_info.append(f"**Explicit:** {'yes' if search_params.explicit else 'no'}")
+    if search_params.platform:
+        platform_emoji = {
+            'spotify': '🎵',
+            'apple': '🍎',
+            'youtube': '📺',
+            'yandex': '🎶'
+        }
+        emoji = platform_emoji.get(search_params.platform, '🎧')
+        query_info.append(f"**Platform:** {emoji} {search_params.platform.title()}")
+
+    results_embed.add_field(
+        name="Search Query",
+        value="\n".join(query_info),
+        inline=False
+    )
+
+    # Add results
+    for i, result in enumerate(search_results[:search_params.limit], 1):
+        links = []
+        if result.get('spotify_url'):
+            links.append(f"[Spotify]({result['spotify_url']})")
+        if result.get('youtube_url'):
+            links.append(f"[YouTube]({result['youtube_url']})")
+        if result.get('yandex_url'):
+            links.append(f"[Yandex Music]({result['yandex_url']})")
+        if result.get('apple_url'):
+            links.append(f"[Apple Music]({result['apple_url']})")
+        if result.get('deezer_url'):
+            links.append(f"[Deezer]({result['deezer_url']})")
+
+        # Show every platform the song was found on with emoji
+        platform_info = ""
+        if result.get('platforms'):
+            platform_emojis = {
+                'spotify': '🎵',
+                'apple': '🍎',
+                'youtube': '📺',
+                'yandex': '🎶',
+                'local': '📚'
+            }
+            emojis = "".join(platform_emojis.get(platform, '🎧') for platform in result['platforms'])
+            platform_info = f"{emojis} "
+
+        result_info = []
+        if result.get('album'):
+            result_info.append(f"Album: {result['album']}")
+        if result.get('year'):
+            result_info.append(f"Year: {result['year']}")
+        if result.get('duration'):
+            result_info.append(f"Duration: {result['duration']}")
+
+        field_value = ""
+        if result_info:
+            field_value += " • ".join(result_info) + "\n"
+        if links:
+            field_value += " | ".join(links)
+        else:
+            field_value += "No direct links available"
+
+        results_embed.add_field(
+            name=f"{platform_info}{i}. {result['title']} - {result['artist']}",
+            value=field_value,
+            inline=False
+        )
+
+    if pending:
+        waiting = ", ".join(platform.title() for platform in pending)
+        results_embed.set_footer(text=f"⏳ Waiting for {waiting}...")
+    else:
+        results_embed.set_footer(text="🎧 Click the links to listen on your preferred platform")
+    return results_embed
+
+
+@bot.hybrid_command(name='search')
+@app_commands.describe(query='Song name, or filters like song:"..." artist:"..." platform:spotify')
 async def search_music(ctx, *, query):
     """
     Search for music across multiple platforms
@@ -386,14 +884,19 @@ async def search_music(ctx, *, query):
     !search song:"Song Name" artist:"Artist Name" year:2023
     !search song:"Bohemian Rhapsody" artist:"Queen" platform:spotify
     !search song:"Shape of You" platform:"youtube"
+    !search Blinding Lights album:"After Hours" duration:3:00-4:30 explicit:no limit:3
 
-    Supported platforms: spotify, youtube, yandex
+    Supported platforms: spotify, apple, youtube, yandex
     """
 
     # Parse the search query
-    search_params = parse_search_query(query)
+    try:
+        search_params = parse_search_query(query)
+    except QueryError as e:
+        await ctx.send(f"❌ {e}")
+        return
 
-    if not search_params.get('song'):
+    if not search_params.song:
         await ctx.send(
             "❌ Please provide at least a song name. Example: `!search song:\"Bohemian Rhapsody\" artist:\"Queen\"`")
         return
@@ -405,10 +908,31 @@ async def search_music(ctx, *, query):
         color=0x3498db
     )
     message = await ctx.send(embed=loading_embed)
+    await jobs.submit(run_search(ctx, search_params, message), priority=PRIORITY_INTERACTIVE, name='search')
+
+
+async def run_search(ctx, search_params, message):
+    """Search every platform and fill in the placeholder `message`; runs on a job worker"""
+    editor = DebouncedEdit(message)
 
     try:
-        # Search across multiple platforms
-        search_results = await search_all_platforms(search_params)
+        # Render results as each platform answers instead of waiting for the slowest one
+        started = time.perf_counter()
+        first_result = False
+        search_results = []
+        pending = target_platforms(search_params)
+        with span('provider_search', command='search'):
+            async for platform_name, search_results in stream_all_platforms(search_params):
+                if platform_name in pending:
+                    pending.remove(platform_name)
+                if search_results and not first_result:
+                    first_result = True
+                    registry.observe('stage_duration_seconds', time.perf_counter() - started,
+                                     stage='search_first_result', command='search')
+                if search_results and pending:
+                    editor.update(embed=build_search_embed(search_params, search_results, pending))
+        registry.observe('stage_duration_seconds', time.perf_counter() - started,
+                         stage='search_complete', command='search')
 
         if not search_results:
             error_embed = discord.Embed(
@@ -416,86 +940,13 @@ async def search_music(ctx, *, query):
                 description="Couldn't find any matches for your search.",
                 color=0xe74c3c
             )
-            await message.edit(embed=error_embed)
+            await editor.cancel()
+            await deliver(message, embed=error_embed)
             return
 
-        # Create results embed
-        results_embed = discord.Embed(
-            title="🎵 Search Results",
-            description=f"Found {len(search_results)} matches",
-            color=0x1DB954
-        )
-
-        # Add search query info
-        query_info = []
-        if search_params.get('song'):
-            query_info.append(f"**Song:** {search_params['song']}")
-        if search_params.get('artist'):
-            query_info.append(f"**Artist:** {search_params['artist']}")
-        if search_params.get('year'):
-            query_info.append(f"**Year:** {search_params['year']}")
-        if search_params.get('platform'):
-            platform_emoji = {
-                'spotify': '🎵',
-                'youtube': '📺',
-                'yandex': '🎶'
-            }
-            emoji = platform_emoji.get(search_params['platform'], '🎧')
-            query_info.append(f"**Platform:** {emoji} {search_params['platform'].title()}")
-
-        results_embed.add_field(
-            name="Search Query",
-            value="\n".join(query_info),
-            inline=False
-        )
-
-        # Add results
-        for i, result in enumerate(search_results[:5], 1):  # Limit to 5 results
-            links = []
-            if result.get('spotify_url'):
-                links.append(f"[Spotify]({result['spotify_url']})")
-            if result.get('youtube_url'):
-                links.append(f"[YouTube]({result['youtube_url']})")
-            if result.get('yandex_url'):
-                links.append(f"[Yandex Music]({result['yandex_url']})")
-
-            # Show platform source with emoji
-            platform_info = ""
-            if result.get('source_platform'):
-                platform_emojis = {
-                    'spotify': '🎵',
-                    'youtube': '📺',
-                    'yandex': '🎶'
-                }
-                emoji = platform_emojis.get(result['source_platform'], '🎧')
-                platform_info = f"{emoji} "
-
-            result_info = []
-            if result.get('album'):
-                result_info.append(f"Album: {result['album']}")
-            if result.get('year'):
-                result_info.append(f"Year: {result['year']}")
-            if result.get('duration'):
-                result_info.append(f"Duration: {result['duration']}")
-
-            field_value = ""
-            if result_info:
-                field_value += " • ".join(result_info) + "\n"
-            if links:
-                field_value += " | ".join(links)
-            else:
-                field_value += "No direct links available"
-
-            results_embed.add_field(
-                name=f"{platform_info}{i}. {result['title']} - {result['artist']}",
-                value=field_value,
-                inline=False
-            )
-
-        # Add footer
-        results_embed.set_footer(text="🎧 Click the links to listen on your preferred platform")
-
-        await message.edit(embed=results_embed)
+        with span('embed_edit', command='search'):
+            await editor.cancel()
+            await deliver(message, embed=build_search_embed(search_params, search_results))
 
     except Exception as e:
         error_embed = discord.Embed(
@@ -503,26 +954,43 @@ async def search_music(ctx, *, query):
             description="An error occurred while searching. Please try again.",
             color=0xe74c3c
         )
-        await message.edit(embed=error_embed)
+        await editor.cancel()
+        await deliver(message, embed=error_embed)
         print(f"Search error: {e}")
 
-# Event handlers for reactions
-@bot.event
-async def on_reaction_add(reaction, user):
-    if user.bot:
-        return
+# Slash command autocomplete, answered from the in-memory prefix indexes
+@search_music.autocomplete('query')
+async def search_autocomplete(interaction, current):
+    choices = []
+    for label, (title, artist) in suggestions.track_choices(interaction.user.id, current):
+        query = f'song:"{title}" artist:"{artist}"'
+        choices.append(app_commands.Choice(name=label, value=query if len(query) <= 100 else label))
+    return choices
+
+
+@share_music.autocomplete('song_info')
+async def share_autocomplete(interaction, current):
+    return [app_commands.Choice(name=label, value=label)
+            for label, _ in suggestions.track_choices(interaction.user.id, current)]
+
 
-    if str(reaction.emoji) == "❤️":
-        # Handle like reaction on shared music
-        embed = reaction.message.embeds[0] if reaction.message.embeds else None
-        if embed and "Music Shared!" in embed.title:
-            # Update like count in database
-            conn = sqlite3.connect('music_bot.db')
-            c = conn.cursor()
-            c.execute("UPDATE shared_music SET likes = likes + 1 WHERE timestamp = ?",
-                      (datetime.now().date().isoformat(),))
-            conn.commit()
-            conn.close()
+@get_recommendations.autocomplete('mood_or_genre')
+async def recommend_autocomplete(interaction, current):
+    options = [mood for mood in MOODS if mood.startswith(current.lower())]
+    options += [genre for genre in suggestions.genre_choices(interaction.user.id, current) if genre not in options]
+    return [app_commands.Choice(name=option, value=option) for option in options[:25]]
+
+
+@playlist_commands.autocomplete('action')
+async def playlist_action_autocomplete(interaction, current):
+    return [app_commands.Choice(name=action, value=action) for action in PLAYLIST_ACTIONS
+            if action.startswith(current.lower())]
+
+
+@playlist_commands.autocomplete('args')
+async def playlist_name_autocomplete(interaction, current):
+    return [app_commands.Choice(name=name, value=name)
+            for name in suggestions.playlist_choices(interaction.guild_id, current)]
 
 
 @bot.command(name='helpp')
@@ -538,6 +1006,12 @@ async def help_command(ctx, command=None):
                 'usage': '/identify [attach audio file]',
                 'example': 'Upload an audio file and use /identify to get song details'
             },
+            'tracklist': {
+                'title': '🎛️ Mix Tracklist',
+                'description': 'Build a tracklist for a long DJ mix, or identify several files at once with /identify',
+                'usage': '/tracklist [attach mix file]',
+                'example': 'Upload an hour-long mix and use /tracklist to get every song with timestamps'
+            },
             'recommend': {
                 'title': '🎯 Personal Recommendations',
                 'description': 'Get personalized music recommendations based on your listening history',
@@ -562,6 +1036,12 @@ async def help_command(ctx, command=None):
                 'usage': '/stats',
                 'example': '/stats'
             },
+            'history': {
+                'title': '🗂️ History Import & Export',
+                'description': 'Import past identifications or a Last.fm scrobble dump, or download your history',
+                'usage': '!history import [attach CSV/JSON] | !history export [csv|json]',
+                'example': '!history import (with scrobbles.csv attached)\n!history export json'
+            },
             'mood': {
                 'title': '🎭 Mood Music',
                 'description': 'Get music recommendations based on your current mood',
@@ -571,8 +1051,10 @@ async def help_command(ctx, command=None):
             'search': {
                 'title': '🔍 Search Music',
                 'description': 'Search for music by song name, artist, and platform',
-                'usage': '/search [song_name] [artist] [platform]',
-                'example': '/search "Bohemian Rhapsody" "Queen" spotify'
+                'usage': '/search song:"name" artist:"name" album:"name" year:YYYY platform:name '
+                         'duration:MM:SS-MM:SS explicit:yes|no limit:N',
+                'example': '/search song:"Bohemian Rhapsody" artist:"Queen" platform:spotify\n'
+                           '/search Blinding Lights duration:3:00-4:30 explicit:no'
             }
         }
 
@@ -601,6 +1083,7 @@ async def help_command(ctx, command=None):
     embed.add_field(
         name="🎵 Music Discovery",
         value="`/identify` - Identify music from audio file\n"
+              "`/tracklist` - Build a tracklist for a DJ mix\n"
               "`/search` - Search music by name, artist, platform\n"
               "`/mood` - Get music based on your mood",
         inline=False
@@ -610,7 +1093,8 @@ async def help_command(ctx, command=None):
     embed.add_field(
         name="🎯 Personal Features",
         value="`/recommend` - Get personalized recommendations\n"
-              "`/stats` - View your listening analytics",
+              "`/stats` - View your listening analytics\n"
+              "`!history` - Import or export your listening history",
         inline=False
     )
 
@@ -0,0 +1,119 @@
+import asyncio
+import itertools
+import time
+
+
+# Discord rate limits message edits per channel, so progressive updates are spaced out
+EDIT_INTERVAL = 1.0
+# Minimum gap between any two writes to one channel
+CHANNEL_WRITE_INTERVAL = 0.25
+
+# Lower goes first: final results ahead of progress updates
+PRIORITY_FINAL = 0
+PRIORITY_PROGRESS = 1
+
+
+class ChannelWrites:
+    """Pending edits for one channel, at most one per message"""
+
+    def __init__(self):
+        self.pending = {}
+        self.order = itertools.count()
+        self.task = None
+
+
+class WriteScheduler:
+    """Sends message edits one channel at a time, most urgent first
+
+    Edits queued for a message that hasn't been written yet are merged into one call
+    with the newest content, and writes to a channel are spaced out so bursts from
+    concurrent commands don't run into 429 stalls.
+    """
+
+    def __init__(self, interval=CHANNEL_WRITE_INTERVAL):
+        self.interval = interval
+        self.channels = {}
+
+    async def edit(self, message, priority=PRIORITY_FINAL, **fields):
+        """Queue an edit of `message` and wait until Discord has it; raises what the edit raised"""
+        channel = self.channels.setdefault(message.channel.id, ChannelWrites())
+        waiter = asyncio.get_running_loop().create_future()
+        queued = channel.pending.get(message.id)
+        if queued:
+            # Later fields win, the merged edit keeps the earliest slot and the highest priority
+            queued['fields'].update(fields)
+            queued['priority'] = min(queued['priority'], priority)
+            queued['waiters'].append(waiter)
+        else:
+            channel.pending[message.id] = {'priority': priority, 'order': next(channel.order),
+                                           'message': message, 'fields': dict(fields), 'waiters': [waiter]}
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.create_task(self.drain(message.channel.id, channel))
+        return await waiter
+
+    async def drain(self, channel_id, channel):
+        while channel.pending:
+            message_id = min(channel.pending, key=lambda key: (channel.pending[key]['priority'],
+                                                               channel.pending[key]['order']))
+            queued = channel.pending.pop(message_id)
+            try:
+                result = await queued['message'].edit(**queued['fields'])
+            except Exception as e:
+                for waiter in queued['waiters']:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in queued['waiters']:
+                    if not waiter.done():
+                        waiter.set_result(result)
+            await asyncio.sleep(self.interval)
+        if self.channels.get(channel_id) is channel:
+            del self.channels[channel_id]
+
+
+class DebouncedEdit:
+    """Edits a message at most once per interval, always with the newest content
+
+    Updates that arrive while an edit is waiting replace each other, so a burst of
+    updates costs one API call.
+    """
+
+    def __init__(self, message, interval=EDIT_INTERVAL):
+        self.message = message
+        self.interval = interval
+        self.pending = None
+        self.last_edit = 0.0
+        self.flush_task = None
+
+    def update(self, **fields):
+        self.pending = fields
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(max(0.0, self.last_edit + self.interval - time.monotonic()))
+        try:
+            await self.send()
+        except Exception as e:
+            # Progress is best effort, the final result goes out through deliver()
+            print(f"Error updating message {self.message.id}: {e}")
+
+    async def send(self):
+        fields, self.pending = self.pending, None
+        if fields is None:
+            return
+        self.last_edit = time.monotonic()
+        await writes.edit(self.message, priority=PRIORITY_PROGRESS, **fields)
+
+    async def cancel(self):
+        """Drop any update still waiting"""
+        self.pending = None
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+
+
+writes = WriteScheduler()
@@ -0,0 +1,173 @@
+import bisect
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+
+import aiohttp
+from aiohttp import web
+
+
+# Latency buckets in seconds, from fast cache lookups up to slow recognitions
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """In-process counters and histograms, keyed by metric name and label set"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def render(self):
+        """Render everything in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                typed.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+
+
+registry = Registry()
+registry.describe('stage_duration_seconds', "Time spent in each stage of a command")
+registry.describe('provider_duration_seconds', "Latency of music provider searches")
+registry.describe('http_request_duration_seconds', "Latency of outgoing HTTP requests")
+registry.describe('db_query_duration_seconds', "Time spent in SQLite queries")
+registry.describe('cache_requests_total', "Cache lookups by cache and result")
+registry.describe('errors_total', "Failures by stage")
+
+
+@contextmanager
+def span(stage, metric='stage_duration_seconds', **labels):
+    """Time a block of code; works inside coroutines as a plain `with`"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc('errors_total', stage=stage)
+        raise
+    finally:
+        registry.observe(metric, time.perf_counter() - start, stage=stage, **labels)
+
+
+def timed(stage, metric='stage_duration_seconds', **labels):
+    """Decorator version of span for sync and async functions"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage, metric, **labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage, metric, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache, hit):
+    registry.inc('cache_requests_total', cache=cache, result='hit' if hit else 'miss')
+
+
+async def _on_request_start(session, context, params):
+    context.start = time.perf_counter()
+
+
+async def _on_request_end(session, context, params):
+    registry.observe('http_request_duration_seconds', time.perf_counter() - context.start,
+                     host=params.url.host, status=params.response.status)
+
+
+async def _on_request_exception(session, context, params):
+    registry.observe('http_request_duration_seconds', time.perf_counter() - context.start,
+                     host=params.url.host, status='error')
+
+
+http_tracing = aiohttp.TraceConfig()
+http_tracing.on_request_start.append(_on_request_start)
+http_tracing.on_request_end.append(_on_request_end)
+http_tracing.on_request_exception.append(_on_request_exception)
+
+
+async def handle_metrics(request):
+    return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host='127.0.0.1', port=9108):
+    """Serve /metrics for Prometheus on a local port"""
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"Metrics available on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,125 @@
+import numpy as np
+
+from metrics import record_cache
+from providers.spotify import get_spotify_token
+from recomendations import get_mood_recommendations, get_mood_features
+from repository import history
+
+
+MOODS = ['happy', 'sad', 'energetic', 'chill', 'romantic', 'focus', 'party', 'workout']
+FEATURE_KEYS = ['valence', 'energy', 'danceability', 'tempo']
+POOL_SIZE_PER_MOOD = 200
+
+# Approximate feature vectors for the mood buckets stored in user_history
+BUCKET_VECTORS = {
+    "😄 Happy & Energetic": [0.8, 0.75, 0.65, 125],
+    "🕺 Upbeat & Danceable": [0.65, 0.65, 0.8, 120],
+    "😢 Sad & Mellow": [0.2, 0.3, 0.4, 80],
+    "⚡ High Energy": [0.5, 0.9, 0.6, 150],
+    "😊 Positive": [0.65, 0.5, 0.55, 100],
+    "😐 Neutral": [0.5, 0.5, 0.5, 105],
+}
+
+
+def to_vector(features):
+    """Turn a features dict into a normalized vector, tempo scaled to 0..1"""
+    vector = [float(features.get(key, 0.5)) for key in FEATURE_KEYS[:3]]
+    vector.append(float(features.get('tempo', 110)) / 200)
+    return vector
+
+
+def get_mood_vector(mood):
+    """Build the target vector for a mood from its Spotify recommendation parameters"""
+    target = {}
+    for param, value in get_mood_features(mood).items():
+        prefix, key = param.split('_', 1)
+        if key not in FEATURE_KEYS:
+            continue
+        if prefix == 'target' or key not in target:
+            target[key] = value
+    return to_vector(target)
+
+
+class MoodPool:
+    """Per-mood candidate tracks, pre-sorted by distance to the mood's target features"""
+
+    def __init__(self, size_per_mood=POOL_SIZE_PER_MOOD):
+        self.size_per_mood = size_per_mood
+        self.candidates = {}
+
+    def rebuild(self, tracks):
+        """Replace the pools with the given tracks, each carrying a 'vector'"""
+        if not tracks:
+            return
+
+        vectors = np.array([track['vector'] for track in tracks])
+        candidates = {}
+        for mood in MOODS:
+            distances = np.linalg.norm(vectors - np.array(get_mood_vector(mood)), axis=1)
+            # Stable, so equally close tracks keep the order Spotify recommended them in
+            order = np.argsort(distances, kind='stable')[:self.size_per_mood]
+            candidates[mood] = [
+                dict(tracks[i], match_score=max(0, int(100 - distances[i] * 100)))
+                for i in order
+            ]
+        self.candidates = candidates
+
+    def pick(self, mood, seen=frozenset(), limit=5):
+        """Get the best candidates for a mood, skipping songs the user already knows"""
+        picked = []
+        for track in self.candidates.get(mood, []):
+            if (track['title'].lower(), track['artist'].lower()) in seen:
+                continue
+            picked.append(track)
+            if len(picked) == limit:
+                break
+        record_cache('mood_pool', bool(picked))
+        return picked
+
+
+async def collect_candidates():
+    """Gather candidate tracks from Spotify recommendations and the bot's own history
+
+    Spotify's audio-features endpoint is closed to new apps, so recommended tracks take the
+    target vector of the mood they were recommended for, and history tracks the vector of
+    the mood bucket their clip was analysed into.
+    """
+    tracks = []
+    seen = set()
+
+    try:
+        token = await get_spotify_token()
+    except Exception as e:
+        print(f"Error getting Spotify token for mood pool: {e}")
+        token = None
+
+    if token:
+        for mood in MOODS:
+            recs = await get_mood_recommendations(mood, token, limit=100)
+            for rec in recs:
+                key = (rec['title'].lower(), rec['artist'].lower())
+                if key in seen:
+                    continue
+                seen.add(key)
+                tracks.append({'title': rec['title'], 'artist': rec['artist'],
+                               'spotify_url': rec['spotify_url'], 'vector': get_mood_vector(mood)})
+
+    for title, artist, spotify_url, mood in await history.mood_history():
+        key = (title.lower(), artist.lower())
+        if key in seen or mood not in BUCKET_VECTORS:
+            continue
+        seen.add(key)
+        tracks.append({'title': title, 'artist': artist, 'spotify_url': spotify_url,
+                       'vector': to_vector(dict(zip(FEATURE_KEYS, BUCKET_VECTORS[mood])))})
+
+    return tracks
+
+
+mood_pool = MoodPool()
+
+
+async def refresh_mood_pool():
+    """Rebuild the in-memory mood pool"""
+    tracks = await collect_candidates()
+    mood_pool.rebuild(tracks)
+    print(f"Mood pool refreshed with {len(tracks)} candidates")
@@ -0,0 +1,51 @@
+import re
+import unicodedata
+
+
+# Bracketed or dashed suffixes that name a version of the same recording, not a different song
+FEATURING_RE = re.compile(r'[\(\[]?\s*\b(?:feat|ft|featuring)\b\.?[^\)\]]*[\)\]]?', re.IGNORECASE)
+VERSION_WORDS = r'(?:remaster(?:ed)?|official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|mv|single version|radio edit)'
+BRACKET_SUFFIX_RE = re.compile(r'[\(\[][^\)\]]*\b' + VERSION_WORDS + r'\b[^\)\]]*[\)\]]', re.IGNORECASE)
+DASH_SUFFIX_RE = re.compile(r'\s[-–|]\s[^-–|]*\b' + VERSION_WORDS + r'\b.*$', re.IGNORECASE)
+CHANNEL_SUFFIX_RE = re.compile(r'(?:vevo|\s*-\s*topic|\s+official)$', re.IGNORECASE)
+WORD_RE = re.compile(r'\w+')
+STOP_WORDS = {'the', 'a', 'an', 'of', 'and', 'in', 'on', 'to'}
+
+
+def tokenize(text):
+    """Lowercase, accent-free word tokens"""
+    text = unicodedata.normalize('NFKD', text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return WORD_RE.findall(text.lower())
+
+
+def normalize_title(title):
+    """Strip featuring credits and remaster/video/lyrics suffixes from a track title"""
+    title = BRACKET_SUFFIX_RE.sub(" ", title)
+    title = DASH_SUFFIX_RE.sub("", title)
+    title = FEATURING_RE.sub(" ", title)
+    return " ".join(title.split())
+
+
+def title_tokens(title):
+    tokens = set(tokenize(normalize_title(title)))
+    return tokens - STOP_WORDS or tokens
+
+
+def artist_tokens(artist):
+    return set(tokenize(CHANNEL_SUFFIX_RE.sub("", artist.strip()))) - STOP_WORDS
+
+
+def same_artist(first, second):
+    """Artists match when they share a word, or when either side is unknown"""
+    return not first or not second or bool(first & second)
+
+
+def primary_artist(artist):
+    """First credited artist, so "A, B feat. C" and "A" give the same key"""
+    return re.split(r',|&|\bfeat\b|\bft\b', artist, maxsplit=1, flags=re.IGNORECASE)[0].strip()
+
+
+def track_key(title, artist):
+    """Order-insensitive key that matches versions and channel names of the same song"""
+    return " ".join(sorted(title_tokens(title))) + "|" + " ".join(sorted(artist_tokens(primary_artist(artist))))
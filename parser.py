@@ -1,38 +1,140 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+
+FILTER_KEYS = ['song', 'artist', 'album', 'year', 'platform', 'duration', 'explicit', 'limit']
+# One scan over the query: key:"quoted value", key:value, "quoted text" or a bare word.
+# Only known keys are filters, so titles like "Re: Stacks" stay plain text
+TOKEN_RE = re.compile(r'(?P<key>(?i:' + '|'.join(FILTER_KEYS) + r')):(?:"(?P<quoted>[^"]*)"|(?P<value>\S*))'
+                      r'|"(?P<text_quoted>[^"]*)"|(?P<text>\S+)')
+YEAR_RE = re.compile(r'^\d{4}$')
+DURATION_RE = re.compile(r'^(?P<min>[\d:]*)-(?P<max>[\d:]*)$|^(?P<exact>[\d:]+)$')
+
+PLATFORM_ALIASES = {
+    'spotify': 'spotify', 'spot': 'spotify',
+    'apple': 'apple', 'apple music': 'apple', 'itunes': 'apple', 'am': 'apple',
+    'youtube': 'youtube', 'yt': 'youtube',
+    'yandex': 'yandex', 'yandex music': 'yandex', 'ym': 'yandex',
+}
+BOOLEAN_VALUES = {'yes': True, 'true': True, 'only': True, 'no': False, 'false': False, 'clean': False}
+MAX_LIMIT = 10
+DEFAULT_LIMIT = 5
+
+
+class QueryError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SearchQuery:
+    """Parsed !search query; hashable so it doubles as a cache key"""
+    song: Optional[str] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    year: Optional[str] = None
+    platform: Optional[str] = None
+    min_duration: Optional[int] = None
+    max_duration: Optional[int] = None
+    explicit: Optional[bool] = None
+    limit: int = DEFAULT_LIMIT
+
+    def cache_key(self):
+        """Stable string form for shared caches, case-insensitive in the text fields"""
+        return "|".join("" if value is None else str(value).lower() for value in (
+            self.song, self.artist, self.album, self.year, self.platform,
+            self.min_duration, self.max_duration, self.explicit))
+
+    def accepts(self, result):
+        """Check a normalized provider result against the filters providers can't apply themselves"""
+        if self.album and result.get('album') and self.album.lower() not in result['album'].lower():
+            return False
+        duration = result.get('duration_seconds')
+        if duration is not None:
+            if self.min_duration is not None and duration < self.min_duration:
+                return False
+            if self.max_duration is not None and duration > self.max_duration:
+                return False
+        if self.explicit is not None and result.get('explicit') is not None and result['explicit'] != self.explicit:
+            return False
+        return True
+
+
+def parse_seconds(value):
+    """Parse "245" or "4:05" into seconds"""
+    if not value:
+        return None
+    minutes, _, seconds = value.rpartition(':')
+    if not seconds.isdigit() or (minutes and not minutes.isdigit()):
+        raise QueryError(f"Invalid duration: `{value}`, use 3:30 or 210")
+    return int(minutes or 0) * 60 + int(seconds)
+
+
 def parse_search_query(query):
-    """Parse search query to extract song, artist, year, and platform"""
-    params = {}
-
-    # Extract quoted values
-    import re
-
-    # Match song:"value"
-    song_match = re.search(r'song:"([^"]+)"', query, re.IGNORECASE)
-    if song_match:
-        params['song'] = song_match.group(1)
-
-    # Match artist:"value"
-    artist_match = re.search(r'artist:"([^"]+)"', query, re.IGNORECASE)
-    if artist_match:
-        params['artist'] = artist_match.group(1)
-
-    # Match year:value
-    year_match = re.search(r'year:(\d{4})', query, re.IGNORECASE)
-    if year_match:
-        params['year'] = year_match.group(1)
-
-    # Match platform:"value" or platform:value
-    platform_match = re.search(r'platform:(?:"([^"]+)"|(\w+))', query, re.IGNORECASE)
-    if platform_match:
-        platform = platform_match.group(1) or platform_match.group(2)
-        # Normalize platform names
-        platform_lower = platform.lower()
-        if platform_lower in ['spotify', 'spot']:
-            params['platform'] = 'spotify'
-        elif platform_lower in ['youtube', 'yt']:
-            params['platform'] = 'youtube'
-        elif platform_lower in ['yandex', 'yandex music', 'ym']:
-            params['platform'] = 'yandex'
-        else:
-            params['platform'] = platform_lower
-
-    return params
\ No newline at end of file
+    """Parse a search query into a SearchQuery in a single pass
+
+    Supports song, artist, album, year, platform, duration (3:00-4:30), explicit (yes/no)
+    and limit. Text values may be quoted or run until the next key; text before any
+    key becomes the song name.
+    """
+    fields = {}
+    seen_keys = set()
+    free_text = []
+    open_key = None
+
+    for match in TOKEN_RE.finditer(query):
+        key = match.group('key')
+        if key is None:
+            # Unquoted words keep extending an unquoted song/artist/album value
+            if open_key and match.group('text'):
+                fields[open_key] += " " + match.group('text')
+            else:
+                free_text.append(match.group('text_quoted') or match.group('text'))
+            continue
+
+        key = key.lower()
+        value = match.group('quoted') if match.group('quoted') is not None else match.group('value')
+        value = value.strip()
+        if key in seen_keys:
+            raise QueryError(f"`{key}` is given more than once")
+        if not value:
+            raise QueryError(f"`{key}` needs a value")
+        seen_keys.add(key)
+        open_key = None
+
+        if key in ('song', 'artist', 'album'):
+            fields[key] = value
+            if match.group('quoted') is None:
+                open_key = key
+        elif key == 'year':
+            if not YEAR_RE.match(value):
+                raise QueryError(f"Invalid year: `{value}`")
+            fields['year'] = value
+        elif key == 'platform':
+            if value.lower() not in PLATFORM_ALIASES:
+                raise QueryError(f"Unknown platform: `{value}`, use spotify, apple, youtube or yandex")
+            fields['platform'] = PLATFORM_ALIASES[value.lower()]
+        elif key == 'duration':
+            duration = DURATION_RE.match(value)
+            if not duration:
+                raise QueryError(f"Invalid duration: `{value}`, use 3:00-4:30")
+            if duration.group('exact'):
+                fields['min_duration'] = fields['max_duration'] = parse_seconds(duration.group('exact'))
+            else:
+                fields['min_duration'] = parse_seconds(duration.group('min'))
+                fields['max_duration'] = parse_seconds(duration.group('max'))
+        elif key == 'explicit':
+            if value.lower() not in BOOLEAN_VALUES:
+                raise QueryError(f"Invalid explicit filter: `{value}`, use yes or no")
+            fields['explicit'] = BOOLEAN_VALUES[value.lower()]
+        elif key == 'limit':
+            if not value.isdigit() or not 1 <= int(value) <= MAX_LIMIT:
+                raise QueryError(f"Limit must be between 1 and {MAX_LIMIT}")
+            fields['limit'] = int(value)
+
+    if free_text:
+        if 'song' in fields:
+            raise QueryError("Put the whole song name inside `song:\"...\"`")
+        fields['song'] = " ".join(free_text)
+
+    return SearchQuery(**fields)
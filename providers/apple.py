@@ -1,19 +1,140 @@
+import asyncio
+import os
+
 import aiohttp
-import urllib.parse
+from metrics import http_tracing, timed, record_cache
+from state import get_state
+
+
+ITUNES_SEARCH_URL = "https://itunes.apple.com/search"
+ITUNES_LOOKUP_URL = "https://itunes.apple.com/lookup"
+# Two-letter country code of the store to search; ids and availability differ between storefronts
+APPLE_STOREFRONT = os.getenv('APPLE_STOREFRONT', 'us').lower()
+# The lookup endpoint accepts at most 200 comma-separated ids per request
+LOOKUP_BATCH = 200
+# ISRC lookups can't be batched, the results don't say which ISRC they matched
+ISRC_CONCURRENCY = 8
+SEARCH_CACHE_TTL = 24 * 60 * 60
+TRACK_CACHE_TTL = 7 * 24 * 60 * 60
+
+_session = None
+
+
+def apple_session():
+    """The session shared by every iTunes request, so connections are kept alive between calls"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(trace_configs=[http_tracing])
+    return _session
+
+
+async def close_apple_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+def apple_row(track):
+    """An iTunes song result in the shape of the other providers' !search rows"""
+    duration_ms = track.get('trackTimeMillis') or 0
+    release_date = track.get('releaseDate') or ''
+    return {
+        'title': track.get('trackName', 'Unknown'),
+        'artist': track.get('artistName', 'Unknown'),
+        'album': track.get('collectionName', 'Unknown'),
+        'year': release_date[:4] or 'Unknown',
+        'duration': f"{duration_ms // 60000}:{duration_ms % 60000 // 1000:02d}",
+        'duration_seconds': duration_ms // 1000 if duration_ms else None,
+        'explicit': track.get('trackExplicitness') == 'explicit' if track.get('trackExplicitness') else None,
+        'genre': track.get('primaryGenreName'),
+        'apple_url': track.get('trackViewUrl', ''),
+        'apple_id': str(track['trackId']) if track.get('trackId') else None,
+        'preview_url': track.get('previewUrl'),
+        'thumbnail': track.get('artworkUrl100'),
+    }
+
+
+async def itunes_get(url, params):
+    """Song results of one iTunes request, [] on errors"""
+    try:
+        async with apple_session().get(url, params=params) as response:
+            if response.status != 200:
+                print(f"iTunes API error: {response.status}")
+                return []
+            data = await response.json(content_type=None)
+    except Exception as e:
+        print(f"Error querying iTunes: {e}")
+        return []
+    return [result for result in data.get('results', []) if result.get('wrapperType') == 'track']
 
+
+async def search_apple_tracks(term, limit=10, storefront=APPLE_STOREFRONT):
+    """Raw iTunes song results for a search term, cached per storefront"""
+    state = get_state()
+    key = f"apple:search:{storefront}:{limit}:{term.lower()}"
+    cached = await state.get(key)
+    record_cache('apple_search', cached is not None)
+    if cached is not None:
+        return cached
+
+    results = await itunes_get(ITUNES_SEARCH_URL, {
+        'term': term, 'media': 'music', 'entity': 'song', 'limit': limit, 'country': storefront})
+    if results:
+        await state.set(key, results, ttl=SEARCH_CACHE_TTL)
+    return results
+
+
+@timed('lookup', metric='provider_duration_seconds', provider='apple')
+async def lookup_apple_tracks(track_ids, storefront=APPLE_STOREFRONT):
+    """Raw iTunes results by track id, {id: result}, fetching up to 200 uncached ids per request"""
+    state = get_state()
+    track_ids = list(dict.fromkeys(str(track_id) for track_id in track_ids))
+    tracks = {}
+    missing = []
+    for track_id in track_ids:
+        cached = await state.get(f"apple:track:{storefront}:{track_id}")
+        record_cache('apple_track', cached is not None)
+        if cached is not None:
+            tracks[track_id] = cached
+        else:
+            missing.append(track_id)
+
+    batches = [missing[start:start + LOOKUP_BATCH] for start in range(0, len(missing), LOOKUP_BATCH)]
+    for results in await asyncio.gather(*(itunes_get(ITUNES_LOOKUP_URL, {
+            'id': ','.join(batch), 'country': storefront}) for batch in batches)):
+        for result in results:
+            track_id = str(result.get('trackId'))
+            tracks[track_id] = result
+            await state.set(f"apple:track:{storefront}:{track_id}", result, ttl=TRACK_CACHE_TTL)
+    return tracks
+
+
+@timed('lookup_isrc', metric='provider_duration_seconds', provider='apple')
+async def lookup_apple_isrcs(isrcs, storefront=APPLE_STOREFRONT):
+    """Raw iTunes results by ISRC, {isrc: result}, for the ISRCs the storefront has"""
+    state = get_state()
+    semaphore = asyncio.Semaphore(ISRC_CONCURRENCY)
+
+    async def lookup(isrc):
+        key = f"apple:isrc:{storefront}:{isrc}"
+        cached = await state.get(key)
+        record_cache('apple_isrc', cached is not None)
+        if cached is not None:
+            return isrc, cached or None
+        async with semaphore:
+            results = await itunes_get(ITUNES_LOOKUP_URL, {'isrc': isrc, 'country': storefront})
+        # Misses are cached too, as an empty dict
+        await state.set(key, results[0] if results else {}, ttl=TRACK_CACHE_TTL)
+        return isrc, results[0] if results else None
+
+    found = await asyncio.gather(*(lookup(isrc) for isrc in dict.fromkeys(isrcs) if isrc))
+    return {isrc: result for isrc, result in found if result}
+
+
+@timed('search', metric='provider_duration_seconds', provider='apple')
 async def search_apple_music(query):
     """Search for a song on Apple Music using iTunes API"""
-    encoded_query = urllib.parse.quote(query)
-    url = f"https://itunes.apple.com/search?term={encoded_query}&media=music&entity=song&limit=1"
-
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    data = await response.json(content_type=None)
-                    if data.get('results'):
-                        return data['results'][0]
-        except Exception as e:
-            print(f"Error searching Apple Music: {e}")
-
-    return None
\ No newline at end of file
+    results = await search_apple_tracks(query, limit=1)
+    return results[0] if results else None
+
@@ -0,0 +1,44 @@
+import aiohttp
+from settings import MusicRecognitionBot
+from metrics import http_tracing, timed
+
+bot_settings = MusicRecognitionBot()
+
+LASTFM_URL = "https://ws.audioscrobbler.com/2.0/"
+
+
+@timed('track_info', metric='provider_duration_seconds', provider='lastfm')
+async def get_lastfm_track_info(title, artist, session):
+    """Corrected artist name and top tag of a track from Last.fm, or None"""
+    if not bot_settings.lastfm_api_key:
+        return None
+
+    params = {
+        'method': 'track.getInfo',
+        'api_key': bot_settings.lastfm_api_key,
+        'artist': artist,
+        'track': title,
+        'autocorrect': '1',
+        'format': 'json',
+    }
+    try:
+        async with session.get(LASTFM_URL, params=params) as response:
+            if response.status != 200:
+                return None
+            data = await response.json(content_type=None)
+    except Exception as e:
+        print(f"Error looking up {title} on Last.fm: {e}")
+        return None
+
+    track = data.get('track')
+    if not track:
+        return None
+    tags = (track.get('toptags') or {}).get('tag') or []
+    return {
+        'artist': (track.get('artist') or {}).get('name') or artist,
+        'genre': tags[0]['name'].lower() if tags else "",
+    }
+
+
+def lastfm_session():
+    return aiohttp.ClientSession(trace_configs=[http_tracing])
@@ -1,13 +1,24 @@
 import aiohttp
 import base64
 from settings import MusicRecognitionBot
+from metrics import http_tracing, timed, record_cache
+from state import get_state
 
 bot_settings = MusicRecognitionBot()
 
 
 # Get Token
+@timed('token', metric='provider_duration_seconds', provider='spotify')
 async def get_spotify_token():
-    """Get Spotify access token"""
+    """Get Spotify access token, shared by every shard until shortly before it expires"""
+    state = get_state()
+    token = await state.get('spotify:token')
+    record_cache('spotify_token', token is not None)
+    if token:
+        return token
+    if not bot_settings.spotify_client_id or not bot_settings.spotify_client_secret:
+        return None
+
     auth_string = f"{bot_settings.spotify_client_id}:{bot_settings.spotify_client_secret}"
     auth_bytes = auth_string.encode("utf-8")
     auth_base64 = str(base64.b64encode(auth_bytes), "utf-8")
@@ -19,19 +30,24 @@ async def get_spotify_token():
     }
     data = {"grant_type": "client_credentials"}
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
         async with session.post(url, headers=headers, data=data) as response:
             json_result = await response.json()
+            await state.set('spotify:token', json_result["access_token"],
+                            ttl=max(json_result.get("expires_in", 3600) - 60, 60))
             return json_result["access_token"]
 
 
 ## Search music from Spotify Music
+@timed('search', metric='provider_duration_seconds', provider='spotify')
 async def search_spotify(query):
     """Search for a song on Spotify"""
     token = await get_spotify_token()
+    if not token:
+        return None
     headers = {"Authorization": f"Bearer {token}"}
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
         async with session.get(f"https://api.spotify.com/v1/search?q={query}&type=track&limit=1",
                                headers=headers) as response:
             data = await response.json()
@@ -47,7 +63,7 @@ async def get_song_analysis(track_id):
     token = await get_spotify_token()
     headers = {"Authorization": f"Bearer {token}"}
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
         # Get audio features
         async with session.get(f"https://api.spotify.com/v1/audio-features/{track_id}", headers=headers) as response:
             features = await response.json()
@@ -56,4 +72,4 @@ async def get_song_analysis(track_id):
         async with session.get(f"https://api.spotify.com/v1/audio-analysis/{track_id}", headers=headers) as response:
             analysis = await response.json()
 
-    return features, analysis
\ No newline at end of file
+    return features, analysis
@@ -1,66 +1,130 @@
 import aiohttp
-import base64
 from settings import MusicRecognitionBot
-import urllib.parse
+from metrics import http_tracing, timed, record_cache
+from state import get_state
 from typing import Optional, Dict, Any
 
 
 bot_settings = MusicRecognitionBot()
 
+YANDEX_API_URL = "https://api.music.yandex.net"
+# A misconfigured provider should fail the startup probe fast rather than hold up startup
+PROBE_TIMEOUT = aiohttp.ClientTimeout(total=5)
+SEARCH_TIMEOUT = aiohttp.ClientTimeout(total=10)
+SEARCH_CACHE_TTL = 24 * 60 * 60
+
+_session = None
+# None until probe_yandex has run; searches are skipped unless the probe passed
+_available = None
+
+
+def yandex_session():
+    """The session shared by every Yandex Music request, with the OAuth header set once"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(trace_configs=[http_tracing],
+                                         headers={"Authorization": f"OAuth {get_yandex_token()}"})
+    return _session
+
+
+async def close_yandex_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
 
 ## Get Token
-async def get_yandex_token():
-    """Get Yandex Music access token using OAuth2"""
-    # Yandex OAuth endpoint
-    url = "https://oauth.yandex.ru/token"
-
-    # Basic auth with client credentials
-    auth_string = f"{bot_settings.yandex_client_id}:{bot_settings.yandex_client_secret}"
-    auth_bytes = auth_string.encode("utf-8")
-    auth_base64 = str(base64.b64encode(auth_bytes), "utf-8")
-
-    headers = {
-        "Authorization": f"Basic {auth_base64}",
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
+def get_yandex_token():
+    """Yandex Music OAuth token from YANDEX_MUSIC_TOKEN
 
-    data = {
-        "grant_type": "client_credentials"
-    }
+    The Music API only accepts user tokens, which are long-lived, so the token is read from
+    the environment instead of being fetched; probe_yandex checks it once at startup.
+    """
+    return bot_settings.yandex_music_token
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, data=data) as response:
-            json_result = await response.json()
-            return json_result["access_token"]
 
+def yandex_available():
+    return _available
 
 
-## Search music from Yandex Music
-async def search_yandex_music(query: str) -> Optional[Dict[str, Any]]:
-    """Search for a song on Yandex Music"""
-    # Note: Yandex Music API requires authentication and is not publicly available
-    # This is a conceptual implementation - you'd need proper API access
+@timed('probe', metric='provider_duration_seconds', provider='yandex')
+async def probe_yandex():
+    """Check the token against the account endpoint once; Yandex is left out of searches if it fails"""
+    global _available
+    if not get_yandex_token():
+        _available = False
+        print("Yandex Music disabled: YANDEX_MUSIC_TOKEN is not set")
+        return _available
+
+    try:
+        async with yandex_session().get(f"{YANDEX_API_URL}/account/status", timeout=PROBE_TIMEOUT) as response:
+            data = await response.json(content_type=None) if response.status == 200 else {}
+        _available = bool((data.get('result') or {}).get('account', {}).get('uid'))
+        if not _available:
+            print(f"Yandex Music disabled: the token was rejected ({response.status})")
+    except Exception as e:
+        _available = False
+        print(f"Yandex Music disabled: {e}")
+    return _available
 
-    encoded_query = urllib.parse.quote(query)
-    url = f"https://api.music.yandex.net/search?text={encoded_query}&type=track&page=0&playlist-in-best=true"
 
-    # You would need to get Yandex Music API token
-    token = await get_yandex_token()  # Implement this function
-    headers = {
-        "Authorization": f"OAuth {token}",
-        "Content-Type": "application/json"
+def yandex_url(track):
+    album_id = (track.get('albums') or [{}])[0].get('id', '')
+    return f"https://music.yandex.ru/album/{album_id}/track/{track['id']}"
+
+
+def yandex_row(track):
+    """A Yandex Music track in the shape of the other providers' !search rows"""
+    duration_ms = track.get('durationMs') or 0
+    album = (track.get('albums') or [{}])[0]
+    return {
+        'title': track.get('title', 'Unknown'),
+        'artist': ', '.join(artist['name'] for artist in track.get('artists', [])) or 'Unknown',
+        'album': album.get('title', 'Unknown'),
+        'year': str(album['year']) if album.get('year') else 'Unknown',
+        'duration': f"{duration_ms // 60000}:{duration_ms % 60000 // 1000:02d}",
+        'duration_seconds': duration_ms // 1000 if duration_ms else None,
+        'explicit': track.get('contentWarning') == 'explicit' if 'contentWarning' in track else None,
+        'yandex_url': yandex_url(track),
+        'yandex_id': str(track['id']),
     }
 
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('result') and data['result'].get('tracks'):
-                        tracks = data['result']['tracks']['results']
-                        if tracks:
-                            return tracks[0]  # Return first track
-        except Exception as e:
-            print(f"Error searching Yandex Music: {e}")
-
-    return None
+
+async def search_yandex_tracks(text, limit=10):
+    """Raw Yandex Music tracks for a search text, cached; [] without a working token"""
+    if not yandex_available():
+        return []
+
+    state = get_state()
+    key = f"yandex:search:{limit}:{text.lower()}"
+    cached = await state.get(key)
+    record_cache('yandex_search', cached is not None)
+    if cached is not None:
+        return cached
+
+    params = {'text': text, 'type': 'track', 'page': 0, 'nocorrect': 'false'}
+    try:
+        async with yandex_session().get(f"{YANDEX_API_URL}/search", params=params,
+                                        timeout=SEARCH_TIMEOUT) as response:
+            if response.status != 200:
+                print(f"Yandex Music API error: {response.status}")
+                return []
+            data = await response.json(content_type=None)
+    except Exception as e:
+        print(f"Error searching Yandex Music: {e}")
+        return []
+
+    tracks = ((data.get('result') or {}).get('tracks') or {}).get('results') or []
+    tracks = [track for track in tracks[:limit] if track.get('id') and track.get('available', True)]
+    if tracks:
+        await state.set(key, tracks, ttl=SEARCH_CACHE_TTL)
+    return tracks
+
+
+## Search music from Yandex Music
+@timed('search', metric='provider_duration_seconds', provider='yandex')
+async def search_yandex_music(query: str) -> Optional[Dict[str, Any]]:
+    """Search for a song on Yandex Music"""
+    tracks = await search_yandex_tracks(query, limit=1)
+    return tracks[0] if tracks else None
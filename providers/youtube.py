@@ -3,10 +3,12 @@ import urllib.parse
 from typing import Optional, Dict, Any
 
 from settings import MusicRecognitionBot
+from metrics import http_tracing, timed
 
 bot_settings = MusicRecognitionBot()
 
 
+@timed('search', metric='provider_duration_seconds', provider='youtube')
 async def search_youtube_music(query: str) -> Optional[Dict[str, Any]]:
     """Search for a song on YouTube Music using YouTube Data API"""
     # YouTube Data API v3 - requires API key
@@ -17,7 +19,7 @@ async def search_youtube_music(query: str) -> Optional[Dict[str, Any]]:
            f"?part=snippet&type=video&q={encoded_query}"
            f"&videoCategoryId=10&maxResults=1&key={api_key}")
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
         try:
             async with session.get(url) as response:
                 if response.status == 200:
@@ -42,7 +44,7 @@ async def search_youtube_unofficial(query: str) -> Optional[Dict[str, Any]]:
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
     }
 
-    async with aiohttp.ClientSession() as session:
+    async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
         try:
             async with session.get(search_url, headers=headers) as response:
                 if response.status == 200:
@@ -2,7 +2,9 @@
 import aiohttp
 import random
 from providers.spotify import get_spotify_token
+from track_ids import add_apple_links
 from collections import Counter
+from metrics import http_tracing
 
 async def get_artist_recommendations(artist_name, token):
     """Get recommendations based on similar artists"""
@@ -11,7 +13,7 @@ async def get_artist_recommendations(artist_name, token):
     try:
         headers = {"Authorization": f"Bearer {token}"}
 
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
             # First, search for the artist
             search_url = f"https://api.spotify.com/v1/search?q={artist_name.replace(' ', '%20')}&type=artist&limit=1"
 
@@ -37,6 +39,7 @@ async def get_artist_recommendations(artist_name, token):
                                         'artist': track['artists'][0]['name'],
                                         'match_score': 80 + random.randint(-10, 15),  # 70-95 range
                                         'spotify_url': track['external_urls']['spotify'],
+                                        'isrc': track.get('external_ids', {}).get('isrc'),
                                         'reason': f"Popular track by {artist_name}"
                                     })
 
@@ -62,6 +65,7 @@ async def get_artist_recommendations(artist_name, token):
                                                     'artist': track['artists'][0]['name'],
                                                     'match_score': 70 + random.randint(-5, 15),  # 65-85 range
                                                     'spotify_url': track['external_urls']['spotify'],
+                                                    'isrc': track.get('external_ids', {}).get('isrc'),
                                                     'reason': f"Similar to {artist_name}"
                                                 })
 
@@ -98,7 +102,7 @@ async def get_genre_recommendations(genres, token, mood=None):
             param_string = '&'.join([f'{k}={v}' for k, v in params.items()])
             rec_url = f"https://api.spotify.com/v1/recommendations?{param_string}"
 
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
                 async with session.get(rec_url, headers=headers) as response:
                     if response.status == 200:
                         rec_data = await response.json()
@@ -110,6 +114,7 @@ async def get_genre_recommendations(genres, token, mood=None):
                                 'artist': track['artists'][0]['name'],
                                 'match_score': 75 + random.randint(-10, 20),  # 65-95 range
                                 'spotify_url': track['external_urls']['spotify'],
+                                'isrc': track.get('external_ids', {}).get('isrc'),
                                 'reason': f"Based on {', '.join(genres)} genres"
                             })
 
@@ -119,7 +124,7 @@ async def get_genre_recommendations(genres, token, mood=None):
     return recommendations
 
 
-async def get_mood_recommendations(mood, token, top_artists=None):
+async def get_mood_recommendations(mood, token, top_artists=None, limit=8):
     """Get mood-based recommendations"""
     recommendations = []
 
@@ -131,7 +136,7 @@ async def get_mood_recommendations(mood, token, top_artists=None):
 
         # Build parameters
         params = {
-            'limit': 8,
+            'limit': limit,
             'market': 'US'
         }
         params.update(mood_features)
@@ -141,7 +146,7 @@ async def get_mood_recommendations(mood, token, top_artists=None):
             # Search for artist ID
             search_url = f"https://api.spotify.com/v1/search?q={top_artists[0].replace(' ', '%20')}&type=artist&limit=1"
 
-            async with aiohttp.ClientSession() as session:
+            async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
                 async with session.get(search_url, headers=headers) as search_response:
                     if search_response.status == 200:
                         search_data = await search_response.json()
@@ -158,7 +163,7 @@ async def get_mood_recommendations(mood, token, top_artists=None):
         param_string = '&'.join([f'{k}={v}' for k, v in params.items()])
         rec_url = f"https://api.spotify.com/v1/recommendations?{param_string}"
 
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
             async with session.get(rec_url, headers=headers) as response:
                 if response.status == 200:
                     rec_data = await response.json()
@@ -170,6 +175,7 @@ async def get_mood_recommendations(mood, token, top_artists=None):
                             'artist': track['artists'][0]['name'],
                             'match_score': 85 + random.randint(-10, 10),  # 75-95 range
                             'spotify_url': track['external_urls']['spotify'],
+                            'isrc': track.get('external_ids', {}).get('isrc'),
                             'reason': f"Perfect for {mood} mood"
                         })
 
@@ -287,8 +293,8 @@ async def generate_smart_recommendations(history, mood=None):
         return recommendations
 
     # Analyze user's music patterns
-    artists = [item[1] for item in history]
-    genres = [item[2] for item in history if item[2]]
+    artists = [item.artist for item in history]
+    genres = [item.genre for item in history if item.genre]
 
     # Get most frequent artists and genres
     artist_counts = Counter(artists)
@@ -331,7 +337,8 @@ async def generate_smart_recommendations(history, mood=None):
 
         # Sort by match score and return top 10
         unique_recommendations.sort(key=lambda x: x['match_score'], reverse=True)
-        return unique_recommendations[:10]
+        # Apple Music links for the same recordings, matched by ISRC
+        return await add_apple_links(unique_recommendations[:10])
 
     except Exception as e:
         print(f"Error generating recommendations: {e}")
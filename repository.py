@@ -0,0 +1,392 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+from db import DB_PATH
+from metrics import timed
+from normalize import track_key
+from search_index import index_tracks, search_tracks
+
+
+# Prepared statements kept per connection; the repositories use a few dozen distinct queries
+STATEMENT_CACHE_SIZE = 256
+
+
+@dataclass(slots=True)
+class Listen:
+    """One identified song to add to a user's history"""
+    user_id: str
+    title: str
+    artist: str
+    spotify_url: str = ""
+    genre: str = ""
+    mood: str = ""
+    server_id: str = ""
+    timestamp: int = 0
+
+
+@dataclass(slots=True)
+class HistoryEntry:
+    title: str
+    artist: str
+    genre: str = ""
+
+
+@dataclass(slots=True)
+class UserStats:
+    total_songs: int
+    top_artists: list
+    top_genres: list
+
+
+@dataclass(slots=True)
+class Playlist:
+    playlist_id: str
+    name: str
+    creator_id: str
+
+
+class Database:
+    """One long-lived connection shared by the repositories, used from worker threads
+
+    Keeping the connection open lets sqlite3 reuse each statement it has prepared
+    instead of re-parsing the SQL on every command. Calls are serialized by a lock
+    and each runs in its own transaction.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _call(self, func, *args):
+        with self.lock:
+            if self.conn is None:
+                self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                            cached_statements=STATEMENT_CACHE_SIZE)
+            with self.conn:
+                return func(self.conn.cursor(), *args)
+
+    async def run(self, func, *args):
+        return await asyncio.to_thread(self._call, func, *args)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class HistoryRepository:
+    def __init__(self, database):
+        self.database = database
+
+    @staticmethod
+    def _add_many(c, listens, index):
+        now = int(time.time())
+        c.executemany("INSERT INTO user_history VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                      [(str(listen.user_id), listen.title, listen.artist, listen.timestamp or now,
+                        listen.spotify_url or "", "", listen.genre or "", listen.mood or "",
+                        str(listen.server_id or "")) for listen in listens])
+        if index:
+            index_tracks(c, [(listen.title, listen.artist, "", listen.spotify_url, "") for listen in listens])
+
+    @staticmethod
+    def _recent(c, user_id, limit):
+        c.execute("SELECT song_title, artist, genre FROM user_history WHERE user_id = ? "
+                  "ORDER BY timestamp DESC LIMIT ?", (str(user_id), limit))
+        rows = c.fetchall()
+        if len(rows) < limit:
+            c.execute("SELECT '', artist, genre FROM history_rollups WHERE user_id = ? "
+                      "GROUP BY artist, genre ORDER BY SUM(plays) DESC LIMIT ?", (str(user_id), limit - len(rows)))
+            rows += c.fetchall()
+        return [HistoryEntry(title, artist, genre or "") for title, artist, genre in rows]
+
+    @staticmethod
+    def _stats(c, user_id):
+        plays = ("SELECT artist, genre, 1 AS plays FROM user_history WHERE user_id = ? "
+                 "UNION ALL SELECT artist, genre, plays FROM history_rollups WHERE user_id = ?")
+        user_id = str(user_id)
+        c.execute(f"SELECT COALESCE(SUM(plays), 0) FROM ({plays})", (user_id, user_id))
+        total_songs = c.fetchone()[0]
+        c.execute(f"SELECT artist, SUM(plays) AS count FROM ({plays}) GROUP BY artist ORDER BY count DESC LIMIT 5",
+                  (user_id, user_id))
+        top_artists = c.fetchall()
+        c.execute(f"SELECT genre, SUM(plays) AS count FROM ({plays}) GROUP BY genre ORDER BY count DESC LIMIT 3",
+                  (user_id, user_id))
+        top_genres = c.fetchall()
+        return UserStats(total_songs, top_artists, top_genres)
+
+    @staticmethod
+    def _unenriched(c, user_id, after, limit):
+        c.execute("SELECT DISTINCT song_title, artist FROM user_history WHERE user_id = ? AND genre = '' "
+                  "AND (song_title, artist) > (?, ?) ORDER BY song_title, artist LIMIT ?",
+                  (str(user_id), *after, limit))
+        return [HistoryEntry(title, artist) for title, artist in c.fetchall()]
+
+    @staticmethod
+    def _enrich(c, user_id, updates):
+        c.executemany("UPDATE user_history SET artist = ?, genre = ? "
+                      "WHERE user_id = ? AND song_title = ? AND artist = ? AND genre = ''",
+                      [(entry.artist, entry.genre, str(user_id), entry.title, original_artist)
+                       for original_artist, entry in updates])
+        index_tracks(c, [(entry.title, entry.artist, "", "", "") for _, entry in updates])
+
+    @staticmethod
+    def _export(c, user_id, write):
+        c.execute("SELECT song_title, artist, genre, mood, spotify_url, timestamp FROM user_history "
+                  "WHERE user_id = ? ORDER BY timestamp", (str(user_id),))
+        return write(c)
+
+    @staticmethod
+    def _track_keys(c, user_id):
+        c.execute("SELECT song_title, artist FROM user_history WHERE user_id = ?", (str(user_id),))
+        return {(title.lower(), artist.lower()) for title, artist in c.fetchall()}
+
+    @staticmethod
+    def _mood_history(c, limit):
+        c.execute("SELECT DISTINCT song_title, artist, spotify_url, mood FROM user_history "
+                  "WHERE mood != '' ORDER BY timestamp DESC LIMIT ?", (limit,))
+        return c.fetchall()
+
+    @timed('history_add', metric='db_query_duration_seconds')
+    async def add(self, listen):
+        """Save an identified song to its user's history and the search index"""
+        await self.database.run(self._add_many, [listen], True)
+
+    @timed('history_add_many', metric='db_query_duration_seconds')
+    async def add_many(self, listens, index=True):
+        """Insert many songs in one transaction; bulk imports skip the search index and index once enriched"""
+        await self.database.run(self._add_many, listens, index)
+
+    @timed('history_recent', metric='db_query_duration_seconds')
+    async def recent(self, user_id, limit=20):
+        """A user's latest songs, newest first
+
+        Users with fewer raw rows left get their most played rolled-up artists after them,
+        with an empty title.
+        """
+        return await self.database.run(self._recent, user_id, limit)
+
+    @timed('history_stats', metric='db_query_duration_seconds')
+    async def stats(self, user_id):
+        """Total songs, top 5 (artist, count) and top 3 (genre, count) over raw and rolled-up history"""
+        return await self.database.run(self._stats, user_id)
+
+    @timed('history_unenriched', metric='db_query_duration_seconds')
+    async def unenriched(self, user_id, after=("", ""), limit=200):
+        """Distinct songs of a user still without a genre, in (title, artist) order after `after`"""
+        return await self.database.run(self._unenriched, user_id, after, limit)
+
+    @timed('history_enrich', metric='db_query_duration_seconds')
+    async def enrich(self, user_id, updates):
+        """Apply (original artist, corrected entry) pairs to a user's genre-less rows and index the songs"""
+        await self.database.run(self._enrich, user_id, updates)
+
+    @timed('history_export', metric='db_query_duration_seconds')
+    async def export(self, user_id, write):
+        """Call `write` with a cursor over the user's (title, artist, genre, mood, spotify_url, timestamp) rows"""
+        return await self.database.run(self._export, user_id, write)
+
+    @timed('history_track_keys', metric='db_query_duration_seconds')
+    async def track_keys(self, user_id):
+        """Lowercased (title, artist) of every song in a user's history"""
+        return await self.database.run(self._track_keys, user_id)
+
+    @timed('history_mood_history', metric='db_query_duration_seconds')
+    async def mood_history(self, limit=1000):
+        """(title, artist, spotify_url, mood) of recently identified songs that have a detected mood"""
+        return await self.database.run(self._mood_history, limit)
+
+
+class TrackRepository:
+    """Songs the bot has seen: the ISRC table with per-platform links and the search index"""
+
+    def __init__(self, database):
+        self.database = database
+
+    @staticmethod
+    def _save_links(c, tracks):
+        for isrc, title, artist, links in tracks:
+            c.execute("INSERT INTO tracks VALUES (?, ?, ?, ?) ON CONFLICT(isrc) DO NOTHING",
+                      (isrc, title, artist, track_key(title, artist)))
+            c.executemany("INSERT OR REPLACE INTO track_links VALUES (?, ?, ?, ?)",
+                          [(isrc, platform, platform_id, url) for platform, (platform_id, url) in links.items()])
+            index_tracks(c, [(title, artist, "", links.get('spotify', (None, ""))[1],
+                              links.get('youtube', (None, ""))[1])])
+
+    @staticmethod
+    def _links(c, isrc, title, artist):
+        query = ("SELECT tracks.isrc, title, artist, platform, platform_id, url FROM tracks "
+                 "JOIN track_links ON track_links.isrc = tracks.isrc ")
+        if isrc:
+            c.execute(query + "WHERE tracks.isrc = ?", (isrc,))
+        else:
+            c.execute(query + "WHERE track_key = ? ORDER BY tracks.isrc", (track_key(title, artist),))
+        rows = c.fetchall()
+        if not rows:
+            return None
+        # A title can match several recordings; keep the first one
+        isrc, title, artist = rows[0][:3]
+        links = {platform: (platform_id, url) for row_isrc, _, _, platform, platform_id, url in rows
+                 if row_isrc == isrc}
+        return {'isrc': isrc, 'title': title, 'artist': artist, 'links': links}
+
+    @staticmethod
+    def _platform_ids(c, isrcs, platform):
+        placeholders = ",".join("?" * len(isrcs))
+        c.execute(f"SELECT isrc, platform_id FROM track_links WHERE platform = ? AND isrc IN ({placeholders})",
+                  (platform, *isrcs))
+        return dict(c.fetchall())
+
+    @staticmethod
+    def _track_id(c, title, artist):
+        row = c.execute("SELECT id FROM known_tracks WHERE track_key = ?", (track_key(title, artist),)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _get(c, track_id):
+        row = c.execute("SELECT title, artist, album, spotify_url, youtube_url FROM known_tracks WHERE id = ?",
+                        (track_id,)).fetchone()
+        if not row:
+            return None
+        return dict(zip(('title', 'artist', 'album', 'spotify_url', 'youtube_url'), row))
+
+    @timed('save_track_links', metric='db_query_duration_seconds')
+    async def save_links(self, tracks):
+        """Remember per-platform IDs and URLs for (isrc, title, artist, {platform: (id, url)}) tuples"""
+        await self.database.run(self._save_links, tracks)
+
+    @timed('get_track_links', metric='db_query_duration_seconds')
+    async def links(self, isrc=None, title=None, artist=None):
+        """Look up a known song by ISRC, or by title and artist, with every platform link we have for it"""
+        return await self.database.run(self._links, isrc, title, artist)
+
+    @timed('get_platform_ids', metric='db_query_duration_seconds')
+    async def platform_ids(self, isrcs, platform):
+        """{isrc: id} of the songs among `isrcs` whose id on `platform` is known"""
+        isrcs = [isrc for isrc in dict.fromkeys(isrcs) if isrc]
+        if not isrcs:
+            return {}
+        return await self.database.run(self._platform_ids, isrcs, platform)
+
+    @timed('search_known_tracks', metric='db_query_duration_seconds')
+    async def search(self, song, artist=None, album=None, limit=10):
+        """Full-text search over songs the bot has already seen, with prefix and typo tolerance"""
+        return await self.database.run(search_tracks, song, artist, album, limit)
+
+    @timed('get_known_track_id', metric='db_query_duration_seconds')
+    async def track_id(self, title, artist):
+        """Row id of a song in the search index; short enough to put in a button's custom ID"""
+        return await self.database.run(self._track_id, title, artist)
+
+    @timed('get_known_track', metric='db_query_duration_seconds')
+    async def get(self, track_id):
+        """Title, artist, album and links of an indexed song, or None"""
+        return await self.database.run(self._get, track_id)
+
+
+class PlaylistRepository:
+    def __init__(self, database):
+        self.database = database
+
+    @staticmethod
+    def _create(c, playlist_id, name, creator_id, server_id):
+        c.execute("INSERT INTO playlists VALUES (?, ?, ?, ?, ?, ?, ?)",
+                  (playlist_id, name, str(creator_id), str(server_id), json.dumps([str(creator_id)]),
+                   json.dumps([]), datetime.now().isoformat()))
+
+    @staticmethod
+    def _for_server(c, server_id):
+        c.execute("SELECT playlist_id, name, creator_id FROM playlists WHERE server_id = ?", (str(server_id),))
+        return [Playlist(*row) for row in c.fetchall()]
+
+    @staticmethod
+    def _add_song(c, playlist_id, user_id, song):
+        row = c.execute("SELECT name, contributors, songs FROM playlists WHERE playlist_id = ?",
+                        (playlist_id,)).fetchone()
+        if not row:
+            return None
+        name, contributors, songs = row
+        contributors = json.loads(contributors or "[]")
+        songs = json.loads(songs or "[]")
+        if str(user_id) not in contributors:
+            contributors.append(str(user_id))
+        key = track_key(song['title'], song['artist'])
+        if not any(isinstance(item, dict) and track_key(item.get('title', ''), item.get('artist', '')) == key
+                   for item in songs):
+            songs.append(song)
+        c.execute("UPDATE playlists SET contributors = ?, songs = ? WHERE playlist_id = ?",
+                  (json.dumps(contributors), json.dumps(songs), playlist_id))
+        index_tracks(c, [(song['title'], song['artist'], song.get('album'), song.get('spotify_url'), "")])
+        return name
+
+    @timed('playlist_create', metric='db_query_duration_seconds')
+    async def create(self, playlist_id, name, creator_id, server_id):
+        await self.database.run(self._create, playlist_id, name, creator_id, server_id)
+
+    @timed('playlist_for_server', metric='db_query_duration_seconds')
+    async def for_server(self, server_id):
+        return await self.database.run(self._for_server, server_id)
+
+    @timed('playlist_add_song', metric='db_query_duration_seconds')
+    async def add_song(self, playlist_id, user_id, song):
+        """Append a {title, artist, album, spotify_url} song to a playlist; returns the playlist name or None"""
+        return await self.database.run(self._add_song, playlist_id, user_id, song)
+
+
+class ShareRepository:
+    def __init__(self, database):
+        self.database = database
+
+    @staticmethod
+    def _add(c, share_id, user_id, title, artist, server_id, channel_id):
+        c.execute("INSERT INTO shared_music VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                  (share_id, str(user_id), title, artist, datetime.now().isoformat(), 0,
+                   str(server_id), str(channel_id)))
+        index_tracks(c, [(title, artist, "", "", "")])
+
+    @staticmethod
+    def _like(c, share_id, user_id):
+        c.execute("INSERT OR IGNORE INTO share_likes VALUES (?, ?)", (share_id, str(user_id)))
+        if not c.rowcount:
+            return False
+        c.execute("UPDATE shared_music SET likes = likes + 1 WHERE share_id = ?", (share_id,))
+        return True
+
+    @timed('share_add', metric='db_query_duration_seconds')
+    async def add(self, share_id, user_id, title, artist, server_id, channel_id):
+        await self.database.run(self._add, share_id, user_id, title, artist, server_id, channel_id)
+
+    @timed('share_like', metric='db_query_duration_seconds')
+    async def like(self, share_id, user_id):
+        """Count a user's like on a share once; returns False if they had already liked it"""
+        return await self.database.run(self._like, share_id, user_id)
+
+
+class LikeRepository:
+    def __init__(self, database):
+        self.database = database
+
+    @staticmethod
+    def _add(c, user_id, title, artist, spotify_url):
+        c.execute("INSERT OR IGNORE INTO track_likes VALUES (?, ?, ?, ?, ?, ?)",
+                  (str(user_id), track_key(title, artist), title, artist, spotify_url or "", int(time.time())))
+        return bool(c.rowcount)
+
+    @timed('like_add', metric='db_query_duration_seconds')
+    async def add(self, user_id, title, artist, spotify_url=""):
+        """Save a liked song for a user; returns False if they had already liked it"""
+        return await self.database.run(self._add, user_id, title, artist, spotify_url)
+
+
+database = Database()
+history = HistoryRepository(database)
+track_index = TrackRepository(database)
+playlists = PlaylistRepository(database)
+shares = ShareRepository(database)
+likes = LikeRepository(database)
@@ -0,0 +1,125 @@
+import json
+
+from normalize import tokenize, track_key
+
+
+# Query words shorter than this are matched exactly; typos in them are too ambiguous to correct
+MIN_CORRECTION_LENGTH = 4
+MIN_TERM_LENGTH = 3
+MAX_CORRECTIONS = 5
+
+
+def create_search_index(c):
+    """Create the full-text index over every track the bot has seen"""
+    # One row per distinct song, however many times it was identified, shared or added
+    c.execute('''CREATE TABLE IF NOT EXISTS known_tracks
+                 (id INTEGER PRIMARY KEY, track_key TEXT UNIQUE, title TEXT, artist TEXT, album TEXT,
+                  spotify_url TEXT, youtube_url TEXT, seen INTEGER DEFAULT 1)''')
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS known_tracks_fts USING fts5
+                 (title, artist, album, content='known_tracks', content_rowid='id',
+                  tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    # Keep the external-content FTS table in step with known_tracks
+    c.execute('''CREATE TRIGGER IF NOT EXISTS known_tracks_ai AFTER INSERT ON known_tracks BEGIN
+                 INSERT INTO known_tracks_fts (rowid, title, artist, album)
+                 VALUES (new.id, new.title, new.artist, new.album); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS known_tracks_ad AFTER DELETE ON known_tracks BEGIN
+                 INSERT INTO known_tracks_fts (known_tracks_fts, rowid, title, artist, album)
+                 VALUES ('delete', old.id, old.title, old.artist, old.album); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS known_tracks_au AFTER UPDATE OF title, artist, album ON known_tracks
+                 WHEN old.title IS NOT new.title OR old.artist IS NOT new.artist OR old.album IS NOT new.album
+                 BEGIN
+                 INSERT INTO known_tracks_fts (known_tracks_fts, rowid, title, artist, album)
+                 VALUES ('delete', old.id, old.title, old.artist, old.album);
+                 INSERT INTO known_tracks_fts (rowid, title, artist, album)
+                 VALUES (new.id, new.title, new.artist, new.album); END''')
+
+    # Vocabulary with single-deletion variants of each word, for typo-tolerant lookups
+    c.execute("CREATE TABLE IF NOT EXISTS search_terms (term TEXT PRIMARY KEY) WITHOUT ROWID")
+    c.execute('''CREATE TABLE IF NOT EXISTS search_term_deletes
+                 (variant TEXT, term TEXT, PRIMARY KEY (variant, term)) WITHOUT ROWID''')
+
+    if c.execute("SELECT 1 FROM known_tracks LIMIT 1").fetchone() is None:
+        backfill_search_index(c)
+
+
+def deletes(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def index_tracks(c, tracks):
+    """Add (title, artist, album, spotify_url, youtube_url) tracks to the index inside the caller's transaction"""
+    for title, artist, album, spotify_url, youtube_url in tracks:
+        if not title or not artist:
+            continue
+        c.execute("INSERT INTO known_tracks (track_key, title, artist, album, spotify_url, youtube_url) "
+                  "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(track_key) DO UPDATE SET seen = seen + 1, "
+                  "album = coalesce(nullif(album, ''), excluded.album), "
+                  "spotify_url = coalesce(nullif(spotify_url, ''), excluded.spotify_url), "
+                  "youtube_url = coalesce(nullif(youtube_url, ''), excluded.youtube_url)",
+                  (track_key(title, artist), title, artist, album or "", spotify_url or "", youtube_url or ""))
+
+        for word in set(tokenize(f"{title} {artist} {album or ''}")):
+            if len(word) < MIN_TERM_LENGTH:
+                continue
+            c.execute("INSERT OR IGNORE INTO search_terms VALUES (?)", (word,))
+            if c.rowcount:
+                c.executemany("INSERT OR IGNORE INTO search_term_deletes VALUES (?, ?)",
+                              [(variant, word) for variant in deletes(word)])
+
+
+def backfill_search_index(c):
+    """Index the tracks already stored in history, shares, playlists and the ISRC table"""
+    # Read through a second cursor so large tables stream instead of loading at once
+    source = c.connection.cursor()
+    index_tracks(c, source.execute("SELECT song_title, artist, '', spotify_url, youtube_url FROM user_history"))
+    index_tracks(c, source.execute("SELECT song_title, artist, '', '', '' FROM shared_music"))
+    index_tracks(c, source.execute("SELECT title, artist, '', '', '' FROM tracks"))
+    for (songs,) in source.execute("SELECT songs FROM playlists"):
+        index_tracks(c, [(song.get('title'), song.get('artist'), song.get('album'), song.get('spotify_url'), "")
+                         for song in json.loads(songs or "[]") if isinstance(song, dict)])
+
+
+def corrections(c, word):
+    """Known words within one edit of `word` (SymSpell-style lookup through the deletes table)"""
+    if c.execute("SELECT 1 FROM search_terms WHERE term = ?", (word,)).fetchone():
+        return [word]
+    variants = deletes(word)
+    placeholders = ",".join("?" * len(variants))
+    # Covers a dropped, an extra and a substituted or swapped letter
+    c.execute(f"SELECT term FROM search_terms WHERE term IN ({placeholders}) "
+              f"UNION SELECT term FROM search_term_deletes WHERE variant = ? "
+              f"UNION SELECT term FROM search_term_deletes WHERE variant IN ({placeholders}) "
+              f"LIMIT {MAX_CORRECTIONS}",
+              (*variants, word, *variants))
+    return [word] + [term for (term,) in c.fetchall() if term != word]
+
+
+def match_expression(c, column, text, prefix_last=False):
+    """FTS5 expression matching every word of `text` in `column`, allowing typos and a trailing prefix"""
+    words = tokenize(text)
+    groups = []
+    for position, word in enumerate(words):
+        terms = [f'"{term}"' for term in (corrections(c, word) if len(word) >= MIN_CORRECTION_LENGTH else [word])]
+        # The last word may still be being typed
+        if prefix_last and position == len(words) - 1:
+            terms[0] += "*"
+        groups.append("(" + " OR ".join(terms) + ")")
+    return f"{column} : (" + " AND ".join(groups) + ")" if groups else None
+
+
+def search_tracks(c, song, artist=None, album=None, limit=10):
+    """Best known tracks for a song/artist/album query, most relevant and most seen first"""
+    expressions = [match_expression(c, 'title', song, prefix_last=True)]
+    if artist:
+        expressions.append(match_expression(c, 'artist', artist, prefix_last=True))
+    if album:
+        expressions.append(match_expression(c, 'album', album, prefix_last=True))
+    expressions = [expression for expression in expressions if expression]
+    if not expressions:
+        return []
+
+    c.execute("SELECT known_tracks.title, known_tracks.artist, known_tracks.album, spotify_url, youtube_url "
+              "FROM known_tracks_fts JOIN known_tracks ON known_tracks.id = known_tracks_fts.rowid "
+              "WHERE known_tracks_fts MATCH ? ORDER BY bm25(known_tracks_fts, 10.0, 5.0, 1.0), seen DESC LIMIT ?",
+              (" AND ".join(expressions), limit))
+    return c.fetchall()
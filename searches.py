@@ -1,58 +1,181 @@
 import aiohttp
 import asyncio
-import urllib.parse
+import collections
+import html
 from providers.spotify import get_spotify_token
+from providers.apple import search_apple_tracks, apple_row
+from providers.yandex import search_yandex_tracks, yandex_row, yandex_available
+from metrics import http_tracing, timed
+from parser import parse_seconds
+from normalize import CHANNEL_SUFFIX_RE, title_tokens, artist_tokens, same_artist
+from track_ids import known_track, remember_results
+from repository import track_index
 
 
 from settings import MusicRecognitionBot
 
 bot_settings = MusicRecognitionBot()
 
+PLATFORM_ORDER = ('spotify', 'apple', 'youtube', 'yandex')
+
+
+def platform_enabled(name):
+    """Whether a platform passed its startup probe; only Yandex needs an account to search"""
+    return name != 'yandex' or bool(yandex_available())
+
+
+def target_platforms(search_params):
+    """Platforms a query searches, every enabled one unless it names one"""
+    return [name for name in PLATFORM_ORDER if platform_enabled(name) and
+            (not search_params.platform or search_params.platform == name)]
+
+
+def platform_searches(search_params):
+    """Provider search coroutines for the platforms a query targets"""
+    searches = {
+        'spotify': search_spotify,
+        'apple': search_apple,
+        'youtube': search_youtube,
+        'yandex': search_yandex_music,
+    }
+    return {name: searches[name](search_params) for name in target_platforms(search_params)}
+
+
+async def local_results(search_params):
+    """Matches from the local full-text index, shaped like provider results"""
+    if not search_params.song:
+        return []
+    results = []
+    for title, artist, album, spotify_url, youtube_url in await track_index.search(
+            search_params.song, search_params.artist, search_params.album, limit=search_params.limit):
+        result = {'title': title, 'artist': artist, 'album': album, 'spotify_url': spotify_url,
+                  'youtube_url': youtube_url, 'source_platform': 'local'}
+        if search_params.platform and not result.get(f"{search_params.platform}_url"):
+            continue
+        if search_params.accepts(result):
+            results.append(result)
+    return results
+
+
+async def tagged_search(platform_name, search):
+    try:
+        return platform_name, await search
+    except Exception as e:
+        print(f"{platform_name} search error: {e}")
+        return platform_name, []
+
+
+async def stream_all_platforms(search_params):
+    """Search every platform concurrently, yielding (platform, merged rows) as each one returns
+
+    A song already in the ISRC index is answered from it in one lookup, without provider calls.
+    """
+    if search_params.song and search_params.artist:
+        known = await known_track(title=search_params.song, artist=search_params.artist)
+        if known and search_params.accepts(known) and \
+                (not search_params.platform or search_params.platform in known['platforms']):
+            yield 'index', [known]
+            return
+
+    # Songs the bot has already seen answer instantly; providers enrich them and fill the gaps
+    merger = ResultMerger()
+    local = await local_results(search_params)
+    if local:
+        merger.add(local)
+        yield 'local', merger.rows()
+        if len(local) >= search_params.limit and all(row.get('spotify_url') or row.get('youtube_url')
+                                                      for row in local):
+            return
+
+    tasks = [asyncio.ensure_future(tagged_search(name, search))
+             for name, search in platform_searches(search_params).items()]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            platform_name, platform_results = await finished
+            for result in platform_results:
+                result['source_platform'] = platform_name
+            # Album, duration and explicit filters aren't supported by every provider's API
+            merger.add([result for result in platform_results if search_params.accepts(result)])
+            yield platform_name, merger.rows()
+        # Cross-platform links found by this search make the next one a single lookup
+        await remember_results(merger.rows())
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
 async def search_all_platforms(search_params):
     """Search across multiple music platforms or specific platform"""
     results = []
+    async for _, results in stream_all_platforms(search_params):
+        pass
+    return results
 
-    # Check if user specified a platform
-    target_platform = search_params.get('platform')
 
-    # Create search tasks based on platform filter
-    tasks = []
+MERGE_THRESHOLD = 0.6
 
-    if not target_platform or target_platform == 'spotify':
-        tasks.append(('spotify', search_spotify(search_params)))
 
-    if not target_platform or target_platform == 'youtube':
-        tasks.append(('youtube', search_youtube(search_params)))
+def platform_rank(platform):
+    return PLATFORM_ORDER.index(platform) if platform in PLATFORM_ORDER else len(PLATFORM_ORDER)
 
-    if not target_platform or target_platform == 'yandex':
-        tasks.append(('yandex', search_yandex_music(search_params)))
 
-    # Execute searches concurrently
-    platform_results = await asyncio.gather(*[task[1] for task in tasks], return_exceptions=True)
+class ResultMerger:
+    """Clusters results for the same song across platforms into one row, one batch at a time
 
-    # Combine results with platform info
-    for i, platform_result in enumerate(platform_results):
-        if isinstance(platform_result, list):
-            platform_name = tasks[i][0]
-            for result in platform_result:
-                result['source_platform'] = platform_name
-            results.extend(platform_result)
+    Titles are normalized and compared by token overlap (Jaccard). An inverted index from
+    token to cluster means each result is only compared with clusters it shares a word
+    with, so merging stays close to linear in the number of results.
+    """
+
+    def __init__(self):
+        self.clusters = []
+        self.index = collections.defaultdict(list)
+
+    def add(self, results):
+        for position, result in enumerate(results):
+            tokens = title_tokens(result['title'])
+            artists = artist_tokens(result['artist'])
+            # Rows sort by platform, then by the provider's own ranking, whatever order platforms answer in
+            rank = (platform_rank(result.get('source_platform')), position)
+
+            candidates = {cluster for token in tokens for cluster in self.index.get(token, ())}
+            best, best_score = None, MERGE_THRESHOLD
+            for cluster in sorted(candidates):
+                cluster_tokens, cluster_artists, _, _ = self.clusters[cluster]
+                score = len(tokens & cluster_tokens) / len(tokens | cluster_tokens)
+                if score >= best_score and same_artist(artists, cluster_artists):
+                    best, best_score = cluster, score
 
-    # Remove duplicates and sort by relevance
-    unique_results = []
-    seen = set()
+            if best is None:
+                row = dict(result, platforms=[result.get('source_platform')])
+                for token in tokens:
+                    self.index[token].append(len(self.clusters))
+                self.clusters.append((tokens, artists or set(), rank, row))
+                continue
 
-    for result in results:
-        # Create a unique key based on title and artist
-        key = f"{result['title'].lower()}-{result['artist'].lower()}"
-        if key not in seen:
-            seen.add(key)
-            unique_results.append(result)
+            cluster_tokens, cluster_artists, cluster_rank, row = self.clusters[best]
+            # The highest ranked platform's metadata wins; the others add their links and fill gaps
+            overwrite = rank < cluster_rank
+            for key, value in result.items():
+                if value and (overwrite or not row.get(key) or row[key] == 'Unknown'):
+                    row[key] = value
+            if result.get('source_platform') not in row['platforms']:
+                row['platforms'].append(result.get('source_platform'))
+                row['platforms'].sort(key=platform_rank)
+            self.clusters[best] = (cluster_tokens, cluster_artists or artists, min(rank, cluster_rank), row)
 
-    return unique_results
+    def rows(self):
+        return [row for _, _, _, row in sorted(self.clusters, key=lambda cluster: cluster[2])]
 
 
+def merge_results(results):
+    """Merge a finished list of results into one row per song"""
+    merger = ResultMerger()
+    merger.add(results)
+    return merger.rows()
+
+
+@timed('search_all', metric='provider_duration_seconds', provider='spotify')
 async def search_spotify(search_params):
     """Search Spotify API with real API calls"""
     try:
@@ -61,17 +184,21 @@ async def search_spotify(search_params):
         if not access_token:
             return []
 
-        # Build search query
+        # Push filters into Spotify's field filters instead of filtering the results here
         query_parts = []
-        if search_params.get('song'):
-            query_parts.append(search_params['song'])
-        if search_params.get('artist'):
-            query_parts.append(search_params['artist'])
+        if search_params.song:
+            query_parts.append(f'track:"{search_params.song}"')
+        if search_params.artist:
+            query_parts.append(f'artist:"{search_params.artist}"')
+        if search_params.album:
+            query_parts.append(f'album:"{search_params.album}"')
+        if search_params.year:
+            query_parts.append(f"year:{search_params.year}")
 
         search_query = " ".join(query_parts)
 
         # Make actual API call
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
             headers = {
                 'Authorization': f'Bearer {access_token}',
                 'Content-Type': 'application/json'
@@ -83,10 +210,6 @@ async def search_spotify(search_params):
                 'limit': 10
             }
 
-            # Add year filter if specified
-            if search_params.get('year'):
-                params['q'] += f" year:{search_params['year']}"
-
             url = 'https://api.spotify.com/v1/search'
 
             async with session.get(url, headers=headers, params=params) as response:
@@ -95,12 +218,6 @@ async def search_spotify(search_params):
                     results = []
 
                     for track in data.get('tracks', {}).get('items', []):
-                        # Filter by artist if specified
-                        if search_params.get('artist'):
-                            artist_names = [artist['name'].lower() for artist in track['artists']]
-                            if not any(search_params['artist'].lower() in name for name in artist_names):
-                                continue
-
                         # Convert duration from ms to mm:ss
                         duration_ms = track.get('duration_ms', 0)
                         duration_min = duration_ms // 60000
@@ -117,7 +234,11 @@ async def search_spotify(search_params):
                             'album': track.get('album', {}).get('name', 'Unknown'),
                             'year': year,
                             'duration': duration_str,
+                            'duration_seconds': duration_ms // 1000,
+                            'explicit': track.get('explicit'),
                             'spotify_url': track.get('external_urls', {}).get('spotify', ''),
+                            'spotify_id': track.get('id'),
+                            'isrc': track.get('external_ids', {}).get('isrc'),
                             'preview_url': track.get('preview_url')
                         })
 
@@ -131,6 +252,51 @@ async def search_spotify(search_params):
         return []
 
 
+@timed('search_all', metric='provider_duration_seconds', provider='apple')
+async def search_apple(search_params):
+    """Search Apple Music through the iTunes Search API"""
+    try:
+        # iTunes takes a single search term; album and year are checked on the results
+        search_query = " ".join(part for part in (search_params.song, search_params.artist, search_params.album)
+                                if part)
+        if not search_query:
+            return []
+
+        results = []
+        for track in await search_apple_tracks(search_query, limit=10):
+            row = apple_row(track)
+            if search_params.year and row['year'] != search_params.year:
+                continue
+            results.append(row)
+        return results
+
+    except Exception as e:
+        print(f"Apple Music search error: {e}")
+        return []
+
+
+VIDEO_TITLE_SEPARATORS = (' - ', ' – ', ' — ')
+
+
+def split_video_title(video_title, channel):
+    """(title, artist) of a music video from its "Artist - Title (Official Video)" title
+
+    The version suffix is kept; ResultMerger normalizes it away when comparing titles.
+    Titles without a separator are credited to the channel, minus "VEVO" or " - Topic".
+    """
+    video_title = html.unescape(video_title).strip()
+    # Split at the first separator, later ones belong to version suffixes like "- Remastered 2011"
+    positions = [(video_title.find(separator), separator) for separator in VIDEO_TITLE_SEPARATORS
+                 if video_title.find(separator) > 0]
+    if positions:
+        position, separator = min(positions)
+        artist, title = video_title[:position].strip(), video_title[position + len(separator):].strip()
+        if title:
+            return title, artist
+    return video_title, CHANNEL_SUFFIX_RE.sub("", html.unescape(channel).strip()) or channel
+
+
+@timed('search_all', metric='provider_duration_seconds', provider='youtube')
 async def search_youtube(search_params):
     """Search YouTube API with real API calls"""
     try:
@@ -142,14 +308,14 @@ async def search_youtube(search_params):
 
         # Build search query
         query_parts = []
-        if search_params.get('song'):
-            query_parts.append(search_params['song'])
-        if search_params.get('artist'):
-            query_parts.append(search_params['artist'])
+        if search_params.song:
+            query_parts.append(search_params.song)
+        if search_params.artist:
+            query_parts.append(search_params.artist)
 
         search_query = " ".join(query_parts)
 
-        async with aiohttp.ClientSession() as session:
+        async with aiohttp.ClientSession(trace_configs=[http_tracing]) as session:
             params = {
                 'part': 'snippet',
                 'q': search_query,
@@ -159,6 +325,13 @@ async def search_youtube(search_params):
                 'key': YOUTUBE_API_KEY
             }
 
+            # YouTube only filters by coarse duration buckets: short < 4 min, medium 4-20 min
+            if search_params.max_duration is not None and search_params.max_duration < 240:
+                params['videoDuration'] = 'short'
+            elif search_params.min_duration is not None and search_params.min_duration >= 240 and \
+                    search_params.max_duration is not None and search_params.max_duration <= 1200:
+                params['videoDuration'] = 'medium'
+
             url = 'https://www.googleapis.com/youtube/v3/search'
 
             async with session.get(url, params=params) as response:
@@ -173,19 +346,22 @@ async def search_youtube(search_params):
                         channel = item['snippet']['channelTitle']
 
                         # Filter by artist if specified
-                        if search_params.get('artist'):
-                            if search_params['artist'].lower() not in title.lower() and \
-                                    search_params['artist'].lower() not in channel.lower():
+                        if search_params.artist:
+                            if search_params.artist.lower() not in title.lower() and \
+                                    search_params.artist.lower() not in channel.lower():
                                 continue
 
                         # Get video duration (requires additional API call)
                         duration = await get_youtube_duration(video_id, YOUTUBE_API_KEY, session)
 
+                        video_title, video_artist = split_video_title(title, channel)
                         results.append({
-                            'title': search_params.get('song', title.split('-')[0].strip() if '-' in title else title),
-                            'artist': search_params.get('artist', channel),
+                            'title': video_title,
+                            'artist': video_artist,
                             'duration': duration,
+                            'duration_seconds': parse_seconds(duration) if duration != "Unknown" else None,
                             'youtube_url': f"https://www.youtube.com/watch?v={video_id}",
+                            'youtube_id': video_id,
                             'thumbnail': item['snippet']['thumbnails']['default']['url']
                         })
 
@@ -229,32 +405,22 @@ async def get_youtube_duration(video_id, api_key, session):
     return "Unknown"
 
 
+@timed('search_all', metric='provider_duration_seconds', provider='yandex')
 async def search_yandex_music(search_params):
     """Search Yandex Music"""
     try:
-        # Build search query
-        query_parts = []
-        if search_params.get('song'):
-            query_parts.append(search_params['song'])
-        if search_params.get('artist'):
-            query_parts.append(search_params['artist'])
-
-        search_query = " ".join(query_parts)
-
-        # Note: You'll need Yandex Music API access for actual implementation
-        # This is a placeholder
+        search_query = " ".join(part for part in (search_params.song, search_params.artist) if part)
+        if not search_query:
+            return []
 
         results = []
-        if search_query:
-            results.append({
-                'title': search_params.get('song', 'Unknown'),
-                'artist': search_params.get('artist', 'Unknown'),
-                'duration': '3:45',
-                'yandex_url': f"https://music.yandex.com/search?text={urllib.parse.quote(search_query)}"
-            })
-
+        for track in await search_yandex_tracks(search_query, limit=10):
+            row = yandex_row(track)
+            if search_params.year and row['year'] != search_params.year:
+                continue
+            results.append(row)
         return results
 
     except Exception as e:
         print(f"Yandex Music search error: {e}")
-        return []
\ No newline at end of file
+        return []
@@ -3,15 +3,55 @@ import discord
 from discord.ext import commands
 
 from db import init_db
+from metrics import start_metrics_server
+from loop_monitor import LoopMonitor
+from providers.apple import close_apple_session
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
-class MusicRecognitionBot(commands.Bot):
+def get_shard_config():
+    """Shard layout from SHARD_COUNT and SHARD_IDS (e.g. "0,1,2"), as set by shard_launcher.py"""
+    config = {}
+    if os.getenv('SHARD_COUNT'):
+        config['shard_count'] = int(os.getenv('SHARD_COUNT'))
+    if os.getenv('SHARD_IDS'):
+        config['shard_ids'] = [int(shard_id) for shard_id in os.getenv('SHARD_IDS').split(',')]
+    return config
+
+
+def get_gateway_config():
+    """Intents and cache settings from GATEWAY_INTENTS: "minimal" (default) or "all"
+
+    Minimal mode only subscribes to what the commands use (prefix commands and voice
+    for !listen; buttons arrive as interactions without any intent), caches no members
+    except those in voice, and keeps at most MESSAGE_CACHE_SIZE messages.
+    """
+    if os.getenv('GATEWAY_INTENTS', 'minimal') == 'all':
+        return {'intents': discord.Intents.all()}
+
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+    intents.message_content = True
+    intents.voice_states = True
+
+    member_cache_flags = discord.MemberCacheFlags.none()
+    member_cache_flags.voice = True
+
+    return {
+        'intents': intents,
+        'member_cache_flags': member_cache_flags,
+        'chunk_guilds_at_startup': False,
+        'max_messages': int(os.getenv('MESSAGE_CACHE_SIZE', '200')),
+    }
+
+
+class MusicRecognitionBot(commands.AutoShardedBot):
     def __init__(self):
-        intents = discord.Intents.all()
-        super().__init__(command_prefix='/', intents=intents)
+        super().__init__(command_prefix='/', **get_gateway_config(), **get_shard_config())
         self.acrcloud_host = 'identify-ap-southeast-1.acrcloud.com'
         self.acrcloud_access_key = os.getenv('ACRCLOUD_ACCESS_KEY')
         self.acrcloud_access_secret = os.getenv('ACRCLOUD_ACCESS_SECRET')
@@ -19,11 +59,41 @@ class MusicRecognitionBot(commands.Bot):
         self.spotify_client_secret = os.getenv('SPOTIFY_CLIENT_SECRET')
         self.youtube_api_key = os.getenv('YOUTUBE_API_KEY')
         self.lastfm_api_key = os.getenv('LASTFM_API_KEY')
-        self.yandex_client_id = os.getenv('YANDEX_CLIENT_ID')
-        self.yandex_client_secret = os.getenv('YANDEX_CLIENT_SECRET')
+        self.yandex_music_token = os.getenv('YANDEX_MUSIC_TOKEN')
+        self.metrics_port = os.getenv('METRICS_PORT')
+        # Set by shard_launcher.py so its processes don't all bind the same metrics port
+        self.process_index = int(os.getenv('PROCESS_INDEX', '0'))
+        self.loop_monitor = LoopMonitor(threshold=int(os.getenv('LOOP_STALL_THRESHOLD_MS', '250')) / 1000)
+        self.before_invoke(self.track_command_start)
+        self.after_invoke(self.track_command_end)
 
         init_db()
 
+    async def setup_hook(self):
+        # Imported here to avoid a cycle, these modules import providers that import this one
+        from jobs import jobs
+        from views import register_views
+        from providers.yandex import probe_yandex
+
+        self.loop_monitor.start()
+        jobs.start()
+        register_views(self)
+        await probe_yandex()
+        if self.metrics_port:
+            await start_metrics_server(port=int(self.metrics_port) + self.process_index)
+
+    async def close(self):
+        from providers.yandex import close_yandex_session
+        await close_apple_session()
+        await close_yandex_session()
+        await super().close()
+
+    async def track_command_start(self, ctx):
+        self.loop_monitor.command_started(ctx)
+
+    async def track_command_end(self, ctx):
+        self.loop_monitor.command_finished(ctx)
+
     async def on_ready(self):
         print(f'{self.user} is ready to recognize music!')
         await self.change_presence(
@@ -0,0 +1,69 @@
+"""Run the bot as several shard processes
+
+Every process runs an AutoShardedBot for its slice of the shards. Caches, the Spotify
+token and rate limits go through the shared state backend (STATE_BACKEND/STATE_URL),
+and all processes write history to the same DATABASE_PATH. With METRICS_PORT set,
+process N serves /metrics on METRICS_PORT + N.
+
+Single host only: history, playlists and the track index live in a local SQLite file,
+so every shard has to run on the machine that holds it.
+
+    python shard_launcher.py --shard-count 8 --processes 4
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+
+def run_shards(shard_ids, shard_count, process_index):
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    os.environ['SHARD_IDS'] = ','.join(str(shard_id) for shard_id in shard_ids)
+    # Each process serves /metrics on METRICS_PORT + its index
+    os.environ['PROCESS_INDEX'] = str(process_index)
+
+    import main
+    print(f"Starting shards {shard_ids} of {shard_count}")
+    main.bot.run(main.TOKEN)
+
+
+def split_shards(shard_ids, processes):
+    """Spread shard ids over processes as evenly as possible"""
+    groups = [shard_ids[i::processes] for i in range(processes)]
+    return [group for group in groups if group]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several shard processes")
+    parser.add_argument('--shard-count', type=int, required=True, help="total shards")
+    parser.add_argument('--processes', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    shard_ids = list(range(args.shard_count))
+
+    context = multiprocessing.get_context('spawn')
+    groups = split_shards(shard_ids, args.processes)
+    processes = {}
+    indexes = {}
+    for index, group in enumerate(groups):
+        indexes[tuple(group)] = index
+        processes[tuple(group)] = context.Process(target=run_shards, args=(group, args.shard_count, index))
+        processes[tuple(group)].start()
+
+    # Restart crashed shard processes so one bad process doesn't take its guilds offline
+    try:
+        while True:
+            time.sleep(5)
+            for group, process in processes.items():
+                if not process.is_alive():
+                    print(f"Shard process {list(group)} exited with {process.exitcode}, restarting")
+                    processes[group] = context.Process(target=run_shards,
+                                                       args=(list(group), args.shard_count, indexes[group]))
+                    processes[group].start()
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Expired keys are deleted on write, at most this often
+PURGE_INTERVAL = 60
+
+
+class SQLiteState:
+    """Shared key/value state in a local SQLite file
+
+    Enough when every shard process runs on the same machine, which shard_launcher.py requires.
+    """
+
+    def __init__(self, path='bot_state.db'):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_state_expires ON state (expires_at)")
+        self.next_purge = 0.0
+
+    def _purge_expired(self, now):
+        # Called with the lock held; per-minute rate limit keys would otherwise pile up forever
+        if now >= self.next_purge:
+            self.next_purge = now + PURGE_INTERVAL
+            self.conn.execute("DELETE FROM state WHERE expires_at < ?", (now,))
+
+    def _get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+        if not row or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key, value, ttl):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self.lock:
+            self._purge_expired(now)
+            self.conn.execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?)", (key, json.dumps(value), expires_at))
+
+    def _incr(self, key, ttl):
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self.lock:
+            self._purge_expired(now)
+            # Expired counters restart at 1 with a fresh expiry
+            row = self.conn.execute(
+                "INSERT INTO state VALUES (?, '1', ?) ON CONFLICT(key) DO UPDATE SET "
+                "value = CASE WHEN expires_at < ? THEN '1' ELSE CAST(value AS INTEGER) + 1 END, "
+                "expires_at = CASE WHEN expires_at < ? THEN excluded.expires_at ELSE expires_at END "
+                "RETURNING value",
+                (key, expires_at, now, now)).fetchone()
+        return int(row[0])
+
+    def _delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key, value, ttl=None):
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def incr(self, key, ttl=None):
+        return await asyncio.to_thread(self._incr, key, ttl)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._delete, key)
+
+
+class RedisState:
+    """Shared key/value state in Redis, kept out of the bot processes so it survives their restarts"""
+
+    def __init__(self, url):
+        # Requires: pip install redis
+        import redis.asyncio as redis
+        self.redis = redis.from_url(url)
+
+    async def get(self, key):
+        value = await self.redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key, value, ttl=None):
+        await self.redis.set(key, json.dumps(value), ex=ttl)
+
+    async def incr(self, key, ttl=None):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(key)
+            if ttl:
+                pipe.expire(key, ttl, nx=True)
+            count, *_ = await pipe.execute()
+        return count
+
+    async def delete(self, key):
+        await self.redis.delete(key)
+
+
+_state = None
+
+
+def get_state():
+    """Get the configured state backend: STATE_BACKEND=sqlite (default) or redis"""
+    global _state
+    if _state is None:
+        if os.getenv('STATE_BACKEND', 'sqlite') == 'redis':
+            _state = RedisState(os.getenv('STATE_URL', 'redis://localhost:6379/0'))
+        else:
+            _state = SQLiteState(os.getenv('STATE_URL', 'bot_state.db'))
+    return _state
+
+
+async def is_rate_limited(key, limit, window):
+    """Count a hit against `key` and tell whether it went over `limit` per `window` seconds, across shards"""
+    bucket = int(time.time() // window)
+    count = await get_state().incr(f"ratelimit:{key}:{bucket}", ttl=window * 2)
+    return count > limit
@@ -0,0 +1,197 @@
+import collections
+import heapq
+from array import array
+
+from db import connect
+from normalize import tokenize
+
+
+# Discord shows at most 25 autocomplete choices, each at most 100 characters
+MAX_SUGGESTIONS = 25
+MAX_CHOICE_LENGTH = 100
+# Word starts are stored as an offset in the low byte of each key
+MAX_OFFSET = 0xFF
+# Prefixes this short match too many entries to rank on every keystroke, their top entries are kept up to date
+SHORT_PREFIX = 2
+
+
+class PrefixIndex:
+    """Sorted-array prefix index that matches the start of any word of an entry
+
+    Each key packs an entry id and the offset of a word start into one integer, sorted
+    by the entry's text from that offset. A lookup binary-searches the block of keys
+    starting with the typed prefix and keeps the highest weighted entries in it.
+    """
+
+    def __init__(self):
+        self.texts = []
+        self.labels = []
+        self.values = []
+        self.weights = []
+        self.positions = {}
+        self.keys = array('Q')
+        self.top = {}
+
+    def __len__(self):
+        return len(self.texts)
+
+    def key_text(self, key):
+        return self.texts[key >> 8][key & MAX_OFFSET:]
+
+    def find(self, prefix):
+        low, high = 0, len(self.keys)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key_text(self.keys[middle]) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def word_starts(self, text):
+        return [0] + [i + 1 for i, char in enumerate(text[:MAX_OFFSET]) if char == " "]
+
+    def short_prefixes(self, entry):
+        text = self.texts[entry]
+        return {""} | {text[offset:offset + length] for offset in self.word_starts(text)
+                       for length in range(1, SHORT_PREFIX)}
+
+    def update_top(self, entry):
+        weight = self.weights[entry]
+        for prefix in self.short_prefixes(entry):
+            top = self.top.get(prefix)
+            if top is None:
+                continue
+            if entry not in top:
+                if len(top) >= MAX_SUGGESTIONS and weight <= self.weights[top[-1]]:
+                    continue
+                top.append(entry)
+            top.sort(key=self.weights.__getitem__, reverse=True)
+            del top[MAX_SUGGESTIONS:]
+
+    def add(self, label, value=None, weight=1, keep_sorted=True):
+        """Add an entry, or add `weight` to it if it's already indexed"""
+        entry = self.positions.get(label)
+        if entry is not None:
+            self.weights[entry] += weight
+            self.update_top(entry)
+            return
+
+        text = " ".join(tokenize(label))
+        if not text:
+            return
+        entry = len(self.texts)
+        self.positions[label] = entry
+        self.texts.append(text)
+        self.labels.append(label[:MAX_CHOICE_LENGTH])
+        self.values.append(label if value is None else value)
+        self.weights.append(weight)
+
+        for offset in self.word_starts(text):
+            key = entry << 8 | offset
+            if keep_sorted:
+                self.keys.insert(self.find(self.key_text(key)), key)
+            else:
+                self.keys.append(key)
+        if keep_sorted:
+            self.update_top(entry)
+
+    def sort(self):
+        """Sort keys once after a bulk load done with keep_sorted=False"""
+        self.keys = array('Q', sorted(self.keys, key=self.key_text))
+        self.top = {}
+
+    def rank(self, prefix):
+        if prefix:
+            start = self.find(prefix)
+            end = self.find(prefix + "\U0010ffff")
+            candidates = {key >> 8 for key in self.keys[start:end]}
+        else:
+            candidates = range(len(self.texts))
+        return heapq.nlargest(MAX_SUGGESTIONS, candidates, key=self.weights.__getitem__)
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        """(label, value) of the highest weighted entries with a word starting with `prefix`"""
+        prefix = " ".join(tokenize(prefix))
+        if len(prefix) < SHORT_PREFIX:
+            if prefix not in self.top:
+                self.top[prefix] = self.rank(prefix)
+            best = self.top[prefix]
+        else:
+            best = self.rank(prefix)
+        return [(self.labels[entry], self.values[entry]) for entry in best[:limit]]
+
+
+class Suggestions:
+    """In-memory autocomplete sources for the slash commands"""
+
+    def __init__(self):
+        self.tracks = PrefixIndex()
+        self.history = collections.defaultdict(PrefixIndex)
+        self.genres = collections.defaultdict(PrefixIndex)
+        self.playlists = collections.defaultdict(PrefixIndex)
+        self.loaded = False
+
+    def load(self):
+        """Build every index from the database; runs in a thread at startup"""
+        tracks = PrefixIndex()
+        history = collections.defaultdict(PrefixIndex)
+        genres = collections.defaultdict(PrefixIndex)
+        playlists = collections.defaultdict(PrefixIndex)
+
+        conn = connect()
+        c = conn.cursor()
+        for title, artist, seen in c.execute("SELECT title, artist, seen FROM known_tracks"):
+            tracks.add(f"{title} - {artist}", (title, artist), weight=seen, keep_sorted=False)
+        for user_id, title, artist, genre, count in c.execute(
+                "SELECT user_id, song_title, artist, genre, COUNT(*) FROM user_history "
+                "GROUP BY user_id, song_title, artist"):
+            history[user_id].add(f"{title} - {artist}", (title, artist), weight=count, keep_sorted=False)
+            if genre:
+                genres[user_id].add(genre, weight=count, keep_sorted=False)
+        for server_id, name in c.execute("SELECT server_id, name FROM playlists"):
+            playlists[server_id].add(name, keep_sorted=False)
+        conn.close()
+
+        for index in [tracks, *history.values(), *genres.values(), *playlists.values()]:
+            index.sort()
+        # Rank the busiest prefixes now rather than on someone's first keystroke
+        for prefix in ["", *"abcdefghijklmnopqrstuvwxyz0123456789"]:
+            tracks.search(prefix)
+        # Swap in whole indexes so lookups never see a half-built one
+        self.tracks, self.history, self.genres, self.playlists = tracks, history, genres, playlists
+        self.loaded = True
+
+    def add_popular(self, title, artist):
+        self.tracks.add(f"{title} - {artist}", (title, artist))
+
+    def add_track(self, user_id, title, artist, genre=""):
+        self.add_popular(title, artist)
+        self.history[str(user_id)].add(f"{title} - {artist}", (title, artist))
+        if genre:
+            self.genres[str(user_id)].add(genre)
+
+    def add_playlist(self, guild_id, name):
+        self.playlists[str(guild_id)].add(name)
+
+    def track_choices(self, user_id, current):
+        """(label, (title, artist)) for the user's own songs first, then popular ones"""
+        choices = self.history[str(user_id)].search(current) if str(user_id) in self.history else []
+        labels = {label for label, _ in choices}
+        for label, value in self.tracks.search(current):
+            if len(choices) >= MAX_SUGGESTIONS:
+                break
+            if label not in labels:
+                choices.append((label, value))
+        return choices[:MAX_SUGGESTIONS]
+
+    def genre_choices(self, user_id, current):
+        return [label for label, _ in self.genres[str(user_id)].search(current)] if str(user_id) in self.genres else []
+
+    def playlist_choices(self, guild_id, current):
+        if str(guild_id) not in self.playlists:
+            return []
+        return [label for label, _ in self.playlists[str(guild_id)].search(current)]
+
+
+suggestions = Suggestions()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the bot creates its databases; keep test runs out of the real ones
+_data_dir = tempfile.mkdtemp(prefix='music-bot-tests-')
+os.environ.setdefault('DATABASE_PATH', os.path.join(_data_dir, 'music_bot.db'))
+os.environ.setdefault('STATE_URL', os.path.join(_data_dir, 'bot_state.db'))
@@ -0,0 +1,46 @@
+import asyncio
+import io
+import json
+
+from db import init_db
+from history_io import ENRICH_BATCH, enrich_history, json_rows, listen_from_row, parse_lastfm_date, parse_played_at
+from repository import Listen, history
+
+
+# One scrobble as Last.fm's user.getRecentTracks JSON export writes it
+LASTFM_SCROBBLE = {
+    "artist": {"mbid": "", "#text": "Daft Punk"},
+    "album": {"mbid": "", "#text": "Discovery"},
+    "name": "One More Time",
+    "date": {"uts": "1581003842", "#text": "06 Feb 2020, 15:44"},
+}
+
+
+def test_lastfm_json_scrobble_keeps_its_play_time():
+    file = io.StringIO(json.dumps([LASTFM_SCROBBLE]))
+    listens = [listen_from_row(row, "1", "") for row in json_rows(file)]
+    assert len(listens) == 1
+    assert listens[0].title == "One More Time"
+    assert listens[0].artist == "Daft Punk"
+    assert listens[0].timestamp == 1581003842
+
+
+def test_lastfm_dates_with_and_without_comma():
+    assert parse_lastfm_date("06 Feb 2020, 15:44") == 1581003840
+    assert parse_lastfm_date("06 Feb 2020 15:44") == 1581003840
+    assert parse_played_at({"#text": "06 Feb 2020, 15:44"}) == 1581003840
+
+
+def test_enrichment_runs_one_batch_at_a_time():
+    async def run():
+        init_db()
+        await history.add_many([Listen("enrich", f"song {i:03d}", "Artist") for i in range(450)], index=False)
+        batches = []
+        after = ("", "")
+        while after is not None:
+            songs = []
+            after = await enrich_history("enrich", after, on_track=songs.append)
+            batches.append(len(songs))
+        return batches
+
+    assert asyncio.run(run()) == [ENRICH_BATCH, ENRICH_BATCH, 450 - 2 * ENRICH_BATCH, 0]
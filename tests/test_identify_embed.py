@@ -0,0 +1,28 @@
+from main import build_identify_embed, cached_identify_embed, identify_embed_key
+
+
+def known_track(**urls):
+    row = {'platforms': list(urls)}
+    row.update({f"{platform}_url": url for platform, url in urls.items()})
+    return row
+
+
+def test_platforms_without_url_get_no_link():
+    known = known_track(spotify="https://open.spotify.com/track/1", apple=None)
+    embed = build_identify_embed("Song", "Artist", "Album", "2020", known, None, "Spotify")
+    listen = next(field.value for field in embed.fields if field.name == "Listen")
+    assert listen == "[Spotify](https://open.spotify.com/track/1)"
+
+
+def test_new_platform_links_bypass_the_cached_embed():
+    before = known_track(spotify="https://open.spotify.com/track/2")
+    after = known_track(spotify="https://open.spotify.com/track/2", apple="https://music.apple.com/2")
+
+    def render(known):
+        return cached_identify_embed(identify_embed_key("USXXX0000002", known, "Spotify"),
+                                     lambda: build_identify_embed("Song", "Artist", "Album", "2020",
+                                                                  known, None, "Spotify"))
+
+    render(before)
+    listen = next(field.value for field in render(after).fields if field.name == "Listen")
+    assert "[Apple Music](https://music.apple.com/2)" in listen
@@ -0,0 +1,19 @@
+import asyncio
+
+import discord
+
+from jobs import deserialize, serialize
+from tracklist import TracklistView
+
+
+def test_tracklist_results_survive_the_delivery_outbox():
+    async def run():
+        pages = [discord.Embed(title=f"Page {i}", description=f"track {i}") for i in range(2)]
+        fields = deserialize(serialize({'content': "", 'embed': pages[0], 'view': TracklistView(pages, 7)}))
+        return fields
+
+    fields = asyncio.run(run())
+    assert fields['embed'].title == "Page 0"
+    assert isinstance(fields['view'], TracklistView)
+    assert [page.description for page in fields['view'].pages] == ["track 0", "track 1"]
+    assert fields['view'].author_id == 7
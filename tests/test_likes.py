@@ -0,0 +1,30 @@
+import asyncio
+
+from db import init_db
+from repository import database, history, likes, shares
+
+
+def share_likes(share_id):
+    def query(c):
+        c.execute("SELECT likes FROM shared_music WHERE share_id = ?", (share_id,))
+        return c.fetchone()[0]
+    return database.run(query)
+
+
+def test_share_likes_count_each_user_once():
+    async def run():
+        init_db()
+        await shares.add("1_1", "1", "Song", "Artist", "1", "1")
+        clicks = [await shares.like("1_1", "1"), await shares.like("1_1", "1"), await shares.like("1_1", "2")]
+        return clicks, await share_likes("1_1")
+
+    assert asyncio.run(run()) == ([True, False, True], 2)
+
+
+def test_track_likes_stay_out_of_history():
+    async def run():
+        init_db()
+        clicks = [await likes.add("3", "Song", "Artist"), await likes.add("3", "Song", "Artist")]
+        return clicks, await history.recent("3")
+
+    assert asyncio.run(run()) == ([True, False], [])
@@ -0,0 +1,24 @@
+import asyncio
+
+from message_updates import DebouncedEdit
+
+
+class FailingMessage:
+    id = 1
+
+    class channel:
+        id = 1
+
+    async def edit(self, **fields):
+        raise RuntimeError("gone")
+
+
+def test_failed_progress_edit_is_logged(capsys):
+    async def run():
+        editor = DebouncedEdit(FailingMessage(), interval=0)
+        editor.update(content="50%")
+        await editor.flush_task
+        return editor.flush_task.exception()
+
+    assert asyncio.run(run()) is None
+    assert "Error updating message 1: gone" in capsys.readouterr().out
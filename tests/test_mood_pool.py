@@ -0,0 +1,14 @@
+from mood_pool import BUCKET_VECTORS, FEATURE_KEYS, MoodPool, get_mood_vector, to_vector
+
+
+def test_recommended_tracks_rank_first_in_their_mood_in_spotify_order():
+    tracks = [{'title': f"sad {i}", 'artist': "A", 'vector': get_mood_vector('sad')} for i in range(3)]
+    tracks += [{'title': f"party {i}", 'artist': "B", 'vector': get_mood_vector('party')} for i in range(3)]
+    tracks.append({'title': "heard", 'artist': "C",
+                   'vector': to_vector(dict(zip(FEATURE_KEYS, BUCKET_VECTORS["😢 Sad & Mellow"])))})
+
+    pool = MoodPool(size_per_mood=4)
+    pool.rebuild(tracks)
+
+    assert [track['title'] for track in pool.pick('sad', limit=4)] == ["sad 0", "sad 1", "sad 2", "heard"]
+    assert [track['title'] for track in pool.pick('party', limit=3)] == ["party 0", "party 1", "party 2"]
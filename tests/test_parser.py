@@ -0,0 +1,21 @@
+import pytest
+
+from parser import QueryError, SearchQuery, parse_search_query
+
+
+def test_colons_in_titles_stay_text():
+    assert parse_search_query("Re: Stacks") == SearchQuery(song="Re: Stacks")
+    assert parse_search_query("Interlude: Moonlight artist:Foo") == SearchQuery(song="Interlude: Moonlight",
+                                                                                artist="Foo")
+    assert parse_search_query('ARTIST:"Bon Iver" Re: Stacks') == SearchQuery(song="Re: Stacks", artist="Bon Iver")
+
+
+def test_filters():
+    query = parse_search_query('song:"Blinding Lights" platform:yt duration:3:00-4:30 explicit:no limit:3')
+    assert query == SearchQuery(song="Blinding Lights", platform="youtube", min_duration=180,
+                                max_duration=270, explicit=False, limit=3)
+
+
+def test_unknown_platform_is_rejected():
+    with pytest.raises(QueryError):
+        parse_search_query("Hello platform:spotfy")
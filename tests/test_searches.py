@@ -0,0 +1,30 @@
+from searches import merge_results, split_video_title
+
+
+def youtube_row(video_title, channel, video_id):
+    title, artist = split_video_title(video_title, channel)
+    return {'title': title, 'artist': artist, 'youtube_id': video_id, 'source_platform': 'youtube'}
+
+
+def test_split_video_title():
+    assert split_video_title("Queen - Bohemian Rhapsody (Official Video Remastered)", "Queen Official") == \
+        ("Bohemian Rhapsody (Official Video Remastered)", "Queen")
+    assert split_video_title("The Weeknd – Blinding Lights (Official Audio)", "TheWeekndVEVO") == \
+        ("Blinding Lights (Official Audio)", "The Weeknd")
+    assert split_video_title("Don&#39;t Stop Me Now", "Queen - Topic") == ("Don't Stop Me Now", "Queen")
+
+
+def test_youtube_versions_merge_and_different_songs_stay_apart():
+    rows = merge_results([
+        {'title': "Bohemian Rhapsody", 'artist': "Queen", 'spotify_id': "sp1", 'source_platform': 'spotify'},
+        youtube_row("Queen - Bohemian Rhapsody (Official Video Remastered)", "Queen Official", "v1"),
+        youtube_row("Queen – Bohemian Rhapsody - Remastered 2011", "Queen - Topic", "v2"),
+        youtube_row("Queen - Don't Stop Me Now (Official Video)", "Queen Official", "v3"),
+        youtube_row("Queen - Somebody To Love (Official Lyric Video)", "Queen Official", "v4"),
+        youtube_row("Killer Queen (Top Of The Pops, 1974)", "Queen Official", "v5"),
+    ])
+    titles = [row['title'] for row in rows]
+    assert titles[0] == "Bohemian Rhapsody"
+    assert rows[0]['spotify_id'] == "sp1" and rows[0]['youtube_id'] in ("v1", "v2")
+    assert len(rows) == 4
+    assert {row['youtube_id'] for row in rows[1:]} == {"v3", "v4", "v5"}
@@ -0,0 +1,42 @@
+import asyncio
+import io
+import wave
+
+import numpy as np
+
+from voice_listener import LISTEN_SAMPLE_RATE, ChannelListener, SyntheticPCMSource
+
+
+def dominant_frequency(wav_bytes):
+    with wave.open(io.BytesIO(wav_bytes)) as wav:
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    spectrum = np.abs(np.fft.rfft(samples.astype(np.float32)))
+    return np.fft.rfftfreq(len(samples), 1 / LISTEN_SAMPLE_RATE)[spectrum.argmax()]
+
+
+def test_listener_identifies_the_loudest_speaker_and_song_changes():
+    heard = []
+
+    def recognizer(wav_bytes):
+        heard.append(dominant_frequency(wav_bytes))
+        return {'status': {'code': 0}}
+
+    async def run():
+        results = []
+
+        async def on_result(result):
+            results.append(result)
+
+        listener = ChannelListener(1, on_result, recognizer)
+        # Someone talking quietly over the music must not end up in the music's window
+        await SyntheticPCMSource(listener, tones=(1000.0,), user_id=2, volume=1000).play(realtime=False)
+        await SyntheticPCMSource(listener, tones=(440.0,), user_id=1).play(realtime=False)
+        await listener.check_window()
+        # Same song, nothing new to identify
+        await listener.check_window()
+        await SyntheticPCMSource(listener, tones=(2000.0,), user_id=1).play(realtime=False)
+        await listener.check_window()
+        return results
+
+    assert len(asyncio.run(run())) == 2
+    assert [round(frequency) for frequency in heard] == [440, 2000]
@@ -0,0 +1,125 @@
+from providers.apple import lookup_apple_isrcs, lookup_apple_tracks
+from repository import track_index
+
+
+PLATFORM_URLS = {
+    'spotify': "https://open.spotify.com/track/{}",
+    'youtube': "https://www.youtube.com/watch?v={}",
+    'deezer': "https://www.deezer.com/track/{}",
+}
+PLATFORM_NAMES = {
+    'spotify': "Spotify",
+    'youtube': "YouTube Music",
+    'yandex': "Yandex Music",
+    'apple': "Apple Music",
+    'deezer': "Deezer",
+}
+
+
+def platform_link(platform, platform_id, url=None):
+    return platform_id, url or PLATFORM_URLS[platform].format(platform_id)
+
+
+def links_from_acrcloud(music):
+    """Per-platform (id, url) pairs from the external_metadata of an ACRCloud match"""
+    external = music.get('external_metadata') or {}
+    links = {}
+
+    spotify_id = (external.get('spotify') or {}).get('track', {}).get('id')
+    if spotify_id:
+        links['spotify'] = platform_link('spotify', spotify_id)
+    youtube_id = (external.get('youtube') or {}).get('vid')
+    if youtube_id:
+        links['youtube'] = platform_link('youtube', youtube_id)
+    deezer_id = (external.get('deezer') or {}).get('track', {}).get('id')
+    if deezer_id:
+        links['deezer'] = platform_link('deezer', str(deezer_id))
+    return links
+
+
+def links_from_provider(provider_used, music_info):
+    """Per-platform (id, url) pairs from a search_multiple_providers match"""
+    if provider_used == "Spotify" and music_info.get('id'):
+        return {'spotify': platform_link('spotify', music_info['id'],
+                                         music_info.get('external_urls', {}).get('spotify'))}
+    if provider_used == "YouTube Music" and music_info.get('id', {}).get('videoId'):
+        return {'youtube': platform_link('youtube', music_info['id']['videoId'])}
+    if provider_used == "Yandex Music" and music_info.get('id'):
+        album_id = music_info.get('albums', [{}])[0].get('id', '')
+        return {'yandex': (str(music_info['id']),
+                           f"https://music.yandex.ru/album/{album_id}/track/{music_info['id']}")}
+    if provider_used == "Apple Music" and music_info.get('trackId'):
+        return {'apple': (str(music_info['trackId']), music_info.get('trackViewUrl'))}
+    return {}
+
+
+def links_from_result(result):
+    """Per-platform (id, url) pairs from a merged !search row"""
+    links = {}
+    if result.get('spotify_id'):
+        links['spotify'] = platform_link('spotify', result['spotify_id'], result.get('spotify_url'))
+    if result.get('youtube_id'):
+        links['youtube'] = platform_link('youtube', result['youtube_id'], result.get('youtube_url'))
+    if result.get('apple_id'):
+        links['apple'] = (result['apple_id'], result.get('apple_url'))
+    if result.get('yandex_id'):
+        links['yandex'] = (result['yandex_id'], result.get('yandex_url'))
+    return links
+
+
+def isrc_of(music):
+    return (music.get('external_ids') or {}).get('isrc')
+
+
+async def remember_track(isrc, title, artist, links):
+    if isrc and links:
+        await track_index.save_links([(isrc, title, artist, links)])
+
+
+async def remember_results(results):
+    """Index the platform links of every merged search row that carries an ISRC"""
+    tracks = [(result['isrc'], result['title'], result['artist'], links_from_result(result))
+              for result in results if result.get('isrc')]
+    tracks = [track for track in tracks if track[3]]
+    if tracks:
+        await track_index.save_links(tracks)
+
+
+async def known_track(isrc=None, title=None, artist=None):
+    """A known song as a !search row with every platform link, or None"""
+    track = await track_index.links(isrc=isrc, title=title, artist=artist)
+    if not track:
+        return None
+    row = {'title': track['title'], 'artist': track['artist'], 'isrc': track['isrc'],
+           'platforms': sorted(track['links'], key=list(PLATFORM_NAMES).index), 'source_platform': 'index'}
+    for platform, (platform_id, url) in track['links'].items():
+        row[f"{platform}_id"] = platform_id
+        row[f"{platform}_url"] = url
+    return row
+
+
+async def add_apple_links(rows):
+    """Set apple_url and apple_id on the rows whose ISRC Apple Music has, in place
+
+    Songs with a known Apple id are refreshed in one batched lookup; the rest are matched
+    by ISRC and their ids remembered, so the next lookup batches them too.
+    """
+    isrcs = [row['isrc'] for row in rows if row.get('isrc') and not row.get('apple_url')]
+    known_ids = await track_index.platform_ids(isrcs, 'apple')
+    by_id = await lookup_apple_tracks(known_ids.values()) if known_ids else {}
+    tracks = {isrc: by_id[track_id] for isrc, track_id in known_ids.items() if track_id in by_id}
+    found = await lookup_apple_isrcs([isrc for isrc in isrcs if isrc not in tracks])
+    tracks.update(found)
+
+    learned = []
+    for row in rows:
+        track = tracks.get(row.get('isrc'))
+        if track and not row.get('apple_url'):
+            row['apple_url'] = track.get('trackViewUrl', '')
+            row['apple_id'] = str(track.get('trackId'))
+            if row['isrc'] in found:
+                learned.append((row['isrc'], row['title'], row['artist'],
+                                {'apple': (row['apple_id'], row['apple_url'])}))
+    if learned:
+        await track_index.save_links(learned)
+    return rows
@@ -0,0 +1,161 @@
+import asyncio
+
+import discord
+import numpy as np
+import soundfile as sf
+
+from audio_recognition import recognize_audio
+from utils import format_duration
+from voice_listener import encode_wav
+
+
+SAMPLE_SECONDS = 12
+STEP_SECONDS = 30
+MAX_CONCURRENT_IDENTIFICATIONS = 4
+TRACKS_PER_PAGE = 10
+
+
+def parse_recognition(result):
+    """Get (title, artist) from an ACRCloud response, or None when nothing matched"""
+    if result.get('status', {}).get('code') != 0:
+        return None
+    music = result['metadata']['music'][0]
+    return music['title'], music['artists'][0]['name']
+
+
+def read_window(path, offset_seconds, seconds=SAMPLE_SECONDS):
+    """Decode only one window of a long file and encode it as a mono WAV sample"""
+    with sf.SoundFile(path) as audio_file:
+        audio_file.seek(int(offset_seconds * audio_file.samplerate))
+        frames = audio_file.read(int(seconds * audio_file.samplerate), dtype='int16', always_2d=True)
+        samplerate = audio_file.samplerate
+    return encode_wav(frames.mean(axis=1).astype(np.int16), samplerate)
+
+
+async def identify_mix(path, sample_seconds=SAMPLE_SECONDS, step_seconds=STEP_SECONDS,
+                       concurrency=MAX_CONCURRENT_IDENTIFICATIONS):
+    """Identify evenly spaced windows of a long mix, at most `concurrency` at a time"""
+    duration = sf.info(path).duration
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def identify_at(offset):
+        async with semaphore:
+            try:
+                sample = await loop.run_in_executor(None, read_window, path, offset, sample_seconds)
+                result = await loop.run_in_executor(None, recognize_audio, sample)
+                return offset, parse_recognition(result)
+            except Exception as e:
+                print(f"Error identifying window at {offset}s: {e}")
+                return offset, None
+
+    offsets = range(0, max(int(duration - sample_seconds), 0) + 1, step_seconds)
+    windows = await asyncio.gather(*(identify_at(offset) for offset in offsets))
+    return merge_windows(windows, step_seconds)
+
+
+async def identify_files(buffers, concurrency=MAX_CONCURRENT_IDENTIFICATIONS):
+    """Identify several attachments at once, returning (filename, song) pairs in order"""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def identify_one(filename, audio):
+        async with semaphore:
+            try:
+                result = await loop.run_in_executor(None, recognize_audio, audio.view)
+                return filename, parse_recognition(result)
+            except Exception as e:
+                print(f"Error identifying {filename}: {e}")
+                return filename, None
+
+    return await asyncio.gather(*(identify_one(filename, audio) for filename, audio in buffers))
+
+
+def merge_windows(windows, step_seconds=STEP_SECONDS):
+    """Merge adjacent windows with the same song into time ranges and drop repeats
+
+    A single unmatched window inside a song doesn't split it.
+    """
+    ranges = []
+    for offset, song in sorted(windows, key=lambda window: window[0]):
+        if song is None:
+            continue
+        last = ranges[-1] if ranges else None
+        if last and last['song'] == song and offset - last['end'] <= step_seconds * 2:
+            last['end'] = offset
+        else:
+            ranges.append({'song': song, 'start': offset, 'end': offset})
+
+    tracklist = []
+    seen = set()
+    for song_range in ranges:
+        if song_range['song'] in seen:
+            continue
+        seen.add(song_range['song'])
+        tracklist.append(song_range)
+    return tracklist
+
+
+def build_tracklist_pages(lines, title):
+    """Split tracklist lines into embeds of TRACKS_PER_PAGE entries"""
+    chunks = [lines[i:i + TRACKS_PER_PAGE] for i in range(0, len(lines), TRACKS_PER_PAGE)] or [[]]
+    pages = []
+    for page, chunk in enumerate(chunks, 1):
+        embed = discord.Embed(
+            title=title,
+            description="\n".join(chunk) or "❌ No songs identified",
+            color=0x1DB954
+        )
+        embed.set_footer(text=f"Page {page}/{len(chunks)} • {len(lines)} tracks")
+        pages.append(embed)
+    return pages
+
+
+def format_mix_tracklist(tracklist):
+    return [
+        f"`{format_duration(item['start'] * 1000)}–{format_duration((item['end'] + SAMPLE_SECONDS) * 1000)}` "
+        f"**{item['song'][0]}** by {item['song'][1]}"
+        for item in tracklist
+    ]
+
+
+def format_file_tracklist(results):
+    return [
+        f"`{filename}` **{song[0]}** by {song[1]}" if song else f"`{filename}` ❌ Not identified"
+        for filename, song in results
+    ]
+
+
+class TracklistView(discord.ui.View):
+    """Previous/next buttons for a multi-page tracklist"""
+
+    name = 'tracklist'
+
+    def __init__(self, pages, author_id):
+        super().__init__(timeout=600)
+        # Pages come back from the delivery outbox as embed dicts
+        self.pages = [discord.Embed.from_dict(page) if isinstance(page, dict) else page for page in pages]
+        self.author_id = author_id
+        self.args = [[page.to_dict() for page in self.pages], author_id]
+        self.page = 0
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page == len(self.pages) - 1
+
+    async def interaction_check(self, interaction):
+        return interaction.user.id == self.author_id
+
+    async def show_page(self, interaction, page):
+        self.page = page
+        self.update_buttons()
+        await interaction.response.edit_message(embed=self.pages[page], view=self)
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction, button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction, button):
+        await self.show_page(interaction, self.page + 1)
@@ -1,3 +1,5 @@
+from audio_features import classify_mood
+
 
 def get_provider_color(provider):
     """Get embed color based on music provider"""
@@ -39,7 +41,10 @@ def format_duration(duration_ms):
 
 # Helper functions
 def get_mood_from_features(features):
-    """Determine mood from Spotify audio features"""
+    """Determine mood from Spotify audio features or locally extracted clip features"""
+    if 'tempo' in features and 'valence' not in features:
+        return classify_mood(features)
+
     valence = features.get('valence', 0.5)
     #energy = features.get('energy', 0.5)
     #danceability = features.get('danceability', 0.5)
@@ -0,0 +1,169 @@
+import discord
+
+from repository import HistoryEntry, history, likes, playlists, shares, track_index
+from recomendations import generate_smart_recommendations
+from suggestions import suggestions
+from tracklist import TracklistView
+
+
+# Discord shows at most 25 options in a select menu
+MAX_SELECT_OPTIONS = 25
+
+
+def build_recommendations_embed(recommendations, mood_or_genre=None):
+    embed = discord.Embed(
+        title="🎯 Personalized Recommendations",
+        description=f"Based on your music taste" + (f" and '{mood_or_genre}' mood" if mood_or_genre else ""),
+        color=0xFF6B6B
+    )
+
+    for i, rec in enumerate(recommendations[:5], 1):
+        embed.add_field(
+            name=f"{i}. {rec['title']} - {rec['artist']}",
+            value=f"Match: {rec['match_score']}% | [Listen]({rec['spotify_url']})" +
+                  (f" | [Apple Music]({rec['apple_url']})" if rec.get('apple_url') else ""),
+            inline=False
+        )
+    return embed
+
+
+async def like_track(interaction, track):
+    if not await likes.add(interaction.user.id, track['title'], track['artist'], track['spotify_url']):
+        await interaction.response.send_message(f"❤️ You already liked **{track['title']}**.", ephemeral=True)
+        return
+    suggestions.add_track(interaction.user.id, track['title'], track['artist'])
+    await interaction.response.send_message(f"❤️ Added **{track['title']}** to your likes!", ephemeral=True)
+
+
+async def save_track(interaction, track):
+    server_playlists = await playlists.for_server(interaction.guild_id) if interaction.guild_id else []
+    if not server_playlists:
+        await interaction.response.send_message("🎵 No playlists yet. Create one with `/playlist create <name>`",
+                                                ephemeral=True)
+        return
+    await interaction.response.send_message(f"💾 Save **{track['title']}** to which playlist?",
+                                            view=PlaylistPicker(track, server_playlists), ephemeral=True)
+
+
+async def recommend_track(interaction, track):
+    # Recommendations call Spotify and can outlast the 3 second interaction deadline
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    recent = [HistoryEntry(track['title'], track['artist'])] + await history.recent(interaction.user.id)
+    recommendations = await generate_smart_recommendations(recent)
+    if not recommendations:
+        await interaction.followup.send("❌ Couldn't find recommendations right now.", ephemeral=True)
+        return
+    await interaction.followup.send(embed=build_recommendations_embed(recommendations), ephemeral=True)
+
+
+TRACK_ACTIONS = {
+    'like': ("❤️", "Like", like_track),
+    'save': ("💾", "Save", save_track),
+    'recommend': ("🔄", "Similar", recommend_track),
+}
+
+
+class TrackButton(discord.ui.DynamicItem[discord.ui.Button],
+                  template=r'track:(?P<action>like|save|recommend):(?P<track_id>[0-9]+)'):
+    """A like / save / recommend button whose custom ID carries the indexed track id
+
+    Registered with bot.add_dynamic_items, so clicks on messages from earlier runs go
+    straight to the action without looking at the message.
+    """
+
+    def __init__(self, action, track_id):
+        emoji, label, _ = TRACK_ACTIONS[action]
+        super().__init__(discord.ui.Button(emoji=emoji, label=label, style=discord.ButtonStyle.secondary,
+                                           custom_id=f"track:{action}:{track_id}"))
+        self.action = action
+        self.track_id = track_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match['action'], int(match['track_id']))
+
+    async def callback(self, interaction):
+        track = await track_index.get(self.track_id)
+        if not track:
+            await interaction.response.send_message("❌ This song is no longer available.", ephemeral=True)
+            return
+        await TRACK_ACTIONS[self.action][2](interaction, track)
+
+
+class ShareLikeButton(discord.ui.DynamicItem[discord.ui.Button], template=r'share:like:(?P<share_id>[0-9_]+)'):
+    """Like button under a !share, counting likes on the share it names"""
+
+    def __init__(self, share_id):
+        super().__init__(discord.ui.Button(emoji="❤️", label="Like", style=discord.ButtonStyle.secondary,
+                                           custom_id=f"share:like:{share_id}"))
+        self.share_id = share_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match['share_id'])
+
+    async def callback(self, interaction):
+        if not await shares.like(self.share_id, interaction.user.id):
+            await interaction.response.send_message("❤️ You already liked this share.", ephemeral=True)
+            return
+        await interaction.response.send_message("❤️ Liked!", ephemeral=True)
+
+
+class TrackActions(discord.ui.View):
+    """Like / save / similar buttons under an identified song, sent in the same edit as the result"""
+
+    name = 'track_actions'
+
+    def __init__(self, track_id):
+        super().__init__(timeout=None)
+        self.args = [track_id]
+        for action in TRACK_ACTIONS:
+            self.add_item(TrackButton(action, track_id))
+
+
+class ShareActions(discord.ui.View):
+    name = 'share_actions'
+
+    def __init__(self, share_id):
+        super().__init__(timeout=None)
+        self.args = [share_id]
+        self.add_item(ShareLikeButton(share_id))
+
+
+class PlaylistPicker(discord.ui.View):
+    """Ephemeral menu of the server's playlists for the save button"""
+
+    def __init__(self, track, server_playlists):
+        super().__init__(timeout=120)
+        self.track = track
+        select = discord.ui.Select(placeholder="Choose a playlist", options=[
+            discord.SelectOption(label=playlist.name[:100], value=playlist.playlist_id)
+            for playlist in server_playlists[:MAX_SELECT_OPTIONS]])
+        select.callback = self.pick
+        self.add_item(select)
+
+    async def pick(self, interaction):
+        playlist_id = interaction.data['values'][0]
+        song = {'title': self.track['title'], 'artist': self.track['artist'],
+                'album': self.track['album'], 'spotify_url': self.track['spotify_url']}
+        name = await playlists.add_song(playlist_id, interaction.user.id, song)
+        if name is None:
+            await interaction.response.edit_message(content="❌ That playlist no longer exists.", view=None)
+            return
+        suggestions.add_popular(self.track['title'], self.track['artist'])
+        await interaction.response.edit_message(content=f"💾 Saved **{self.track['title']}** to **{name}**!",
+                                                view=None)
+
+
+VIEWS = {view.name: view for view in [TrackActions, ShareActions, TracklistView]}
+
+
+def restore_view(state):
+    """Rebuild a view saved in the delivery outbox as [name, *args]"""
+    view = VIEWS.get(state[0])
+    return view(*state[1:]) if view else None
+
+
+def register_views(bot):
+    """Route button clicks on messages from earlier runs by their custom IDs"""
+    bot.add_dynamic_items(TrackButton, ShareLikeButton)
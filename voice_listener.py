@@ -0,0 +1,220 @@
+import asyncio
+import io
+import threading
+import time
+import wave
+
+import numpy as np
+
+from audio_recognition import recognize_audio
+
+
+# Discord voice delivers 48kHz stereo 16-bit PCM; we keep mono 16kHz for identification
+DISCORD_SAMPLE_RATE = 48000
+DISCORD_CHANNELS = 2
+LISTEN_SAMPLE_RATE = 16000
+WINDOW_SECONDS = 10
+HOP_SECONDS = 5
+FINGERPRINT_BANDS = 16
+FINGERPRINT_CHANGE_THRESHOLD = 0.1
+SILENCE_RMS = 100
+MAX_LISTENING_CHANNELS = 50
+
+
+class PCMRingBuffer:
+    """Fixed-size ring of mono 16-bit samples, safe to write from the voice thread"""
+
+    def __init__(self, seconds=WINDOW_SECONDS, sample_rate=LISTEN_SAMPLE_RATE):
+        self.samples = np.zeros(seconds * sample_rate, dtype=np.int16)
+        self.position = 0
+        self.filled = 0
+        self.last_write = 0.0
+        self.lock = threading.Lock()
+
+    def write(self, samples):
+        with self.lock:
+            size = len(self.samples)
+            samples = samples[-size:]
+            end = self.position + len(samples)
+            if end <= size:
+                self.samples[self.position:end] = samples
+            else:
+                split = size - self.position
+                self.samples[self.position:] = samples[:split]
+                self.samples[:end - size] = samples[split:]
+            self.position = end % size
+            self.filled = min(size, self.filled + len(samples))
+            self.last_write = time.monotonic()
+
+    def read(self):
+        """Get the buffered samples in chronological order"""
+        with self.lock:
+            if self.filled < len(self.samples):
+                return self.samples[:self.filled].copy()
+            return np.concatenate((self.samples[self.position:], self.samples[:self.position]))
+
+
+def downmix_pcm(pcm):
+    """Convert Discord 48kHz stereo PCM bytes to 16kHz mono samples"""
+    frames = np.frombuffer(pcm, dtype=np.int16).reshape(-1, DISCORD_CHANNELS)
+    mono = frames.mean(axis=1)
+    step = DISCORD_SAMPLE_RATE // LISTEN_SAMPLE_RATE
+    usable = len(mono) - len(mono) % step
+    return mono[:usable].reshape(-1, step).mean(axis=1).astype(np.int16)
+
+
+def rms(samples):
+    return float(np.sqrt(np.mean(samples.astype(np.float32) ** 2))) if len(samples) else 0.0
+
+
+def get_fingerprint(samples, sample_rate=LISTEN_SAMPLE_RATE):
+    """Cheap spectral fingerprint: normalized log energy in log-spaced bands"""
+    spectrum = np.abs(np.fft.rfft(samples.astype(np.float32)))
+    freqs = np.fft.rfftfreq(len(samples), 1 / sample_rate)
+    edges = np.geomspace(200, 4000, FINGERPRINT_BANDS + 1)
+    bands = np.array([
+        spectrum[(freqs >= low) & (freqs < high)].sum()
+        for low, high in zip(edges[:-1], edges[1:])
+    ])
+    fingerprint = np.log1p(bands)
+    norm = np.linalg.norm(fingerprint)
+    return fingerprint / norm if norm else fingerprint
+
+
+def fingerprint_distance(a, b):
+    """Cosine distance between two fingerprints"""
+    if a is None or b is None:
+        return 1.0
+    return float(1 - np.dot(a, b))
+
+
+def encode_wav(samples, sample_rate=LISTEN_SAMPLE_RATE):
+    """Wrap mono 16-bit samples into a WAV file for ACRCloud"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+class ChannelListener:
+    """Buffers one voice channel and identifies it whenever the audio changes
+
+    Discord delivers each speaker's audio separately, so every user gets their own buffer;
+    appending them all to one would splice unrelated frames together. The loudest speaker
+    still sending audio is the one identified, usually the music bot or whoever plays music.
+    """
+
+    def __init__(self, channel_id, on_result, recognizer=recognize_audio):
+        self.channel_id = channel_id
+        self.on_result = on_result
+        self.recognizer = recognizer
+        self.buffers = {}
+        self.buffers_lock = threading.Lock()
+        self.last_fingerprint = None
+        self.task = None
+
+    def feed(self, pcm, user_id=None):
+        """Called from the voice receive thread with one speaker's raw Discord PCM"""
+        buffer = self.buffers.get(user_id)
+        if buffer is None:
+            with self.buffers_lock:
+                buffer = self.buffers.setdefault(user_id, PCMRingBuffer())
+        buffer.write(downmix_pcm(pcm))
+
+    def loudest_window(self):
+        """Samples of the loudest speaker heard in the last hop with at least half a window buffered"""
+        now = time.monotonic()
+        with self.buffers_lock:
+            buffers = list(self.buffers.values())
+        windows = [buffer.read() for buffer in buffers if now - buffer.last_write < HOP_SECONDS]
+        windows = [samples for samples in windows if len(samples) >= WINDOW_SECONDS * LISTEN_SAMPLE_RATE // 2]
+        return max(windows, key=rms, default=None)
+
+    async def check_window(self):
+        """Identify the current window if it differs enough from the last identified one"""
+        samples = self.loudest_window()
+        if samples is None or rms(samples) < SILENCE_RMS:
+            return None
+
+        fingerprint = get_fingerprint(samples)
+        if fingerprint_distance(fingerprint, self.last_fingerprint) < FINGERPRINT_CHANGE_THRESHOLD:
+            return None
+        self.last_fingerprint = fingerprint
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, self.recognizer, encode_wav(samples))
+        await self.on_result(result)
+        return result
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(HOP_SECONDS)
+            try:
+                await self.check_window()
+            except Exception as e:
+                print(f"Error identifying voice channel {self.channel_id}: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+
+class ListenerManager:
+    """Tracks active channel listeners and caps how many run at once"""
+
+    def __init__(self, max_channels=MAX_LISTENING_CHANNELS):
+        self.max_channels = max_channels
+        self.listeners = {}
+
+    def start(self, channel_id, on_result, recognizer=recognize_audio):
+        if channel_id in self.listeners:
+            return self.listeners[channel_id]
+        if len(self.listeners) >= self.max_channels:
+            return None
+        listener = ChannelListener(channel_id, on_result, recognizer)
+        listener.start()
+        self.listeners[channel_id] = listener
+        return listener
+
+    def stop(self, channel_id):
+        listener = self.listeners.pop(channel_id, None)
+        if listener:
+            listener.stop()
+        return listener
+
+
+class SyntheticPCMSource:
+    """Stand-in for Discord voice: pushes 20ms stereo 48kHz tone frames into a listener"""
+
+    FRAME_SAMPLES = DISCORD_SAMPLE_RATE // 50
+
+    def __init__(self, listener, tones=(440.0,), seconds_per_tone=10, user_id=None, volume=8000):
+        self.listener = listener
+        self.tones = tones
+        self.seconds_per_tone = seconds_per_tone
+        self.user_id = user_id
+        self.volume = volume
+
+    def frames(self):
+        t = 0
+        for tone in self.tones:
+            for _ in range(self.seconds_per_tone * 50):
+                times = (t + np.arange(self.FRAME_SAMPLES)) / DISCORD_SAMPLE_RATE
+                tone_wave = (np.sin(2 * np.pi * tone * times) * self.volume).astype(np.int16)
+                t += self.FRAME_SAMPLES
+                yield np.repeat(tone_wave, DISCORD_CHANNELS).tobytes()
+
+    async def play(self, realtime=True):
+        for frame in self.frames():
+            self.listener.feed(frame, self.user_id)
+            if realtime:
+                await asyncio.sleep(0.02)
+
+
+voice_listeners = ListenerManager()